@@ -0,0 +1,69 @@
+"""
+Overhead of the metrics instrumentation.
+
+Measures the raw cost of the metric primitives and the per-request cost MetricsMiddleware adds
+to a trivial ASGI route, so the instrumentation can be compared with real route latencies.
+
+    python -m benchmarks.bench_metrics --requests 20000
+"""
+import argparse
+import asyncio
+import time
+
+from fastapi import FastAPI
+
+from src.services import metrics
+
+
+def per_call(fn, n: int) -> float:
+    start = time.perf_counter()
+    for _ in range(n):
+        fn()
+    return (time.perf_counter() - start) / n * 1e6
+
+
+async def drive(app, n: int) -> float:
+    scope = {"type": "http", "method": "GET", "path": "/ping", "raw_path": b"/ping", "root_path": "",
+             "query_string": b"", "headers": [], "client": ("127.0.0.1", 5000), "server": ("test", 80),
+             "scheme": "http", "http_version": "1.1"}
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        pass
+
+    start = time.perf_counter()
+    for _ in range(n):
+        await app(dict(scope), receive, send)
+    return (time.perf_counter() - start) / n * 1e6
+
+
+def make_app(instrumented: bool) -> FastAPI:
+    app = FastAPI()
+    if instrumented:
+        app.add_middleware(metrics.MetricsMiddleware)
+
+    @app.get("/ping")
+    async def ping():
+        return {}
+    return app
+
+
+async def main(args):
+    counter = metrics.Counter("bench_counter", "benchmark", ("label",))
+    histogram = metrics.Histogram("bench_histogram", "benchmark", ("label",))
+    print(f"counter.labels().inc():     {per_call(lambda: counter.labels('x').inc(), args.requests):6.2f} us")
+    print(f"histogram.labels().observe: {per_call(lambda: histogram.labels('x').observe(0.01), args.requests):6.2f} us")
+    print(f"render() with {len(metrics.REGISTRY)} metrics:    {per_call(metrics.render, 100):6.2f} us")
+
+    plain = await drive(make_app(False), args.requests)
+    instrumented = await drive(make_app(True), args.requests)
+    print(f"request without middleware: {plain:6.2f} us")
+    print(f"request with middleware:    {instrumented:6.2f} us (+{instrumented - plain:.2f} us)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=20000)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,67 @@
+"""
+Admission overhead of fastapi_limiter's RateLimiter against HybridRateLimiter.
+
+Both limiters run against the in-process Redis stand-in with a simulated round-trip latency,
+so the numbers show the cost a request pays before the route does any work.
+
+    python -m benchmarks.bench_rate_limiter --requests 20000 --latency 0.0005
+"""
+import argparse
+import asyncio
+import time
+
+from fastapi import FastAPI
+from fastapi_limiter import FastAPILimiter
+from fastapi_limiter.depends import RateLimiter
+from starlette.requests import Request
+from starlette.responses import Response
+
+from benchmarks.stubs import AsyncLocalRedis
+from src.services.limiter import HybridRateLimiter
+
+
+def make_request(app: FastAPI, client: str, path: str = "/api/clients/") -> Request:
+    scope = {
+        "type": "http", "method": "GET", "path": path, "headers": [], "query_string": b"",
+        "client": (client, 50000), "app": app,
+    }
+    return Request(scope)
+
+
+async def run(limiter, requests: list[Request]) -> tuple[float, int]:
+    rejected = 0
+    start = time.perf_counter()
+    for request in requests:
+        try:
+            await limiter(request, Response())
+        except Exception:
+            rejected += 1
+    return time.perf_counter() - start, rejected
+
+
+async def main(args):
+    app = FastAPI()
+    requests = [make_request(app, f"10.0.0.{i % args.clients}") for i in range(args.requests)]
+    print(f"{args.requests} requests from {args.clients} clients, limit {args.times}/{args.seconds}s, "
+          f"redis latency {args.latency * 1000:.2f} ms")
+    for name, limiter in (("RateLimiter", RateLimiter(times=args.times, seconds=args.seconds)),
+                          ("HybridRateLimiter", HybridRateLimiter(times=args.times, seconds=args.seconds,
+                                                                  lease=args.lease))):
+        redis = AsyncLocalRedis(latency=args.latency)
+        await FastAPILimiter.init(redis)
+        HybridRateLimiter.reset()
+        HybridRateLimiter.lease_sha = None
+        elapsed, rejected = await run(limiter, requests)
+        print(f"{name:>18}: {elapsed / args.requests * 1e6:8.1f} us/request, "
+              f"{redis.store.calls:6d} redis calls, {rejected:6d} rejected")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument("--times", type=int, default=200)
+    parser.add_argument("--seconds", type=int, default=60)
+    parser.add_argument("--lease", type=int, default=None)
+    parser.add_argument("--latency", type=float, default=0.0005, help="simulated redis round trip, seconds")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,105 @@
+"""
+Worker cold start and import cost.
+
+Starts fresh interpreters that import ``main`` and run the application lifespan, and reports
+the median import, lifespan startup and shutdown times next to a bare interpreter start.
+With --importtime the slowest top-level packages from ``python -X importtime`` are listed, and
+with --collect the time of ``pytest --collect-only`` is measured as well.
+
+    python -m benchmarks.bench_startup --runs 10 --importtime --collect
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+LAZY_MODULES = ("cloudinary", "fastapi_mail", "passlib", "jinja2")
+
+CHILD = """
+import json, sys, time, asyncio
+start = time.perf_counter()
+import main
+imported = time.perf_counter()
+
+async def lifespan():
+    global started
+    async with main.lifespan(main.app):
+        started = time.perf_counter()
+
+asyncio.run(lifespan())
+stopped = time.perf_counter()
+print(json.dumps({"import": imported - start, "startup": started - imported, "shutdown": stopped - started,
+                  "loaded": [name for name in %r if name in sys.modules]}))
+""" % (LAZY_MODULES,)
+
+
+def run(code: str) -> tuple[float, str]:
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True)
+    return time.perf_counter() - start, result.stdout
+
+
+def import_profile(top: int) -> list[tuple[str, float]]:
+    """
+    The import_profile function returns the top-level packages with the largest cumulative import time.
+
+    :param top: int: Number of packages to return
+    :return: A list of (package, milliseconds)
+    """
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import main"], cwd=ROOT,
+                            capture_output=True, text=True, check=True)
+    totals = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if not cumulative.strip().isdigit():
+            continue
+        package = name.strip().split(".")[0]
+        totals[package] = max(totals.get(package, 0), int(cumulative) / 1000)
+    totals.pop("main", None)
+    return sorted(totals.items(), key=lambda item: item[1], reverse=True)[:top]
+
+
+def main(args):
+    bare = [run("pass")[0] for _ in range(args.runs)]
+    samples = []
+    for _ in range(args.runs):
+        wall, output = run(CHILD)
+        sample = json.loads(output.strip().splitlines()[-1])
+        sample["wall"] = wall
+        samples.append(sample)
+
+    def median(key):
+        return statistics.median(sample[key] for sample in samples) * 1000
+
+    print(f"interpreter start  {statistics.median(bare) * 1000:8.1f} ms")
+    print(f"import main        {median('import'):8.1f} ms")
+    print(f"lifespan startup   {median('startup'):8.1f} ms")
+    print(f"lifespan shutdown  {median('shutdown'):8.1f} ms")
+    print(f"cold start (wall)  {median('wall'):8.1f} ms")
+    print(f"lazy modules loaded at startup: {', '.join(samples[0]['loaded']) or 'none'}")
+
+    if args.importtime:
+        print("slowest packages (cumulative import time):")
+        for package, milliseconds in import_profile(args.top):
+            print(f"  {package:<24}{milliseconds:8.1f} ms")
+
+    if args.collect:
+        collect = [run("import pytest, sys; sys.exit(pytest.main(['--collect-only', '-q', 'tests']))")[0]
+                   for _ in range(max(1, args.runs // 3))]
+        print(f"pytest collection  {statistics.median(collect) * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--importtime", action="store_true", help="list the slowest imported packages")
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--collect", action="store_true", help="also time pytest test collection")
+    main(parser.parse_args())
@@ -0,0 +1,285 @@
+"""
+In-process stand-ins for the external services the app talks to, used by the benchmarks.
+
+``LocalRedis`` implements the small subset of Redis commands the app uses (strings, sorted sets,
+publishing, streams and pipelines), including the rate-limiter and autocomplete Lua scripts
+(re-implemented in Python and dispatched by script SHA).
+``AsyncLocalRedis`` wraps the same store with an optional simulated network latency.
+"""
+import asyncio
+import hashlib
+import time
+
+from fastapi_limiter import FastAPILimiter
+from redis.exceptions import NoScriptError
+
+from src.services import autocomplete
+from src.services.limiter import HybridRateLimiter
+
+
+class LocalRedis:
+    def __init__(self):
+        self.data = {}
+        self.expires = {}
+        self.scripts = {}
+        self.calls = 0
+
+    def _alive(self, key):
+        expire = self.expires.get(key)
+        if expire is not None and expire <= time.monotonic():
+            self.data.pop(key, None)
+            self.expires.pop(key, None)
+        return key in self.data
+
+    def get(self, key):
+        self.calls += 1
+        return self.data.get(key) if self._alive(key) else None
+
+    def set(self, key, value, ex=None, px=None, nx=False):
+        self.calls += 1
+        if nx and self._alive(key):
+            return None
+        return self._set(key, value, ex, px)
+
+    def exists(self, *keys):
+        self.calls += 1
+        return sum(self._alive(key) for key in keys)
+
+    def rename(self, source, target):
+        self.calls += 1
+        self.data[target] = self.data.pop(source)
+        self.expires.pop(target, None)
+        return True
+
+    def _set(self, key, value, ex=None, px=None):
+        self.data[key] = value
+        self.expires.pop(key, None)
+        if ex is not None:
+            self.expires[key] = time.monotonic() + ex
+        if px is not None:
+            self.expires[key] = time.monotonic() + px / 1000
+        return True
+
+    def expire(self, key, seconds):
+        self.calls += 1
+        if not self._alive(key):
+            return False
+        self.expires[key] = time.monotonic() + seconds
+        return True
+
+    def delete(self, *keys):
+        self.calls += 1
+        return sum(self.data.pop(key, None) is not None for key in keys)
+
+    def incrby(self, key, amount=1):
+        self.calls += 1
+        value = int(self.data.get(key, 0) if self._alive(key) else 0) + amount
+        self.data[key] = value
+        return value
+
+    def zadd(self, key, mapping):
+        self.calls += 1
+        self._alive(key)
+        members = self.data.setdefault(key, {})
+        for member, score in mapping.items():
+            members[_bytes(member)] = float(score)
+        return len(mapping)
+
+    def _ranked(self, key) -> list:
+        members = self.data.get(key, {}) if self._alive(key) else {}
+        return sorted(members, key=lambda member: (members[member], member))
+
+    def zremrangebyrank(self, key, start, end):
+        self.calls += 1
+        ranked = self._ranked(key)
+        removed = ranked[start:len(ranked) + end + 1 if end < 0 else end + 1]
+        for member in removed:
+            del self.data[key][member]
+        return len(removed)
+
+    def zrevrange(self, key, start, end):
+        self.calls += 1
+        ranked = self._ranked(key)[::-1]
+        return ranked[start:len(ranked) + end + 1 if end < 0 else end + 1]
+
+    def incr(self, key):
+        return self.incrby(key, 1)
+
+    def zrem(self, key, *members):
+        self.calls += 1
+        members_of_key = self.data.get(key, {}) if self._alive(key) else {}
+        return sum(members_of_key.pop(_bytes(member), None) is not None for member in members)
+
+    def zrangebylex(self, key, low, high, start=None, num=None):
+        self.calls += 1
+        # the app sorts members by bytes with equal scores and passes inclusive "[" bounds
+        low, high = _bytes(low)[1:], _bytes(high)[1:]
+        members = sorted(member for member in (self.data.get(key, {}) if self._alive(key) else {})
+                         if low <= member <= high)
+        return members[start:start + num] if num is not None else members
+
+    def publish(self, channel, message):
+        self.calls += 1
+        return 0
+
+    def xadd(self, key, fields):
+        self.calls += 1
+        stream = self.data.setdefault(key, [])
+        message_id = f"{len(stream) + 1}-0".encode()
+        stream.append((message_id, {_bytes(name): _bytes(value) for name, value in fields.items()}))
+        return message_id
+
+    def xgroup_create(self, key, group, id="0", mkstream=False):
+        self.calls += 1
+        self.data.setdefault(key, [])
+        self.data.setdefault(f"{key}:groups", {}).setdefault(group, set())
+        return True
+
+    def xautoclaim(self, key, group, consumer, min_idle_time, start_id="0-0", count=None):
+        self.calls += 1
+        return [b"0-0", [], []]
+
+    def xreadgroup(self, group, consumer, streams, count=None):
+        self.calls += 1
+        result = []
+        for key in streams:
+            delivered = self.data.setdefault(f"{key}:groups", {}).setdefault(group, set())
+            new = [entry for entry in self.data.get(key, []) if entry[0] not in delivered][:count]
+            delivered.update(message_id for message_id, _ in new)
+            if new:
+                result.append([_bytes(key), new])
+        return result
+
+    def xack(self, key, group, *ids):
+        self.calls += 1
+        return len(ids)
+
+    def xdel(self, key, *ids):
+        self.calls += 1
+        stream = self.data.get(key, [])
+        self.data[key] = [entry for entry in stream if entry[0] not in ids]
+        return len(stream) - len(self.data[key])
+
+    def pipeline(self, transaction=True):
+        return LocalPipeline(self)
+
+    def pttl(self, key):
+        if not self._alive(key):
+            return -2
+        expire = self.expires.get(key)
+        return -1 if expire is None else int((expire - time.monotonic()) * 1000)
+
+    def script_load(self, script):
+        sha = hashlib.sha1(script.encode()).hexdigest()
+        self.scripts[sha] = SCRIPTS[script]
+        return sha
+
+    def evalsha(self, sha, numkeys, *args):
+        self.calls += 1
+        if sha not in self.scripts:
+            raise NoScriptError("NOSCRIPT No matching script")
+        return self.scripts[sha](self, list(args[:numkeys]), list(args[numkeys:]))
+
+    def register_script(self, script):
+        sha = self.script_load(script)
+        return lambda keys=(), args=(): self.evalsha(sha, len(keys), *keys, *args)
+
+    def ping(self):
+        return True
+
+    def close(self):
+        pass
+
+
+class LocalPipeline:
+    """Queues commands of LocalRedis and runs them on execute, like a redis-py pipeline."""
+
+    def __init__(self, store: LocalRedis):
+        self.store = store
+        self.commands = []
+
+    def __getattr__(self, name):
+        method = getattr(self.store, name)
+
+        def queue(*args, **kwargs):
+            self.commands.append((method, args, kwargs))
+            return self
+        return queue
+
+    def execute(self):
+        commands, self.commands = self.commands, []
+        return [method(*args, **kwargs) for method, args, kwargs in commands]
+
+
+class AsyncLocalRedis:
+    def __init__(self, store: LocalRedis = None, latency: float = 0.0):
+        self.store = store or LocalRedis()
+        self.latency = latency
+
+    def __getattr__(self, name):
+        method = getattr(self.store, name)
+
+        async def call(*args, **kwargs):
+            if self.latency:
+                await asyncio.sleep(self.latency)
+            return method(*args, **kwargs)
+        return call
+
+    async def close(self):
+        pass
+
+
+def _bytes(value) -> bytes:
+    return value if isinstance(value, bytes) else str(value).encode()
+
+
+def _fixed_window(r, keys, args):
+    key, limit, window = keys[0], int(args[0]), int(args[1])
+    current = int(r.data[key]) if r._alive(key) else 0
+    if current > 0:
+        if current + 1 > limit:
+            return r.pttl(key)
+        r.data[key] = current + 1
+        return 0
+    r._set(key, 1, px=window)
+    return 0
+
+
+def _lease(r, keys, args):
+    key, limit, window, want, need = keys[0], int(args[0]), int(args[1]), int(args[2]), int(args[3])
+    used = int(r.data[key]) if r._alive(key) else 0
+    available = limit - used
+    ttl = max(r.pttl(key), 1) if used > 0 else window
+    if available < need:
+        return [0, ttl, available]
+    granted = min(want, available)
+    if used > 0:
+        r.data[key] = used + granted
+    else:
+        r._set(key, granted, px=window)
+    return [granted, ttl, available - granted]
+
+
+def _autocomplete_write(r, keys, args):
+    for key in keys[:1] + (keys[2:] if r._alive(keys[1]) else []):
+        if args[0] == "ZADD":
+            r.zadd(key, dict.fromkeys(args[2::2], 0))
+        else:
+            r.zrem(key, *args[1:])
+
+
+def _autocomplete_swap(r, keys, args):
+    if r._alive(keys[0]):
+        r.rename(keys[0], keys[1])
+    else:
+        r.delete(keys[1])
+    r.delete(keys[2])
+    r.set(keys[3], 1)
+
+
+SCRIPTS = {
+    FastAPILimiter.lua_script: _fixed_window,
+    HybridRateLimiter.lease_script: _lease,
+    autocomplete.WRITE_SCRIPT: _autocomplete_write,
+    autocomplete.SWAP_SCRIPT: _autocomplete_swap,
+}
@@ -1,60 +1,201 @@
+import asyncio
+import logging
+
 import redis.asyncio as redis
 
 from pathlib import Path
+from datetime import date
+from functools import lru_cache
+from contextlib import asynccontextmanager
 
-from fastapi import FastAPI, Depends, HTTPException, Request
-from fastapi.responses import HTMLResponse
-from fastapi.templating import Jinja2Templates
+from fastapi import FastAPI, APIRouter, HTTPException, Request
+from fastapi.responses import HTMLResponse, PlainTextResponse, JSONResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi_limiter import FastAPILimiter
-from sqlalchemy.orm import Session
-from sqlalchemy import text
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
 from starlette.middleware.cors import CORSMiddleware
 
-from src.database.db import get_db
-from src.routes import clients, auth, users
+from src.database.db import SessionLocal, bind_engines, create_engines
+from src.routes import clients, auth, users, health, batch
+from src.repository import clients as repository_clients
 from src.conf.config import settings
+from src.services import metrics, warmup
+from src.services.health import readiness
+from src.services.auth import auth_service
+from src.services.birthday_cache import birthday_cache
+from src.services.events import client_events
+from src.services.audit import audit_log
+from src.services.email import close_mail_client
+from src.services.profiler import ProfilingMiddleware
+from src.services.admission import AdmissionMiddleware
+from src.services.timeouts import StatementTimeoutError, StatementTimeoutMiddleware
+from src.services.resilience import DependencyUnavailable
 
-app = FastAPI()
+logger = logging.getLogger(__name__)
 
+BASE_DIR = Path(__file__).parent
+TOMBSTONE_PURGE_SECONDS = 86400
 
-@app.on_event("startup")
-async def startup():
-    r = await redis.Redis(host=settings.redis_host, port=settings.redis_port, db=0, encoding="utf-8", decode_responses=True)
-    await FastAPILimiter.init(r)
 
+async def birthday_window(days: int, today: date):
+    db = SessionLocal()
+    try:
+        return await repository_clients.get_birthday(days, db, today)
+    finally:
+        db.close()
 
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
 
-templates = Jinja2Templates(directory="templates")
-BASE_DIR = Path(__file__).parent
-app.mount("/static", StaticFiles(directory=BASE_DIR/"static"), name="static")
+async def purge_tombstones_daily():
+    """
+    The purge_tombstones_daily function deletes the expired client tombstones of the change feed once a day.
+    Every worker runs it; the delete is idempotent and cheap on the deleted_at index.
+
+    :return: None
+    """
+    while True:
+        db = SessionLocal()
+        try:
+            deleted = await repository_clients.purge_tombstones(db)
+            if deleted:
+                logger.info("Purged %d client tombstones", deleted)
+        except Exception as error:
+            logger.warning("Purging client tombstones failed: %r", error)
+        finally:
+            db.close()
+        await asyncio.sleep(TOMBSTONE_PURGE_SECONDS)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    The lifespan function creates the database engines and opens the limiter's Redis pool when a worker
+    starts, and closes every pool the worker owns when it stops: both Redis clients, the SMTP connection
+    and the database engines. The engines and the session factory bound to them are kept in app.state.
+    With warmup_enabled the warm-up runs in the background and the health check reports
+    the worker as not ready until it is done. The common birthday windows are precomputed every midnight.
+    The audit log is flushed in the background and once more before the engines are disposed.
+    Expired tombstones of the change feed are purged daily.
+    """
+    primary, replicas = create_engines()
+    bind_engines(primary, replicas)
+    app.state.engine, app.state.replica_engines, app.state.session_factory = primary, replicas, SessionLocal
+    limiter_redis = redis.Redis(host=settings.redis_host, port=settings.redis_port, db=0, encoding="utf-8",
+                                decode_responses=True, socket_timeout=settings.redis_timeout_ms / 1000,
+                                socket_connect_timeout=settings.redis_timeout_ms / 1000)
+    try:
+        await FastAPILimiter.init(limiter_redis)
+    except (redis.RedisError, OSError) as error:
+        # init assigns the client before loading its script; the limiters fall back to local windows
+        logger.warning("Redis is unavailable at startup, rate limiting per worker: %r", error)
+    warming = None
+    if settings.warmup_enabled:
+        warmup.state.start()
+        warming = asyncio.create_task(warmup.warm_up())
+    birthdays = asyncio.create_task(birthday_cache.run_at_midnight(birthday_window))
+    auditing = asyncio.create_task(audit_log.run())
+    purging = asyncio.create_task(purge_tombstones_daily())
+    try:
+        yield
+    finally:
+        birthdays.cancel()
+        purging.cancel()
+        client_events.close()
+        auditing.cancel()
+        if warming is not None and not warming.done():
+            warming.cancel()
+        # the tasks may still be using a session; wait until they stopped before disposing the engines
+        await asyncio.gather(birthdays, purging, auditing, *([warming] if warming is not None else []),
+                             return_exceptions=True)
+        await limiter_redis.close()
+        auth_service.r.close()
+        await close_mail_client()
+        bind_engines(None)
+        for bind in (primary, *replicas):
+            bind.dispose()
+
+
+async def dependency_unavailable_handler(request: Request, exc: DependencyUnavailable):
+    return JSONResponse(status_code=503, content={"detail": f"{exc.dependency} is unavailable, try again later"},
+                        headers={"Retry-After": str(max(1, round(exc.retry_after)))})
+
+
+async def pool_timeout_handler(request: Request, exc: PoolTimeoutError):
+    return JSONResponse(status_code=503, content={"detail": "Database is busy, try again later"},
+                        headers={"Retry-After": "1"})
+
+
+async def statement_timeout_handler(request: Request, exc: StatementTimeoutError):
+    return JSONResponse(status_code=503, content={"detail": "Query took too long, narrow it down or try again later"},
+                        headers={"Retry-After": "1"})
+
 
+@lru_cache(maxsize=None)
+def templates():
+    from fastapi.templating import Jinja2Templates
 
-@app.get("/", response_class=HTMLResponse)
+    return Jinja2Templates(directory="templates")
+
+
+router = APIRouter()
+
+
+@router.get("/", response_class=HTMLResponse)
 async def root(request: Request):
-    return templates.TemplateResponse("index.html", {"request": request})
+    return templates().TemplateResponse("index.html", {"request": request})
 
 
-@app.get("/api/healthchecker", response_class=HTMLResponse)
-def healthchecker(db: Session = Depends(get_db)):
-    try:
-        # Make request
-        result = db.execute(text("SELECT 1")).fetchone()
-        if result is None:
-            raise HTTPException(status_code=500, detail="Database is not configured correctly")
-        return {"message": "Welcome to FastAPI!"}
-    except Exception as e:
-        print(e)
-        raise HTTPException(status_code=500, detail="Error connecting to the database")
-
-
-app.include_router(auth.router, prefix='/api')
-app.include_router(clients.router, prefix="/api")
-app.include_router(users.router, prefix='/api')
+@router.get("/api/healthchecker")
+async def healthchecker():
+    """
+    The healthchecker function is kept for existing probes and answers from the cached readiness report,
+    so it no longer holds a pooled connection for every probe. Use /api/health/ready and /api/health/live.
+    """
+    report = await readiness.get()
+    if report["status"] == "not_ready":
+        raise HTTPException(status_code=503, detail="Service is not ready", headers={"Retry-After": "1"})
+    return {"message": "Welcome to FastAPI!"}
+
+
+@router.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+def read_metrics():
+    return metrics.render()
+
+
+def create_app() -> FastAPI:
+    """
+    The create_app function builds the application: exception handlers, middleware, static files and routers.
+    Connections to Redis, SMTP and the database are opened lazily or in lifespan, never here.
+
+    :return: The FastAPI application
+    """
+    app = FastAPI(lifespan=lifespan)
+
+    app.add_exception_handler(DependencyUnavailable, dependency_unavailable_handler)
+    app.add_exception_handler(PoolTimeoutError, pool_timeout_handler)
+    app.add_exception_handler(StatementTimeoutError, statement_timeout_handler)
+
+    app.add_middleware(StatementTimeoutMiddleware)
+    app.add_middleware(ProfilingMiddleware)
+    app.add_middleware(AdmissionMiddleware)
+    app.add_middleware(metrics.MetricsMiddleware)
+    # added last so it is outermost: responses of the other middleware, e.g. shed requests, get CORS headers too
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["*"],
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+
+    app.mount("/static", StaticFiles(directory=BASE_DIR/"static"), name="static")
+
+    app.include_router(router)
+    app.include_router(auth.router, prefix='/api')
+    app.include_router(clients.router, prefix="/api")
+    app.include_router(users.router, prefix='/api')
+    app.include_router(health.router, prefix='/api')
+    app.include_router(batch.router, prefix='/api')
+    return app
+
+
+app = create_app()
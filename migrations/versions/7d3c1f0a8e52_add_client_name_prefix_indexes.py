@@ -0,0 +1,26 @@
+"""add client name prefix indexes
+
+Revision ID: 7d3c1f0a8e52
+Revises: 5b2e7d41c9a3
+Create Date: 2026-10-19 11:03:17.552190
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7d3c1f0a8e52'
+down_revision = '5b2e7d41c9a3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_clients_firstname_prefix', 'clients', [sa.text('lower(firstname) text_pattern_ops')])
+    op.create_index('ix_clients_lastname_prefix', 'clients', [sa.text('lower(lastname) text_pattern_ops')])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_clients_lastname_prefix', table_name='clients')
+    op.drop_index('ix_clients_firstname_prefix', table_name='clients')
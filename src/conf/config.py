@@ -15,6 +15,68 @@ class Settings(BaseSettings):
     cloudinary_name: str = "cloudinary name"
     cloudinary_api_key: int = "0000000000000000"
     cloudinary_api_secret: str = "secret"
+    rate_limit_lease_ratio: float = 0.25
+    rate_limit_lease_min_times: int = 50
+    rate_limit_local_keys: int = 10000
+    rate_limit_budgets: dict[str, int] = {"admin": 600, "moderator": 300, "user": 60}
+    rate_limit_budget_seconds: int = 60
+    slow_query_ms: int = 200
+    sql_debug: bool = False
+    sql_repeat_threshold: int = 2
+    profile_dir: str = "profiles"
+    profile_interval_ms: float = 1.0
+    database_replica_urls: list[str] = []
+    replica_selection: str = "round_robin"
+    replica_max_lag_seconds: float = 5.0
+    replica_lag_check_seconds: float = 2.0
+    read_your_writes_seconds: int = 5
+    db_pool_size: int = 5
+    db_max_overflow: int = 5
+    db_pool_timeout: float = 30.0
+    db_pool_recycle: int = 1800
+    db_pool_pre_ping: bool = True
+    db_pool_fail_fast: bool = False
+    db_pool_wait_budget_ms: int = 250
+    admission_enabled: bool = True
+    admission_limits: dict[str, int] = {"auth": 4, "reads": 64, "writes": 16, "uploads": 4}
+    admission_max_limits: dict[str, int] = {"auth": 16, "reads": 256, "writes": 64, "uploads": 16}
+    admission_target_ms: dict[str, int] = {"auth": 500, "reads": 250, "writes": 500, "uploads": 3000}
+    admission_queue_size: int = 32
+    admission_queue_ms: int = 200
+    statement_timeout_ms: int = 5000
+    statement_timeouts_ms: dict[str, int] = {"/api/clients/search/": 2000, "/api/clients/birthday/": 2000}
+    redis_timeout_ms: int = 250
+    smtp_timeout_seconds: int = 10
+    cloudinary_timeout_seconds: int = 10
+    breaker_failure_threshold: int = 5
+    breaker_reset_seconds: float = 30.0
+    warmup_enabled: bool = False
+    warmup_connections: int = 5
+    warmup_users: int = 100
+    cloudinary_host: str = "api.cloudinary.com"
+    readiness_timeout_ms: int = 500
+    readiness_cache_seconds: float = 2.0
+    readiness_critical: list[str] = ["database"]
+    birthday_cache_windows: list[int] = [7, 30]
+    birthday_cache_seconds: int = 86400
+    birthday_cache_local_seconds: int = 30
+    birthday_cache_local_size: int = 64
+    greetings_chunk_size: int = 500
+    greetings_concurrency: int = 4
+    greetings_from_name: str = "Birthday greetings"
+    autocomplete_rebuild_seconds: int = 3600
+    batch_max_ids: int = 100
+    batch_max_requests: int = 20
+    batch_read_concurrency: int = 3
+    audit_backend: str = "memory"
+    audit_batch_size: int = 500
+    audit_flush_seconds: float = 2.0
+    audit_buffer_max: int = 50_000
+    changes_settle_seconds: float = 2.0
+    changes_retention_days: int = 30
+    events_queue_size: int = 100
+    events_keepalive_seconds: float = 15.0
+    events_retry_seconds: float = 1.0
 
     class Config:
         env_file = ".env"
@@ -1,23 +1,463 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
-from sqlalchemy.exc import DatabaseError
+import re
+import time
+import logging
+import itertools
+import threading
+
+from collections import Counter
+from contextvars import ContextVar
+from functools import lru_cache
+
+from fastapi import Depends, Request, Response
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.exc import DatabaseError, InvalidRequestError, OperationalError, TimeoutError as PoolTimeoutError
 
 from src.conf.config import settings
+from src.services.metrics import (DB_QUERY_DURATION, DB_SLOW_QUERIES, DB_REPEATED_QUERIES, DB_POOL_CONNECTIONS,
+                                  DB_POOL_WAITING, DB_POOL_WAIT, DB_POOL_TIMEOUTS, DB_STATEMENT_TIMEOUTS,
+                                  current_request)
+from src.services.timeouts import StatementTimeoutError, current_guard
 
+logger = logging.getLogger(__name__)
 
 DATABASE_URL = settings.database_url
 
-engine = create_engine(DATABASE_URL, max_overflow=5)  #  echo=True,
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+class InstrumentedQueuePool(QueuePool):
+    """
+    QueuePool that reports checked-out, idle and waiting connections and the checkout wait time.
+    The pool is labelled by its logging name, which survives engine.dispose().
+    """
+
+    def connect(self):
+        name = self._orig_logging_name or "default"
+        waiting = DB_POOL_WAITING.labels(name)
+        waiting.inc()
+        start = time.perf_counter()
+        try:
+            return super().connect()
+        except PoolTimeoutError:
+            DB_POOL_TIMEOUTS.labels(name).inc()
+            raise
+        finally:
+            waiting.dec()
+            DB_POOL_WAIT.labels(name).observe(time.perf_counter() - start)
+            self._report(name)
+
+    def _do_return_conn(self, record):
+        super()._do_return_conn(record)
+        self._report(self._orig_logging_name or "default")
+
+    def _report(self, name: str):
+        DB_POOL_CONNECTIONS.labels(name, "checked_out").set(self.checkedout())
+        DB_POOL_CONNECTIONS.labels(name, "idle").set(self.checkedin())
+
+
+def pool_options(url: str, name: str) -> dict:
+    """
+    The pool_options function builds the create_engine pool arguments from the settings.
+    With db_pool_fail_fast the checkout timeout is the wait budget, so a saturated pool
+    rejects requests quickly instead of queueing them for db_pool_timeout seconds.
+    In-memory SQLite keeps its single-connection pool; an SQLite file may be used from any thread,
+    since sessions run their statements on threadpool workers.
+
+    :param url: str: Database URL
+    :param name: str: Pool label used in metrics
+    :return: Keyword arguments for create_engine
+    """
+    parsed = make_url(url)
+    if parsed.get_backend_name() == "sqlite" and parsed.database in (None, "", ":memory:"):
+        return {}
+    timeout = settings.db_pool_wait_budget_ms / 1000 if settings.db_pool_fail_fast else settings.db_pool_timeout
+    options = {
+        "poolclass": InstrumentedQueuePool,
+        "pool_logging_name": name,
+        "pool_size": settings.db_pool_size,
+        "max_overflow": settings.db_max_overflow,
+        "pool_timeout": timeout,
+        "pool_recycle": settings.db_pool_recycle,
+        "pool_pre_ping": settings.db_pool_pre_ping,
+    }
+    if parsed.get_backend_name() == "sqlite":
+        options["connect_args"] = {"check_same_thread": False}
+    return options
+
+
+# bound to the engine of the worker by bind_engines when the application starts
+SessionLocal = sessionmaker(autocommit=False, autoflush=False)
+
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_PARAMETERS = re.compile(r"%\(\w+\)s|:\w+|\$\d+|%s|\?")
+_LISTS = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_SPACES = re.compile(r"\s+")
+
+
+@lru_cache(maxsize=2048)
+def fingerprint(statement: str) -> str:
+    """
+    The fingerprint function normalizes a SQL statement so that executions differing only in
+    literal values, bound parameter names or the length of an IN list compare equal.
+
+    :param statement: str: SQL statement as sent to the driver
+    :return: The normalized statement
+    """
+    text = _LITERALS.sub("?", statement)
+    text = _PARAMETERS.sub("?", text)
+    text = _LISTS.sub("(?+)", text)
+    return _SPACES.sub(" ", text).strip()
+
+
+class QueryStats:
+    """
+    Process-wide totals per statement fingerprint: number of executions, total and maximum duration.
+    """
+
+    def __init__(self, max_fingerprints: int = 1000):
+        self.max_fingerprints = max_fingerprints
+        self.totals = {}
+
+    def record(self, key: str, elapsed: float):
+        total = self.totals.get(key)
+        if total is None:
+            if len(self.totals) >= self.max_fingerprints:
+                return
+            total = self.totals[key] = [0, 0.0, 0.0]
+        total[0] += 1
+        total[1] += elapsed
+        total[2] = max(total[2], elapsed)
+
+    def top(self, n: int = 10) -> list[dict]:
+        """
+        The top function returns the fingerprints with the largest total time.
+
+        :param self: Represent the instance of the class
+        :param n: int: Number of fingerprints to return
+        :return: A list of dicts with fingerprint, count, total and max seconds
+        """
+        ranked = sorted(self.totals.items(), key=lambda item: item[1][1], reverse=True)[:n]
+        return [{"fingerprint": key, "count": count, "total": total, "max": longest}
+                for key, (count, total, longest) in ranked]
+
+
+query_stats = QueryStats()
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+    guard = conn.info.get("statement_guard")
+    if guard is not None:
+        guard.started = time.monotonic()
+        guard.executing = True
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_start"].pop()
+    guard = conn.info.get("statement_guard")
+    if guard is not None:
+        guard.executing = False
+    key = fingerprint(statement)
+    query_stats.record(key, elapsed)
+    DB_QUERY_DURATION.labels(key.split(" ", 1)[0].upper()).observe(elapsed)
+    stats = current_request.get()
+    if stats is not None:
+        stats.db_queries += 1
+        stats.db_time += elapsed
+    if elapsed * 1000 >= settings.slow_query_ms:
+        route = stats.route if stats is not None else "-"
+        DB_SLOW_QUERIES.labels(route).inc()
+        logger.warning("Slow query %.1f ms on %s: %s", elapsed * 1000, route, key)
+    if settings.sql_debug and stats is not None:
+        if stats.fingerprints is None:
+            stats.fingerprints = Counter()
+        stats.fingerprints[key] += 1
+        if stats.fingerprints[key] == settings.sql_repeat_threshold:
+            DB_REPEATED_QUERIES.labels(stats.route).inc()
+            logger.warning("Possible N+1: query repeated %d times on %s: %s",
+                           settings.sql_repeat_threshold, stats.route, key)
+
+
+def _handle_error(context):
+    if context.connection is not None and context.connection.info.get("query_start"):
+        context.connection.info["query_start"].pop()
+    if context.connection is not None and context.connection.info.get("statement_guard") is not None:
+        context.connection.info["statement_guard"].executing = False
+
+
+def instrument_engine(bind: Engine) -> Engine:
+    """
+    The instrument_engine function attaches the query timing hooks to an engine.
+
+    :param bind: Engine: The engine to instrument
+    :return: The same engine
+    """
+    if not event.contains(bind, "before_cursor_execute", _before_cursor_execute):
+        event.listen(bind, "before_cursor_execute", _before_cursor_execute)
+        event.listen(bind, "after_cursor_execute", _after_cursor_execute)
+        event.listen(bind, "handle_error", _handle_error)
+    return bind
+
+
+def create_engines(url: str = None, replica_urls: list[str] = None) -> tuple[Engine, list[Engine]]:
+    """
+    The create_engines function creates the instrumented engines of a worker: the primary and one
+    per read replica. They are created when the application starts rather than on import, so
+    importing the application opens no pools and each worker process owns the pools it uses.
+
+    :param url: str: Database URL of the primary, database_url by default
+    :param replica_urls: list[str]: Database URLs of the replicas, database_replica_urls by default
+    :return: The primary engine and the replica engines
+    """
+    url = url or settings.database_url
+    if replica_urls is None:
+        replica_urls = settings.database_replica_urls
+    primary = instrument_engine(create_engine(url, **pool_options(url, "primary")))  #  echo=True,
+    replicas = [instrument_engine(create_engine(replica, **pool_options(replica, f"replica_{index}")))
+                for index, replica in enumerate(replica_urls, 1)]
+    return primary, replicas
+
+READ_YOUR_WRITES_COOKIE = "rw_until"
+
+_LAG_QUERIES = {
+    "postgresql": "SELECT COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)",
+}
+
+
+class ReplicaRouter:
+    """
+    Picks the replica engine that serves a read-only session.
+
+    With the ``round_robin`` strategy replicas are used in turn. With ``lag`` the replica with the
+    smallest replication lag is used; lags are measured at most every ``check_interval`` seconds and
+    replicas lagging more than ``max_lag`` seconds (or unreachable) are skipped. When no replica is
+    usable the primary engine is returned.
+    """
+
+    def __init__(self, primary: Engine, replicas: list[Engine], strategy: str = "round_robin",
+                 max_lag: float = 5.0, check_interval: float = 2.0):
+        """
+        The __init__ function stores the engines and the selection settings.
+
+        :param self: Represent the instance of the class
+        :param primary: Engine: Engine of the primary, used as a fallback
+        :param replicas: list[Engine]: Engines of the read replicas
+        :param strategy: str: round_robin or lag
+        :param max_lag: float: Largest acceptable replication lag in seconds
+        :param check_interval: float: Seconds between lag measurements
+        :return: None
+        """
+        if strategy not in ("round_robin", "lag"):
+            raise ValueError(f"Unknown replica selection strategy: {strategy}")
+        self.strategy = strategy
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self.bind(primary, replicas)
+
+    def bind(self, primary: Engine | None, replicas: list[Engine]):
+        """
+        The bind function replaces the engines and forgets the lags measured on the previous ones.
+
+        :param self: Represent the instance of the class
+        :param primary: Engine: Engine of the primary, None while no engines are bound
+        :param replicas: list[Engine]: Engines of the read replicas
+        :return: None
+        """
+        self.primary = primary
+        self.replicas = list(replicas)
+        self.lags = {}
+        self.checked_at = 0.0
+        self._cycle = itertools.cycle(self.replicas)
+
+    def engines(self) -> list[Engine]:
+        return [] if self.primary is None else [self.primary, *self.replicas]
+
+    @staticmethod
+    def measure_lag(bind: Engine) -> float:
+        """
+        The measure_lag function returns the replication lag of a replica in seconds.
+        Dialects without a lag query (such as SQLite copies used in tests) report no lag.
+
+        :param bind: Engine: The replica
+        :return: Lag in seconds, or infinity when the replica cannot be reached
+        """
+        query = _LAG_QUERIES.get(bind.dialect.name)
+        if query is None:
+            return 0.0
+        try:
+            with bind.connect() as conn:
+                return float(conn.execute(text(query)).scalar() or 0.0)
+        except OperationalError:
+            logger.warning("Replica %s is unreachable", bind.url.render_as_string(hide_password=True))
+            return float("inf")
+
+    def refresh(self):
+        self.lags = {bind: self.measure_lag(bind) for bind in self.replicas}
+        self.checked_at = time.monotonic()
+
+    def pick(self) -> Engine:
+        """
+        The pick function chooses the engine for the next read-only session.
+
+        :param self: Represent the instance of the class
+        :return: A replica engine, or the primary when no replica is usable
+        """
+        if not self.replicas:
+            return self.primary
+        if self.strategy == "round_robin":
+            with self._lock:
+                return next(self._cycle)
+        if time.monotonic() - self.checked_at >= self.check_interval:
+            with self._lock:
+                if time.monotonic() - self.checked_at >= self.check_interval:
+                    self.refresh()
+        bind, lag = min(self.lags.items(), key=lambda item: item[1])
+        return bind if lag <= self.max_lag else self.primary
+
+
+replica_router = ReplicaRouter(
+    None,
+    [],
+    settings.replica_selection,
+    settings.replica_max_lag_seconds,
+    settings.replica_lag_check_seconds,
+)
+
+
+def bind_engines(primary: Engine | None, replicas: list[Engine] = ()):
+    """
+    The bind_engines function points SessionLocal and replica_router at the engines of the worker.
+    Binding None detaches them again, e.g. after the engines were disposed at shutdown.
+
+    :param primary: Engine: Engine of the primary, or None
+    :param replicas: list[Engine]: Engines of the read replicas
+    :return: None
+    """
+    SessionLocal.configure(bind=primary)
+    replica_router.bind(primary, replicas)
+
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False)
+
+
+@event.listens_for(ReadSessionLocal, "before_flush")
+def _reject_writes(session, flush_context, instances):
+    raise InvalidRequestError("Read-only session: write through get_db")
+
+
+@event.listens_for(SessionLocal, "after_begin")
+@event.listens_for(ReadSessionLocal, "after_begin")
+def _apply_statement_guard(session, transaction, connection):
+    guard = session.info.get("statement_guard")
+    if guard is not None:
+        guard.attach(connection)
+
+
+@event.listens_for(SessionLocal, "after_transaction_end")
+@event.listens_for(ReadSessionLocal, "after_transaction_end")
+def _release_statement_guard(session, transaction):
+    guard = session.info.get("statement_guard")
+    if guard is not None and transaction.parent is None:
+        guard.detach()
+
+
+def guarded(session: Session) -> Session:
+    """
+    The guarded function attaches the statement guard of the current request to a session,
+    so its statements are bounded by the route timeout and cancelled on client disconnect.
+
+    :param session: Session: A new session
+    :return: The same session
+    """
+    guard = current_guard.get()
+    if guard is not None:
+        session.info["statement_guard"] = guard
+    return session
+
+
+def _interrupted(session: Session, error: DatabaseError):
+    guard = session.info.get("statement_guard")
+    reason = guard.interrupted(error) if guard is not None else None
+    if reason is not None:
+        DB_STATEMENT_TIMEOUTS.labels(guard.route, reason).inc()
+        raise StatementTimeoutError(reason) from error
+
+
+@event.listens_for(SessionLocal, "after_commit")
+def _remember_write(session):
+    response = session.info.get("response")
+    if response is not None:
+        until = time.time() + settings.read_your_writes_seconds
+        response.set_cookie(READ_YOUR_WRITES_COOKIE, f"{until:.3f}", max_age=settings.read_your_writes_seconds,
+                            httponly=True, samesite="lax")
+
+
+def recently_wrote(request: Request) -> bool:
+    """
+    The recently_wrote function tells whether the client committed a write within the
+    read-your-writes window, in which case its reads must not go to a lagging replica.
+
+    :param request: Request: The incoming request
+    :return: True if the read-your-writes cookie has not expired yet
+    """
+    try:
+        return float(request.cookies.get(READ_YOUR_WRITES_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+
+# session of a /api/batch request, shared by its sub-requests
+shared_session: ContextVar[Session | None] = ContextVar("shared_session", default=None)
 
 
 # Dependency
-def get_db():
-    db = SessionLocal()
+def get_db(response: Response = None):
+    shared = shared_session.get()
+    if shared is not None:
+        # owned and closed by the batch request
+        try:
+            yield shared
+        except DatabaseError as error:
+            shared.rollback()
+            _interrupted(shared, error)
+        return
+    db = guarded(SessionLocal())
+    if response is not None:
+        db.info["response"] = response
     try:
         yield db
-    except DatabaseError:
+    except DatabaseError as error:
         db.rollback()
+        _interrupted(db, error)
     finally:
         db.close()
+
+
+def get_read_db(request: Request, db: Session = Depends(get_db)):
+    """
+    The get_read_db function is the dependency of read-only routes. It yields a session bound to a
+    replica chosen by replica_router, or the primary session from get_db when no replicas are
+    configured or the client wrote recently. The primary session is created lazily by SQLAlchemy,
+    so it costs no connection when a replica serves the request.
+
+    :param request: Request: The incoming request
+    :param db: Session: The primary session
+    :return: A session for reads
+    """
+    if not replica_router.replicas or recently_wrote(request) or shared_session.get() is not None:
+        yield db
+        return
+    bind = replica_router.pick()
+    if bind is replica_router.primary:
+        yield db
+        return
+    replica = guarded(ReadSessionLocal(bind=bind))
+    try:
+        yield replica
+    except DatabaseError as error:
+        replica.rollback()
+        _interrupted(replica, error)
+        raise
+    finally:
+        replica.close()
@@ -1,6 +1,7 @@
 import enum
 from datetime import date
-from sqlalchemy import Column, Integer, String, DateTime, func, Date, Enum, Boolean
+from sqlalchemy import (Column, Integer, String, DateTime, func, Date, Enum, Boolean, ForeignKey, UniqueConstraint,
+                        Index, JSON)
 from sqlalchemy.orm import declarative_base, validates
 from fastapi import HTTPException, status
 
@@ -15,6 +16,8 @@ class Role(enum.Enum):
 
 class Client(Base):
     __tablename__ = "clients"
+    # the change feed pages by (updated_at, id)
+    __table_args__ = (Index("ix_clients_updated_at_id", "updated_at", "id"),)
 
     id = Column(Integer, primary_key=True, index=True)
     firstname = Column(String)
@@ -47,6 +50,13 @@ class Client(Base):
                 raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid phone number format")
 
 
+# B-tree indexes for the autocomplete fallback: text_pattern_ops lets PostgreSQL use them for LIKE 'prefix%'
+Index("ix_clients_firstname_prefix", func.lower(Client.firstname).label("firstname_lower"),
+      postgresql_ops={"firstname_lower": "text_pattern_ops"})
+Index("ix_clients_lastname_prefix", func.lower(Client.lastname).label("lastname_lower"),
+      postgresql_ops={"lastname_lower": "text_pattern_ops"})
+
+
 class User(Base):
     __tablename__ = "users"
     id = Column(Integer, primary_key=True)
@@ -57,3 +67,31 @@ class User(Base):
     refresh_token = Column(String(255), nullable=True)
     role = Column('role', Enum(Role), default=Role.user)
     confirmed = Column(Boolean, default=False)
+
+
+class Greeting(Base):
+    __tablename__ = "greetings"
+    __table_args__ = (UniqueConstraint("client_id", "sent_on"),)
+    id = Column(Integer, primary_key=True)
+    client_id = Column(Integer, ForeignKey("clients.id", ondelete="CASCADE"), nullable=False)
+    sent_on = Column(Date, nullable=False)
+    sent_at = Column(DateTime, default=func.now())
+
+
+class ClientTombstone(Base):
+    __tablename__ = "client_tombstones"
+    __table_args__ = (Index("ix_client_tombstones_deleted_at_client_id", "deleted_at", "client_id"),)
+    id = Column(Integer, primary_key=True)
+    client_id = Column(Integer, nullable=False)
+    deleted_at = Column(DateTime, default=func.now(), nullable=False)
+
+
+class AuditEntry(Base):
+    __tablename__ = "audit_log"
+    __table_args__ = (Index("ix_audit_log_client_id_id", "client_id", "id"),)
+    id = Column(Integer, primary_key=True)
+    client_id = Column(Integer, nullable=False)
+    action = Column(String(16), nullable=False)
+    user_id = Column(Integer, nullable=True)
+    changes = Column(JSON, nullable=False)
+    created_at = Column(DateTime, nullable=False)
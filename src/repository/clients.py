@@ -1,37 +1,87 @@
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 from typing import List
 
+from sqlalchemy import extract, and_, or_, func, select, tuple_
 from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
 
-from src.database.models import Client
+from src.conf.config import settings
+from src.database.models import Client, Greeting, ClientTombstone, User, AuditEntry
 from src.schemas import ClientModel
+from src.services.autocomplete import autocomplete_index
+from src.services.birthday_cache import birthday_cache
+from src.services import events
+from src.services.audit import audit_log, snapshot, diff
 
+CLIENT_FIELDS = ("id", "firstname", "lastname", "email", "phone_number", "birthday", "additional_data")
 
-async def get_clients(limit: int, offset: int, db: Session):
+# Statements run in the threadpool, so the event loop stays free while they execute: other requests
+# are served and a client disconnect can cancel the statement (see StatementTimeoutMiddleware).
+
+
+def _commit(db: Session, client: Client | None = None):
+    db.commit()
+    if client is not None:
+        # load the committed row here rather than lazily on the event loop
+        db.refresh(client)
+
+
+def _select(fields: tuple[str, ...] | None, db: Session):
+    """
+    The _select function starts a query of whole clients, or with fields of only those columns,
+    so narrow requests load and transfer only what they return.
+
+    :param fields: tuple[str, ...] | None: Names from CLIENT_FIELDS, None for whole clients
+    :param db: Session: Pass the database session to the function
+    :return: A query of Client objects or of rows with the requested columns
+    """
+    if fields is None:
+        return db.query(Client)
+    return db.query(*(getattr(Client, name) for name in fields))
+
+
+async def get_clients(limit: int, offset: int, db: Session, fields: tuple[str, ...] | None = None):
     """
     The get_clients function returns a list of clients from the database.
 
     :param limit: int: Limit the number of clients returned
     :param offset: int: Determine how many clients to skip
     :param db: Session: Pass in the database session
-    :return: A list of client objects
+    :param fields: tuple[str, ...] | None: Columns to load, whole clients by default
+    :return: A list of client objects, or of rows with the requested fields
     """
-    clients = db.query(Client).limit(limit).offset(offset).all()
+    clients = await run_in_threadpool(_select(fields, db).limit(limit).offset(offset).all)
     return clients
 
 
-async def get_client(client_id: int, db: Session):
+async def get_client(client_id: int, db: Session, fields: tuple[str, ...] | None = None):
     """
     The get_client function returns a client object from the database.
 
     :param client_id: int: Specify the client id of the client we want to retrieve from our database
     :param db: Session: Pass the database session to the function
-    :return: A client object
+    :param fields: tuple[str, ...] | None: Columns to load, the whole client by default
+    :return: A client object, or a row with the requested fields
     """
-    client = db.query(Client).filter_by(id=client_id).first()
+    client = await run_in_threadpool(_select(fields, db).filter_by(id=client_id).first)
     return client
 
 
+async def get_clients_by_ids(ids: list[int], db: Session, fields: tuple[str, ...] | None = None) -> dict:
+    """
+    The get_clients_by_ids function loads the clients with the given ids in one query.
+
+    :param ids: list[int]: Ids of the clients
+    :param db: Session: Pass the database session to the function
+    :param fields: tuple[str, ...] | None: Columns to load, whole clients by default; id is always loaded
+    :return: A dict of id to client object, or to row with id and the requested fields; missing ids are absent
+    """
+    if fields is not None:
+        fields = ("id",) + tuple(name for name in fields if name != "id")
+    clients = await run_in_threadpool(_select(fields, db).filter(Client.id.in_(ids)).all)
+    return {client.id: client for client in clients}
+
+
 async def get_client_by_email(email: str, db: Session):
     """
     The get_client_by_email function takes in an email and a database session,
@@ -41,7 +91,7 @@ async def get_client_by_email(email: str, db: Session):
     :param db: Session: Pass the database session to the function
     :return: The client object with the given email
     """
-    client = db.query(Client).filter_by(email=email).first()
+    client = await run_in_threadpool(db.query(Client).filter_by(email=email).first)
     return client
 
 
@@ -53,85 +103,228 @@ async def get_client_by_phone(phone_number: str, db: Session):
     :param db: Session: Pass the database session to the function
     :return: A client object that matches the phone number provided
     """
-    client = db.query(Client).filter_by(phone_number=phone_number).first()
+    client = await run_in_threadpool(db.query(Client).filter_by(phone_number=phone_number).first)
     return client
 
 
-async def create_client(body: ClientModel, db: Session):
+async def create_client(body: ClientModel, db: Session, actor: User | None = None):
     """
     The create_client function creates a new client in the database.
 
     :param body: ClientModel: Pass the data from the request body into a clientmodel object
     :param db: Session: Access the database
+    :param actor: User | None: The user who creates the client, for the audit log
     :return: A client object
     """
     client = Client(**body.dict())
+    # taken before the commit expires the attributes
+    changes = diff(None, snapshot(client))
     db.add(client)
-    db.commit()
+    await run_in_threadpool(_commit, db, client)
+    birthday_cache.bump()
+    autocomplete_index.add(client.id, body.firstname, body.lastname)
+    events.publish("created", client.id)
+    audit_log.record("created", client.id, actor and actor.id, changes)
     return client
 
 
-async def update_client(body: ClientModel, user_id: int, db: Session):
+async def update_client(body: ClientModel, user_id: int, db: Session, actor: User | None = None):
     """
     The update_client function updates a client's information in the database.
 
     :param body: ClientModel: Pass the data from the request body to this function
     :param user_id: int: Get the client from the database
     :param db: Session: Access the database
+    :param actor: User | None: The user who updates the client, for the audit log
     :return: A clientmodel object
     """
     client = await get_client(user_id, db)
     if client:
+        names, before = (client.firstname, client.lastname), snapshot(client)
         client.firstname = body.firstname
         client.lastname = body.lastname
         client.email = body.email
         client.phone_number = body.phone_number
         client.birthday = body.birthday
         client.additional_data = body.additional_data
+        changes = diff(before, snapshot(client))
         db.add(client)
-        db.commit()
+        await run_in_threadpool(_commit, db, client)
+        birthday_cache.bump()
+        autocomplete_index.update(user_id, names, (body.firstname, body.lastname))
+        events.publish("updated", user_id)
+        if changes:
+            audit_log.record("updated", user_id, actor and actor.id, changes)
     return client
 
 
-async def remove_client(client_id: int, db: Session):
+async def remove_client(client_id: int, db: Session, actor: User | None = None):
     """
     The remove_client function removes a client from the database.
 
     :param client_id: int: Specify the client to be removed
     :param db: Session: Pass the database session to the function
+    :param actor: User | None: The user who removes the client, for the audit log
     :return: The client object that was deleted
     """
     client = await get_client(client_id, db)
     if client:
+        names, before = (client.firstname, client.lastname), snapshot(client)
         db.delete(client)
-        db.commit()
+        db.add(ClientTombstone(client_id=client_id))
+        await run_in_threadpool(_commit, db)
+        birthday_cache.bump()
+        autocomplete_index.remove(client_id, *names)
+        events.publish("deleted", client_id)
+        audit_log.record("deleted", client_id, actor and actor.id, diff(before, None))
     return client
 
 
-async def get_birthday(days: int, db: Session):
+def _retained_since(now: datetime) -> datetime:
+    # compared with naive cursors and columns: drop the zone of the database clock, not convert it
+    return (now - timedelta(days=settings.changes_retention_days)).replace(tzinfo=None)
+
+
+async def get_changes(since: tuple[datetime, int] | None, limit: int, db: Session) -> tuple[list, bool] | None:
+    """
+    The get_changes function returns the clients changed and deleted after the cursor, oldest first.
+    Changes of the last changes_settle_seconds are held back: updated_at is set when a transaction
+    starts, so a slow transaction can commit a row older than one already returned.
+    Tombstones are kept for changes_retention_days, so a cursor older than that may have missed deletes.
+
+    :param since: tuple[datetime, int] | None: (changed_at, id) of the last change seen, None for all
+    :param limit: int: Maximum number of changes to return
+    :param db: Session: Pass the database session to the function
+    :return: A list of (changed_at, id, client) tuples, client is None for deletes, and whether more changes follow,
+        or None when the cursor is older than the tombstone retention
+    """
+    now = await run_in_threadpool(db.scalar, select(func.now()))
+    if since is not None and since[0] < _retained_since(now):
+        return None
+    until = now - timedelta(seconds=settings.changes_settle_seconds)
+    clients = db.query(Client).filter(Client.updated_at <= until)
+    tombstones = db.query(ClientTombstone).filter(ClientTombstone.deleted_at <= until)
+    if since is not None:
+        clients = clients.filter(tuple_(Client.updated_at, Client.id) > since)
+        tombstones = tombstones.filter(tuple_(ClientTombstone.deleted_at, ClientTombstone.client_id) > since)
+    clients = await run_in_threadpool(clients.order_by(Client.updated_at, Client.id).limit(limit + 1).all)
+    tombstones = await run_in_threadpool(tombstones.order_by(ClientTombstone.deleted_at, ClientTombstone.client_id)
+                                         .limit(limit + 1).all)
+    changes = sorted([(client.updated_at, client.id, client) for client in clients] +
+                     [(tombstone.deleted_at, tombstone.client_id, None) for tombstone in tombstones],
+                     key=lambda change: change[:2])
+    return changes[:limit], len(changes) > limit
+
+
+async def purge_tombstones(db: Session) -> int:
+    """
+    The purge_tombstones function deletes the tombstones older than changes_retention_days.
+
+    :param db: Session: Pass the database session to the function
+    :return: The number of tombstones deleted
+    """
+    now = await run_in_threadpool(db.scalar, select(func.now()))
+    expired = db.query(ClientTombstone).filter(ClientTombstone.deleted_at < _retained_since(now))
+    deleted = await run_in_threadpool(expired.delete, synchronize_session=False)
+    await run_in_threadpool(db.commit)
+    return deleted
+
+
+async def get_client_audit(client_id: int, limit: int, before_id: int | None, db: Session):
+    """
+    The get_client_audit function returns the audit entries of a client, newest first.
+    Entries reach the audit log with the delay of its write-behind buffer.
+
+    :param client_id: int: Id of the client, also of a deleted one
+    :param limit: int: Maximum number of entries to return
+    :param before_id: int | None: Return entries older than this one, None for the newest
+    :param db: Session: Pass the database session to the function
+    :return: A list of audit entries
+    """
+    entries = db.query(AuditEntry).filter(AuditEntry.client_id == client_id)
+    if before_id is not None:
+        entries = entries.filter(AuditEntry.id < before_id)
+    return await run_in_threadpool(entries.order_by(AuditEntry.id.desc()).limit(limit).all)
+
+
+def next_birthday(birthday: date, today: date) -> date:
+    """
+    The next_birthday function returns the first anniversary of a birthday on or after today.
+    A February 29 birthday falls on February 28 in years that are not leap years.
+
+    :param birthday: date: The date of birth
+    :param today: date: The day to count from
+    :return: The date of the next birthday
+    """
+    for year in (today.year, today.year + 1):
+        try:
+            anniversary = birthday.replace(year=year)
+        except ValueError:
+            anniversary = date(year, 2, 28)
+        if anniversary >= today:
+            return anniversary
+
+
+async def get_birthday(days: int, db: Session, today: date | None = None):
     """
     The get_birthday function takes in a number of days and a database session.
     It returns all clients whose birthday is within the next x days, where x is the number of days passed into the function.
+    The window may cross the new year.
 
     :param days: int: Specify the number of days to look ahead for birthdays
     :param db: Session: Pass the database session to the function
+    :param today: date | None: First day of the window, today by default
     :return: A list of clients with birthdays in the next x days
     """
-    today = datetime.now().date()
+    today = today or datetime.now().date()
     end_period = today + timedelta(days=days)
-    client = db.query(Client).all()
+    client = await run_in_threadpool(db.query(Client).all)
     birthday_list = []
     for client in client:
         if type(client.birthday) == str:
-            birthday_this_year = datetime.strptime(client.birthday, "%Y-%m-%d").date().replace(year=2023)
+            birthday = datetime.strptime(client.birthday, "%Y-%m-%d").date()
         else:
-            birthday_this_year = client.birthday.replace(year=2023)
-        if end_period >= birthday_this_year >= today:
+            birthday = client.birthday
+        if next_birthday(birthday, today) <= end_period:
             birthday_list.append(client)
     return birthday_list
 
 
-async def search_clients(data: str, db: Session):
+async def get_birthday_clients(today: date, after_id: int, limit: int, db: Session):
+    """
+    The get_birthday_clients function returns the next chunk of clients whose birthday is today
+    and who have not been greeted today, ordered by id. On February 28 of a year that is not
+    a leap year it includes the clients born on February 29, like next_birthday.
+
+    :param today: date: The day of the birthdays
+    :param after_id: int: Return clients with a greater id, 0 for the first chunk
+    :param limit: int: Maximum number of clients to return
+    :param db: Session: Pass the database session to the function
+    :return: A list of client objects
+    """
+    month, day = extract("month", Client.birthday), extract("day", Client.birthday)
+    condition = and_(month == today.month, day == today.day)
+    if (today.month, today.day) == (2, 28) and next_birthday(date(2000, 2, 29), today) == today:
+        condition = or_(condition, and_(month == 2, day == 29))
+    greeted = db.query(Greeting.id).filter(Greeting.client_id == Client.id, Greeting.sent_on == today).exists()
+    return await run_in_threadpool(db.query(Client).filter(condition, Client.id > after_id, ~greeted)
+                                   .order_by(Client.id).limit(limit).all)
+
+
+async def record_greeting(client_id: int, today: date, db: Session) -> None:
+    """
+    The record_greeting function records that a client has been greeted today, so a resumed run skips them.
+
+    :param client_id: int: The greeted client
+    :param today: date: The day of the greeting
+    :param db: Session: Pass the database session to the function
+    :return: None
+    """
+    db.add(Greeting(client_id=client_id, sent_on=today))
+    await run_in_threadpool(db.commit)
+
+
+async def search_clients(data: str, db: Session, fields: tuple[str, ...] | None = None):
     """
     The search_clients function searches the database for clients that match a given string.
         The function takes in two parameters: data and db. Data is the string to be searched,
@@ -139,9 +332,10 @@ async def search_clients(data: str, db: Session):
 
     :param data: str: Search for a string in the database
     :param db: Session: Pass in the database session
-    :return: A list of client objects
+    :param fields: tuple[str, ...] | None: Columns to load, whole clients by default
+    :return: A list of client objects, or of rows with the requested fields
     """
-    clients = db.query(Client).filter(Client.firstname.ilike(f"%{data}%") |
-                                      Client.lastname.ilike(f"%{data}%") |
-                                      Client.email.ilike(f"%{data}%")).all()
+    clients = await run_in_threadpool(_select(fields, db).filter(Client.firstname.ilike(f"%{data}%") |
+                                                                 Client.lastname.ilike(f"%{data}%") |
+                                                                 Client.email.ilike(f"%{data}%")).all)
     return clients
@@ -1,11 +1,17 @@
 import logging
 from libgravatar import Gravatar
 from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
 
 from src.database.models import User
 from src.schemas import UserModel
 
 
+def _commit(db: Session, user: User):
+    db.commit()
+    db.refresh(user)
+
+
 async def get_user_by_email(email: str, db: Session) -> User | None:
     """
     The get_user_by_email function takes in an email and a database session,
@@ -15,7 +21,25 @@ async def get_user_by_email(email: str, db: Session) -> User | None:
     :param db: Session: Pass the database session to the function
     :return: The first user that matches the email address passed in
     """
-    return db.query(User).filter(User.email == email).first()
+    return await run_in_threadpool(db.query(User).filter(User.email == email).first)
+
+
+async def get_active_users(emails: list[str], limit: int, db: Session) -> list[User]:
+    """
+    The get_active_users function returns the users with the given emails, in the same order.
+    Without emails it returns the newest users that are logged in, i.e. still hold a refresh token.
+
+    :param emails: list[str]: Emails of the most recently active users, most recent first
+    :param limit: int: Maximum number of users to return
+    :param db: Session: Pass the database session to the function
+    :return: A list of users
+    """
+    if not emails:
+        return await run_in_threadpool(db.query(User).filter(User.refresh_token.isnot(None))
+                                       .order_by(User.id.desc()).limit(limit).all)
+    found = await run_in_threadpool(db.query(User).filter(User.email.in_(emails[:limit])).all)
+    users = {user.email: user for user in found}
+    return [users[email] for email in emails[:limit] if email in users]
 
 
 async def create_user(body: UserModel, db: Session) -> User:
@@ -34,8 +58,7 @@ async def create_user(body: UserModel, db: Session) -> User:
         logging.error(e)
     new_user = User(**body.dict(), avatar=avatar)
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    await run_in_threadpool(_commit, db, new_user)
     return new_user
 
 
@@ -49,7 +72,7 @@ async def update_token(user: User, token: str | None, db: Session) -> None:
     :return: Nothing, so the type is none
     """
     user.refresh_token = token
-    db.commit()
+    await run_in_threadpool(db.commit)
 
 
 async def confirmed_email(email: str, db: Session) -> None:
@@ -64,7 +87,7 @@ async def confirmed_email(email: str, db: Session) -> None:
     """
     user = await get_user_by_email(email, db)
     user.confirmed = True
-    db.commit()
+    await run_in_threadpool(db.commit)
 
 
 async def update_avatar(email, url: str, db: Session) -> User:
@@ -78,7 +101,7 @@ async def update_avatar(email, url: str, db: Session) -> User:
     """
     user = await get_user_by_email(email, db)
     user.avatar = url
-    db.commit()
+    await run_in_threadpool(_commit, db, user)
     return user
 
 
@@ -94,4 +117,4 @@ async def save_new_password(user: User, password: str, db: Session) -> None:
     :return: None
     """
     user.password = password
-    db.commit()
+    await run_in_threadpool(db.commit)
@@ -60,6 +60,7 @@ async def login(body: OAuth2PasswordRequestForm = Depends(), db: Session = Depen
     access_token = await auth_service.create_access_token(data={"sub": user.email})
     refresh_token = await auth_service.create_refresh_token(data={"sub": user.email})
     await repository_users.update_token(user, refresh_token, db)
+    auth_service.remember_login(user.email)
     return {"access_token": access_token, "refresh_token": refresh_token, "token_type": "bearer"}
 
 
@@ -0,0 +1,48 @@
+from fastapi import APIRouter, HTTPException, Request, status, Depends
+from sqlalchemy.orm import Session
+
+from src.conf.config import settings
+from src.database.db import get_db, shared_session
+from src.database.models import User
+from src.schemas import BatchRequest, BatchResponse
+from src.services.auth import auth_service, batch_user
+from src.services.batch import BatchDispatcher, allowed, normalize_path
+
+router = APIRouter(prefix="/batch", tags=["Batch"])
+
+
+@router.post("/", response_model=BatchResponse)
+async def run_batch(body: BatchRequest, request: Request, db: Session = Depends(get_db),
+                    user: User = Depends(auth_service.get_current_user)):
+    """
+    The run_batch function runs several API calls in one round trip. The caller is authenticated
+    once; consecutive GET sub-requests run concurrently, each with a database session of its own,
+    every other sub-request runs alone in batch order on the session of the batch. Each sub-request
+    gets its own status and body, a failing one does not fail the batch. Role checks and rate limits
+    of the called routes apply to every sub-request.
+
+    :param body: BatchRequest: The sub-requests
+    :param request: Request: The batch request
+    :param db: Session: The database session of the sub-requests that run alone
+    :param user: User: The authenticated user shared by the sub-requests
+    :return: A dict with the responses in batch order
+    """
+    if len(body.requests) > settings.batch_max_requests:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                            detail=f"At most {settings.batch_max_requests} requests per batch")
+    for sub in body.requests:
+        sub.path = normalize_path(sub.path)
+    rejected = [sub.path for sub in body.requests if not allowed(sub.path)]
+    if rejected:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                            detail=f"Paths not allowed in a batch: {', '.join(rejected)}")
+    if user in db:
+        # commits of sub-requests would expire the shared user and reload it for every role check
+        db.expunge(user)
+    user_token, session_token = batch_user.set(user), shared_session.set(db)
+    try:
+        responses = await BatchDispatcher(request).run(body.requests)
+    finally:
+        batch_user.reset(user_token)
+        shared_session.reset(session_token)
+    return {"responses": responses}
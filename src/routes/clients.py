@@ -1,15 +1,26 @@
+import base64
+import binascii
+from datetime import datetime
 from typing import List
 
 from fastapi import APIRouter, HTTPException, status, Path, Query, Depends
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, StreamingResponse
 from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
 
-from src.database.db import get_db
+from src.database.db import get_db, get_read_db
 from src.database.models import Client, User, Role
-from src.schemas import ClientResponse, ClientModel, BirthdayResponse
+from src.conf.config import settings
+from src.schemas import (ClientResponse, ClientModel, BirthdayResponse, AutocompleteResponse, ClientBatchResponse,
+                         ClientChangesResponse, AuditEntryResponse)
 from src.repository import clients as repository_clients
 from src.services.auth import auth_service
+from src.services.autocomplete import autocomplete_index
+from src.services.birthday_cache import birthday_cache
+from src.services.events import client_events
 from src.services.roles import RolesAccess
-from fastapi_limiter.depends import RateLimiter
+from src.services.limiter import HybridRateLimiter, CostRateLimiter, BatchCostRateLimiter
 
 router = APIRouter(prefix="/clients", tags=["Clients"])
 
@@ -18,11 +29,86 @@ access_create = RolesAccess([Role.admin, Role.moderator])
 access_update = RolesAccess([Role.admin, Role.moderator])
 access_delete = RolesAccess([Role.admin])
 
+COST_CLIENT = 1
+COST_CLIENTS = 2
+COST_SEARCH = 5
+COST_BIRTHDAY = 10
+COST_BATCH = 1
+COST_CHANGES = 2
+BATCH_IDS_PER_UNIT = 10
+
+FIELDS_DESCRIPTION = ("Comma-separated columns to return instead of the default ones, any of: "
+                      + ", ".join(repository_clients.CLIENT_FIELDS))
+
+
+def client_fields(fields: str = Query(None, description=FIELDS_DESCRIPTION)) -> tuple[str, ...] | None:
+    """
+    The client_fields function parses the fields query parameter against the allowlist of client columns.
+
+    :param fields: str: Comma-separated column names
+    :return: The requested columns in request order without duplicates, or None when fields is not given
+    """
+    if fields is None:
+        return None
+    names = tuple(dict.fromkeys(name.strip() for name in fields.split(",") if name.strip()))
+    unknown = [name for name in names if name not in repository_clients.CLIENT_FIELDS]
+    if unknown or not names:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                            detail=f"Unknown fields: {', '.join(unknown) or fields!r}. {FIELDS_DESCRIPTION}")
+    return names
+
+
+def batch_ids(ids: List[int] = Query(description=f"Client ids, at most {settings.batch_max_ids}")) -> List[int]:
+    """
+    The batch_ids function checks the size of a batch before it is charged to the rate budget.
+
+    :param ids: List[int]: Repeated ids query parameter
+    :return: The ids in request order without duplicates
+    """
+    if len(ids) > settings.batch_max_ids:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                            detail=f"At most {settings.batch_max_ids} ids per request")
+    return list(dict.fromkeys(ids))
+
+
+def encode_cursor(changed_at: datetime, client_id: int) -> str:
+    return base64.urlsafe_b64encode(f"{changed_at.isoformat()},{client_id}".encode()).decode()
+
+
+def changes_cursor(since: str = Query(None, description="Cursor returned by the previous call, "
+                                                         "omit it for the first full sync")) -> tuple | None:
+    """
+    The changes_cursor function decodes the opaque since cursor of the change feed.
+
+    :param since: str: Cursor from the previous response
+    :return: The (changed_at, id) position of the cursor, or None when since is not given
+    """
+    if since is None:
+        return None
+    try:
+        changed_at, client_id = base64.urlsafe_b64decode(since.encode()).decode().rsplit(",", 1)
+        return datetime.fromisoformat(changed_at), int(client_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail="Invalid cursor")
+
+
+def projected(rows) -> JSONResponse:
+    """
+    The projected function returns rows of the requested fields as JSON without a response model,
+    so only the requested columns are serialized.
+
+    :param rows: A row or a list of rows
+    :return: A JSONResponse
+    """
+    content = [row._asdict() for row in rows] if isinstance(rows, list) else rows._asdict()
+    return JSONResponse(content=jsonable_encoder(content))
+
 
 @router.get("/", response_model=List[ClientResponse],
-            dependencies=[Depends(access_get), Depends(RateLimiter(times=3, seconds=10))],
-            description="No more than 3 requests per 10 seconds")
-async def get_clients(limit: int = Query(10, le=300), offset: int = 0, db: Session = Depends(get_db),
+            dependencies=[Depends(access_get), Depends(CostRateLimiter(cost=COST_CLIENTS))],
+            description=f"Costs {COST_CLIENTS} units of the per-user rate budget")
+async def get_clients(limit: int = Query(10, le=300), offset: int = 0, db: Session = Depends(get_read_db),
+                      fields: tuple[str, ...] | None = Depends(client_fields),
                       _: User = Depends(auth_service.get_current_user)):
     """
     The get_clients function returns a list of clients.
@@ -31,17 +117,18 @@ async def get_clients(limit: int = Query(10, le=300), offset: int = 0, db: Sessi
     :param le: Limit the number of clients that can be returned at once
     :param offset: int: Specify the number of records to skip before starting to return rows
     :param db: Session: Pass the database session to the repository layer
+    :param fields: tuple[str, ...] | None: Columns to return instead of ClientResponse
     :param _: User: Get the current user from the database
     :return: A list of clients
     """
-    users = await repository_clients.get_clients(limit, offset, db)
-    return users
+    users = await repository_clients.get_clients(limit, offset, db, fields)
+    return projected(users) if fields else users
 
 
 @router.get("/birthday/", response_model=List[BirthdayResponse],
-            dependencies=[Depends(access_get), Depends(RateLimiter(times=3, seconds=10))],
-            description="No more than 3 requests per 10 seconds")
-async def get_users_birthday(days: int = Query(7, le=365), db: Session = Depends(get_db),
+            dependencies=[Depends(access_get), Depends(CostRateLimiter(cost=COST_BIRTHDAY))],
+            description=f"Costs {COST_BIRTHDAY} units of the per-user rate budget")
+async def get_users_birthday(days: int = Query(7, le=365), db: Session = Depends(get_read_db),
                              _: User = Depends(auth_service.get_current_user)):
     """
     The get_users_birthday function returns a list of users whose birthday is within the next x days.
@@ -52,37 +139,135 @@ async def get_users_birthday(days: int = Query(7, le=365), db: Session = Depends
     :param _: User: Tell fastapi that we want to use the auth_service
     :return: A list of users whose birthday is in the next x days
     """
-    users = await repository_clients.get_birthday(days, db)
+    users = await birthday_cache.get(days, lambda today: repository_clients.get_birthday(days, db, today))
     if users is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Client not found")
     return users
 
 
 @router.get("/search/", response_model=List[ClientResponse],
-            dependencies=[Depends(access_get), Depends(RateLimiter(times=3, seconds=10))],
-            description="No more than 3 requests per 10 seconds")
-async def search_clients(data: str, db: Session = Depends(get_db), _: User = Depends(auth_service.get_current_user)):
+            dependencies=[Depends(access_get), Depends(CostRateLimiter(cost=COST_SEARCH))],
+            description=f"Costs {COST_SEARCH} units of the per-user rate budget")
+async def search_clients(data: str, db: Session = Depends(get_read_db),
+                         fields: tuple[str, ...] | None = Depends(client_fields),
+                         _: User = Depends(auth_service.get_current_user)):
     """
     The search_clients function searches for clients in the database.
         Args:
             data (str): The search term to be used when searching for clients.
-            db (Session, optional): SQLAlchemy Session. Defaults to Depends(get_db).
+            db (Session, optional): SQLAlchemy Session. Defaults to Depends(get_read_db).
 
     :param data: str: Search for a client by name or surname
     :param db: Session: Get the database session
+    :param fields: tuple[str, ...] | None: Columns to return instead of ClientResponse
     :param _: User: Check if the user is logged in
     :return: A list of clients
     """
-    clients = await repository_clients.search_clients(data, db)
+    clients = await repository_clients.search_clients(data, db, fields)
     if clients is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Client not found")
-    return clients
+    return projected(clients) if fields else clients
+
+
+@router.get("/autocomplete/", response_model=List[AutocompleteResponse],
+            dependencies=[Depends(access_get), Depends(HybridRateLimiter(times=10, seconds=1))],
+            description="No more than 10 requests per second")
+async def autocomplete_clients(q: str = Query(min_length=1, max_length=50), limit: int = Query(10, ge=1, le=50),
+                               db: Session = Depends(get_read_db), _: User = Depends(auth_service.get_current_user)):
+    """
+    The autocomplete_clients function returns the first clients whose name starts with q, for type-ahead.
+        The lookup is a ZRANGEBYLEX on a Redis sorted set of names, so it is cheap enough for every keystroke.
+
+    :param q: str: Beginning of the first name, the last name or both
+    :param limit: int: Maximum number of clients returned
+    :param db: Session: Database session, used when the Redis index is unavailable
+    :param _: User: Check if the user is logged in
+    :return: A list of client ids and names
+    """
+    return await run_in_threadpool(autocomplete_index.lookup, q, limit, db)
+
+
+@router.get("/batch/", response_model=ClientBatchResponse,
+            dependencies=[Depends(access_get), Depends(batch_ids),
+                          Depends(BatchCostRateLimiter(cost=COST_BATCH, per_unit=BATCH_IDS_PER_UNIT))],
+            description=f"Costs {COST_BATCH} unit plus 1 per {BATCH_IDS_PER_UNIT} ids of the per-user rate budget")
+async def get_clients_batch(ids: List[int] = Depends(batch_ids), db: Session = Depends(get_read_db),
+                            fields: tuple[str, ...] | None = Depends(client_fields),
+                            _: User = Depends(auth_service.get_current_user)):
+    """
+    The get_clients_batch function returns the clients with the given ids, in the order of the ids,
+    and the ids that do not exist. All clients are loaded with one IN query.
+
+    :param ids: List[int]: Ids of the clients, e.g. ?ids=1&ids=5
+    :param db: Session: Pass the database session to the repository function
+    :param fields: tuple[str, ...] | None: Columns to return instead of ClientResponse
+    :param _: User: Get the current user from the auth_service
+    :return: A dict with the found clients and the missing ids
+    """
+    found = await repository_clients.get_clients_by_ids(ids, db, fields)
+    clients = [found[client_id] for client_id in ids if client_id in found]
+    missing = [client_id for client_id in ids if client_id not in found]
+    if not fields:
+        return {"clients": clients, "missing": missing}
+    return JSONResponse(content=jsonable_encoder({
+        "clients": [{name: getattr(client, name) for name in fields} for client in clients],
+        "missing": missing,
+    }))
+
+
+@router.get("/changes/", response_model=ClientChangesResponse,
+            dependencies=[Depends(access_get), Depends(CostRateLimiter(cost=COST_CHANGES))],
+            description=f"Costs {COST_CHANGES} units of the per-user rate budget")
+async def get_client_changes(since: tuple | None = Depends(changes_cursor), limit: int = Query(100, ge=1, le=1000),
+                             db: Session = Depends(get_db), _: User = Depends(auth_service.get_current_user)):
+    """
+    The get_client_changes function is the change feed of clients: the clients created or updated
+    and the ids of the clients deleted after the cursor, oldest first. Pass the returned cursor as since
+    of the next call; while has_more is true there are more changes to fetch right away.
+        It reads the primary database, a lagging replica could make the cursor pass changes it has not seen.
+        Deletes are kept for changes_retention_days: an older cursor gets 410 and must sync again without since.
+
+    :param since: tuple | None: Position of the since cursor
+    :param limit: int: Maximum number of changes returned
+    :param db: Session: Pass the database session to the repository function
+    :param _: User: Get the current user from the auth_service
+    :return: The changes, the cursor of the last change and whether more changes follow
+    """
+    result = await repository_clients.get_changes(since, limit, db)
+    if result is None:
+        raise HTTPException(status_code=status.HTTP_410_GONE,
+                            detail=f"Cursor is older than the {settings.changes_retention_days} days deletes are kept, "
+                                   f"sync again from the start without since")
+    changes, has_more = result
+    cursor = encode_cursor(*changes[-1][:2]) if changes else encode_cursor(*since) if since else None
+    return {"changes": [{"id": client_id, "deleted": client is None, "changed_at": changed_at, "client": client}
+                        for changed_at, client_id, client in changes],
+            "cursor": cursor, "has_more": has_more}
+
+
+@router.get("/events/", response_class=StreamingResponse,
+            dependencies=[Depends(access_get), Depends(HybridRateLimiter(times=5, seconds=60))],
+            description="No more than 5 connections per minute")
+async def client_events_stream(db: Session = Depends(get_read_db), _: User = Depends(auth_service.get_current_user)):
+    """
+    The client_events_stream function streams client mutations as Server-Sent Events:
+        event: client with data {"op": "created" | "updated" | "deleted", "id": ...} for every change, and
+        event: resync when events were lost, after which the client reloads what it shows.
+
+    :param db: Session: The session used by authentication, released before streaming
+    :param _: User: Get the current user from the auth_service
+    :return: A text/event-stream response
+    """
+    db.close()
+    return StreamingResponse(client_events.stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 
 @router.get("/{client_id}", response_model=ClientResponse,
-            dependencies=[Depends(access_get), Depends(RateLimiter(times=3, seconds=10))],
-            description="No more than 3 requests per 10 seconds")
-async def get_user(client_id: int = Path(ge=1), db: Session = Depends(get_db),
+            dependencies=[Depends(access_get), Depends(CostRateLimiter(cost=COST_CLIENT))],
+            description=f"Costs {COST_CLIENT} units of the per-user rate budget")
+async def get_user(client_id: int = Path(ge=1), db: Session = Depends(get_read_db),
+                   fields: tuple[str, ...] | None = Depends(client_fields),
                    _: User = Depends(auth_service.get_current_user)):
     """
     The get_user function is a GET request that returns the client with the given ID.
@@ -90,20 +275,41 @@ async def get_user(client_id: int = Path(ge=1), db: Session = Depends(get_db),
 
     :param client_id: int: Specify the client id that is passed in the url
     :param db: Session: Pass the database session to the repository function
+    :param fields: tuple[str, ...] | None: Columns to return instead of ClientResponse
     :param _: User: Get the current user from the auth_service
     :return: A client object
     """
-    client = await repository_clients.get_client(client_id, db)
+    client = await repository_clients.get_client(client_id, db, fields)
     if client is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Client not found")
-    return client
+    return projected(client) if fields else client
+
+
+@router.get("/{client_id}/audit", response_model=List[AuditEntryResponse],
+            dependencies=[Depends(access_delete), Depends(CostRateLimiter(cost=COST_CLIENTS))],
+            description=f"Costs {COST_CLIENTS} units of the per-user rate budget")
+async def get_client_audit(client_id: int = Path(ge=1), limit: int = Query(50, ge=1, le=500),
+                           before_id: int = Query(None, ge=1), db: Session = Depends(get_read_db),
+                           _: User = Depends(auth_service.get_current_user)):
+    """
+    The get_client_audit function returns who created, updated or deleted a client and what changed, newest first.
+        Pass the id of the last entry as before_id to get older entries. Deleted clients keep their audit log.
+
+    :param client_id: int: Id of the client
+    :param limit: int: Maximum number of entries returned
+    :param before_id: int: Return entries older than this one
+    :param db: Session: Pass the database session to the repository function
+    :param _: User: Get the current user from the auth_service
+    :return: A list of audit entries
+    """
+    return await repository_clients.get_client_audit(client_id, limit, before_id, db)
 
 
 @router.post("/", response_model=ClientResponse, status_code=status.HTTP_201_CREATED,
-             dependencies=[Depends(access_create),  Depends(RateLimiter(times=2, seconds=60))],
+             dependencies=[Depends(access_create),  Depends(HybridRateLimiter(times=2, seconds=60))],
              description="No more than 2 requests per minute")
 async def create_users(body: ClientModel, db: Session = Depends(get_db),
-                       _: User = Depends(auth_service.get_current_user)):
+                       current_user: User = Depends(auth_service.get_current_user)):
     """
     The create_users function creates a new user in the database.
         It takes an email, password, and phone number as input parameters.
@@ -111,7 +317,7 @@ async def create_users(body: ClientModel, db: Session = Depends(get_db),
 
     :param body: ClientModel: Get the data from the request body
     :param db: Session: Get the database session
-    :param _: User: Check if the user is logged in,
+    :param current_user: User: Check if the user is logged in, recorded in the audit log
     :return: A clientmodel object
     """
     client = await repository_clients.get_client_by_email(body.email, db)
@@ -120,15 +326,15 @@ async def create_users(body: ClientModel, db: Session = Depends(get_db),
     client = await repository_clients.get_client_by_phone(body.phone_number, db)
     if client:
         raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Client with this phone already exist")
-    client = await repository_clients.create_client(body, db)
+    client = await repository_clients.create_client(body, db, current_user)
     return client
 
 
 @router.put("/{client_id}", response_model=ClientResponse,
-            dependencies=[Depends(access_update), Depends(RateLimiter(times=3, seconds=10))],
+            dependencies=[Depends(access_update), Depends(HybridRateLimiter(times=3, seconds=10))],
             description="No more than 3 requests per 10 seconds")
 async def update_user(body: ClientModel, client_id: int = Path(ge=1), db: Session = Depends(get_db),
-                      _: User = Depends(auth_service.get_current_user)):
+                      current_user: User = Depends(auth_service.get_current_user)):
     """
     The update_user function updates a user in the database.
         The function takes an id, which is used to find the user in question, and a body of data that contains all of the
@@ -137,32 +343,32 @@ async def update_user(body: ClientModel, client_id: int = Path(ge=1), db: Sessio
     :param body: ClientModel: Pass the client data to the function
     :param client_id: int: Specify the id of the client to be deleted
     :param db: Session: Get the database session
-    :param _: User: Validate the user's token
+    :param current_user: User: Validate the user's token, recorded in the audit log
     :return: The updated user object
     """
-    client = await repository_clients.update_client(body, client_id, db)
+    client = await repository_clients.update_client(body, client_id, db, current_user)
     if client is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Client not found")
     return client
 
 
 @router.delete("/{client_id}", response_model=ClientResponse,
-               dependencies=[Depends(access_delete), Depends(RateLimiter(times=3, seconds=10))],
+               dependencies=[Depends(access_delete), Depends(HybridRateLimiter(times=3, seconds=10))],
                description="No more than 3 requests per 10 seconds")
 async def remove_user(client_id: int = Path(ge=1), db: Session = Depends(get_db),
-                      _: User = Depends(auth_service.get_current_user)):
+                      current_user: User = Depends(auth_service.get_current_user)):
     """
     The remove_user function is used to remove a user from the database.
         The function takes in an integer client_id, which is the id of the client that will be removed.
         It also takes in a Session object db, which represents our database session and allows us to interact with it.
-        Finally, it takes in an optional User object _ (which we don't use), but this parameter depends on another function called auth_service.get_current_user().
+        Finally, it takes in current_user, the user from auth_service.get_current_user(), recorded in the audit log.
 
     :param client_id: int: Specify the client to be removed
     :param db: Session: Access the database
-    :param _: User: Get the current user
+    :param current_user: User: Get the current user, recorded in the audit log
     :return: A client object
     """
-    client = await repository_clients.remove_client(client_id, db)
+    client = await repository_clients.remove_client(client_id, db, current_user)
     if client is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Client not found")
     return client
@@ -0,0 +1,30 @@
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+
+from src.services.health import readiness
+
+router = APIRouter(prefix="/health", tags=["health"])
+
+
+@router.get("/live")
+async def liveness():
+    """
+    The liveness function answers as long as the worker's event loop runs. It touches no dependency,
+    so a slow database or Redis never gets a healthy worker restarted.
+
+    :return: A dict with the status
+    """
+    return {"status": "alive"}
+
+
+@router.get("/ready")
+async def readiness_check():
+    """
+    The readiness_check function reports whether the worker should receive traffic: warm-up is done
+    and the critical dependencies answer. Degraded dependencies with a fallback keep it ready.
+    The report includes per-dependency latency and connection pool saturation.
+
+    :return: The readiness report, with status 503 when the worker is not ready
+    """
+    report = await readiness.get()
+    return JSONResponse(status_code=503 if report["status"] == "not_ready" else 200, content=report)
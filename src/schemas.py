@@ -1,4 +1,5 @@
-from datetime import date
+from datetime import date, datetime
+from typing import List, Any
 
 from pydantic import BaseModel, EmailStr, Field
 
@@ -22,10 +23,59 @@ class ClientResponse(BaseModel):
         orm_mode = True
 
 
+class ClientBatchResponse(BaseModel):
+    clients: List[ClientResponse]
+    missing: List[int]
+
+
+class ClientRecord(BaseModel):
+    id: int
+    firstname: str | None
+    lastname: str | None
+    email: str | None
+    phone_number: str | None
+    birthday: date | None
+    additional_data: str | None
+
+    class Config:
+        orm_mode = True
+
+
+class ClientChange(BaseModel):
+    id: int
+    deleted: bool
+    changed_at: datetime
+    client: ClientRecord | None
+
+
+class ClientChangesResponse(BaseModel):
+    changes: List[ClientChange]
+    cursor: str | None
+    has_more: bool
+
+
+class AuditEntryResponse(BaseModel):
+    id: int
+    client_id: int
+    action: str
+    user_id: int | None
+    changes: dict
+    created_at: datetime
+
+    class Config:
+        orm_mode = True
+
+
+class AutocompleteResponse(BaseModel):
+    id: int
+    firstname: str
+    lastname: str
+
+
 class BirthdayResponse(BaseModel):
     firstname: str
     lastname: str
-    birthday: str
+    birthday: date
     email: EmailStr
 
     class Config:
@@ -62,3 +112,24 @@ class ChangePassword(BaseModel):
     email: EmailStr
     password: str = Field(min_length=6, max_length=10)
     new_password: str = Field(min_length=6, max_length=10)
+
+
+class SubRequest(BaseModel):
+    id: str | None = None
+    method: str = Field("GET", regex="^(GET|POST|PUT|PATCH|DELETE)$")
+    path: str = Field(regex="^/api/", example="/api/clients/1")
+    body: Any = None
+
+
+class BatchRequest(BaseModel):
+    requests: List[SubRequest] = Field(min_items=1)
+
+
+class SubResponse(BaseModel):
+    id: str | None
+    status: int
+    body: Any
+
+
+class BatchResponse(BaseModel):
+    responses: List[SubResponse]
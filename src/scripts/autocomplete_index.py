@@ -0,0 +1,38 @@
+"""
+Rebuilds the Redis prefix index of client names used by /api/clients/autocomplete/.
+
+Client create, update and delete keep the index current; run this once after deploying the
+autocomplete endpoint, after bulk loads that bypass the API (e.g. src.scripts.seed) and after
+Redis lost its data. Until the index is built the endpoint answers from the database.
+
+    python -m src.scripts.autocomplete_index
+"""
+import time
+import argparse
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from src.conf.config import settings
+from src.services.autocomplete import autocomplete_index
+
+
+def main(argv: list[str] = None):
+    parser = argparse.ArgumentParser(description="Rebuild the Redis prefix index of client names.")
+    parser.add_argument("--database-url", default=settings.database_url)
+    parser.add_argument("--batch", type=int, default=10_000)
+    args = parser.parse_args(argv)
+
+    engine = create_engine(args.database_url)
+    db = sessionmaker(bind=engine)()
+    start = time.perf_counter()
+    try:
+        count = autocomplete_index.rebuild(db, args.batch)
+    finally:
+        db.close()
+        engine.dispose()
+    print(f"indexed {count} clients in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
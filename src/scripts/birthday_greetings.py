@@ -0,0 +1,316 @@
+"""
+Daily birthday greetings job.
+
+Streams the clients whose birthday is today in chunks, renders the emails of each chunk at once
+and sends them over a few SMTP connections that stay open for the whole run. Every sent greeting
+is recorded in the greetings table, so a run that crashed or was stopped can simply be started
+again: it only greets the clients it missed. Schedule it once a day, e.g. from cron:
+
+    0 9 * * * cd /app && python -m src.scripts.birthday_greetings
+    python -m src.scripts.birthday_greetings --dry-run --date 2024-02-29
+"""
+import time
+import asyncio
+import logging
+import argparse
+
+from datetime import date, datetime
+from email.message import EmailMessage
+from email.utils import formataddr
+
+from sqlalchemy import create_engine
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+from sqlalchemy.orm import Session, sessionmaker
+
+from src.conf.config import settings
+from src.repository import clients as repository_clients
+from src.services.email import TEMPLATE_FOLDER, mail_config
+from src.services.metrics import EMAIL_SEND_DURATION
+from src.services.resilience import smtp_breaker, DependencyUnavailable
+
+logger = logging.getLogger(__name__)
+
+TEMPLATE = "birthday_email.html"
+
+
+class SMTPStandIn:
+    """
+    Local SMTP server that accepts every message and keeps it in memory instead of delivering it.
+    It speaks just enough SMTP for aiosmtplib: EHLO/HELO, MAIL, RCPT, DATA, RSET, NOOP and QUIT.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        self.host = host
+        self.port = port
+        self.messages = []
+        self.connections = 0
+        self.server = None
+
+    async def __aenter__(self):
+        self.server = await asyncio.start_server(self._session, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self
+
+    async def __aexit__(self, *exc):
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def _session(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.connections += 1
+        sender, recipients = None, []
+        writer.write(b"220 stand-in ESMTP\r\n")
+        while line := await reader.readline():
+            command = line.decode().strip()
+            verb = command[:4].upper()
+            if verb in ("EHLO", "HELO"):
+                writer.write(b"250-stand-in\r\n250 8BITMIME\r\n")
+            elif verb == "MAIL":
+                sender, recipients = command[10:].split()[0].strip("<>"), []
+                writer.write(b"250 OK\r\n")
+            elif verb == "RCPT":
+                recipients.append(command[8:].split()[0].strip("<>"))
+                writer.write(b"250 OK\r\n")
+            elif verb == "DATA":
+                writer.write(b"354 End data with <CR><LF>.<CR><LF>\r\n")
+                await writer.drain()
+                data = []
+                while (chunk := await reader.readline()) not in (b".\r\n", b""):
+                    data.append(chunk)
+                self.messages.append((sender, recipients, b"".join(data)))
+                writer.write(b"250 OK\r\n")
+            elif verb in ("RSET", "NOOP"):
+                writer.write(b"250 OK\r\n")
+            elif verb == "QUIT":
+                writer.write(b"221 Bye\r\n")
+                await writer.drain()
+                break
+            else:
+                writer.write(b"502 Command not implemented\r\n")
+            await writer.drain()
+        writer.close()
+
+    def config(self):
+        """
+        The config function returns SMTP settings that point at the stand-in.
+
+        :param self: Represent the instance of the class
+        :return: A fastapi_mail ConnectionConfig
+        """
+        from fastapi_mail import ConnectionConfig
+
+        return ConnectionConfig(MAIL_USERNAME="stand-in", MAIL_PASSWORD="stand-in", MAIL_FROM=settings.mail_from,
+                                MAIL_PORT=self.port, MAIL_SERVER=self.host, MAIL_FROM_NAME=settings.greetings_from_name,
+                                MAIL_STARTTLS=False, MAIL_SSL_TLS=False, USE_CREDENTIALS=False,
+                                VALIDATE_CERTS=False, TEMPLATE_FOLDER=TEMPLATE_FOLDER,
+                                TIMEOUT=settings.smtp_timeout_seconds)
+
+
+class GreetingJob:
+    """
+    One run of the birthday greetings for a day.
+
+    A producer loads chunks of clients by id and renders their emails into a bounded queue,
+    and ``concurrency`` senders take messages off the queue, each over its own SMTP connection
+    that is opened once and reopened only after an error. A greeting is recorded as soon as its
+    message is accepted, so at most the messages in flight can be sent twice after a crash.
+    """
+
+    def __init__(self, db: Session, config, today: date, chunk: int = None, concurrency: int = None,
+                 record: bool = True):
+        """
+        The __init__ function prepares a run.
+
+        :param self: Represent the instance of the class
+        :param db: Session: Database session used to load clients and record greetings
+        :param config: ConnectionConfig: SMTP settings
+        :param today: date: The day of the birthdays
+        :param chunk: int: Clients loaded and rendered at once
+        :param concurrency: int: Number of SMTP connections sending in parallel
+        :param record: bool: Record sent greetings, off for dry runs
+        :return: None
+        """
+        self.db = db
+        self.config = config
+        self.today = today
+        self.chunk = chunk or settings.greetings_chunk_size
+        self.concurrency = concurrency or settings.greetings_concurrency
+        self.record = record
+        self.template = config.template_engine().get_template(TEMPLATE)
+        # the producer and the senders share one session, which must not run two statements at once
+        self.db_lock = asyncio.Lock()
+        self.queued = self.sent = self.failed = self.unrecorded = 0
+
+    def render(self, client) -> EmailMessage:
+        message = EmailMessage()
+        message["From"] = formataddr((settings.greetings_from_name, self.config.MAIL_FROM))
+        message["To"] = client.email
+        message["Subject"] = f"Happy birthday, {client.firstname}!"
+        message.set_content(self.template.render(firstname=client.firstname, lastname=client.lastname),
+                            subtype="html")
+        return message
+
+    async def chunks(self):
+        """
+        The chunks function yields the messages to send in chunks of self.chunk clients, paging by id.
+        A chunk is rendered under db_lock: a commit by a sender expires the loaded clients, and reading
+        them again must not run while a sender commits on the shared session.
+
+        :param self: Represent the instance of the class
+        :return: An async iterator of lists of (client id, message)
+        """
+        after_id = 0
+        while True:
+            async with self.db_lock:
+                clients = await repository_clients.get_birthday_clients(self.today, after_id, self.chunk, self.db)
+                messages = [(client.id, self.render(client)) for client in clients]
+            if not messages:
+                return
+            yield messages
+            after_id = messages[-1][0]
+
+    async def _connect(self):
+        from fastapi_mail.connection import Connection
+
+        return await Connection(self.config).__aenter__()
+
+    @staticmethod
+    async def _close(connection):
+        try:
+            await connection.session.quit()
+        except Exception:
+            connection.session.close()
+
+    async def _send(self, queue: asyncio.Queue):
+        from aiosmtplib import SMTPException
+        from fastapi_mail.errors import ConnectionErrors
+
+        connection = None
+        try:
+            while (item := await queue.get()) is not None:
+                client_id, message = item
+                try:
+                    if connection is None:
+                        connection = await smtp_breaker.call_async(self._connect, timeout=self.config.TIMEOUT)
+                    with EMAIL_SEND_DURATION.labels(TEMPLATE).time():
+                        await smtp_breaker.call_async(connection.session.send_message, message,
+                                                      timeout=self.config.TIMEOUT)
+                except (ConnectionErrors, SMTPException, OSError, DependencyUnavailable, asyncio.TimeoutError) as error:
+                    self.failed += 1
+                    logger.warning("Greeting of client %s failed: %r", client_id, error)
+                    if connection is not None and not isinstance(error, DependencyUnavailable):
+                        await self._close(connection)
+                        connection = None
+                    continue
+                if self.record:
+                    async with self.db_lock:
+                        try:
+                            await repository_clients.record_greeting(client_id, self.today, self.db)
+                        except IntegrityError:
+                            # Another run recorded this client first; keep going with the rest of the day.
+                            self.db.rollback()
+                            logger.warning("Greeting of client %s was already recorded", client_id)
+                            continue
+                        except SQLAlchemyError as error:
+                            # The message went out but a resumed run will send it again; the sender keeps going.
+                            self.db.rollback()
+                            self.unrecorded += 1
+                            logger.error("Greeting of client %s was sent but not recorded: %r", client_id, error)
+                            continue
+                self.sent += 1
+        finally:
+            if connection is not None:
+                await self._close(connection)
+
+    @staticmethod
+    async def _put(queue: asyncio.Queue, item, senders: list[asyncio.Task]):
+        """
+        The _put function puts an item on the queue. When the queue is full it waits for room, but gives up
+        if a sender stops meanwhile: senders only stop on the end marker or on an error, and without them
+        nothing would ever make room.
+
+        :param queue: asyncio.Queue: The message queue
+        :param item: The item to put
+        :param senders: list[asyncio.Task]: The sender tasks
+        :return: None
+        """
+        if not queue.full():
+            queue.put_nowait(item)
+            return
+        put = asyncio.ensure_future(queue.put(item))
+        done, _ = await asyncio.wait([put, *senders], return_when=asyncio.FIRST_COMPLETED)
+        if put not in done:
+            put.cancel()
+            stopped = next(sender for sender in senders if sender.done())
+            if not stopped.cancelled() and stopped.exception() is not None:
+                raise stopped.exception()
+            raise RuntimeError("A greeting sender stopped before the end of the run")
+
+    async def run(self) -> dict:
+        """
+        The run function greets every client with a birthday today that has not been greeted yet.
+
+        :param self: Represent the instance of the class
+        :return: A dict with the queued, sent, failed and unrecorded counts, elapsed seconds and messages per second
+        """
+        start = time.perf_counter()
+        queue = asyncio.Queue(maxsize=self.chunk)
+        senders = [asyncio.create_task(self._send(queue)) for _ in range(self.concurrency)]
+        try:
+            async for messages in self.chunks():
+                for item in messages:
+                    await self._put(queue, item, senders)
+                    self.queued += 1
+            for _ in senders:
+                await self._put(queue, None, senders)
+            await asyncio.gather(*senders)
+        finally:
+            for sender in senders:
+                sender.cancel()
+        seconds = time.perf_counter() - start
+        return {"queued": self.queued, "sent": self.sent, "failed": self.failed, "unrecorded": self.unrecorded,
+                "seconds": seconds, "rate": self.sent / seconds if seconds else 0.0}
+
+
+async def greet(db: Session, today: date, chunk: int = None, concurrency: int = None, dry_run: bool = False) -> dict:
+    """
+    The greet function runs the job against the configured SMTP server, or with dry_run against a local
+    stand-in without recording anything.
+
+    :param db: Session: Database session
+    :param today: date: The day of the birthdays
+    :param chunk: int: Clients loaded and rendered at once
+    :param concurrency: int: Number of SMTP connections
+    :param dry_run: bool: Send to a local SMTP stand-in and do not record greetings
+    :return: The job report
+    """
+    if not dry_run:
+        return await GreetingJob(db, mail_config(), today, chunk, concurrency).run()
+    async with SMTPStandIn() as stand_in:
+        result = await GreetingJob(db, stand_in.config(), today, chunk, concurrency, record=False).run()
+    return {**result, "delivered": len(stand_in.messages), "connections": stand_in.connections}
+
+
+def main(argv: list[str] = None):
+    parser = argparse.ArgumentParser(description="Send today's birthday greetings to clients.")
+    parser.add_argument("--database-url", default=settings.database_url)
+    parser.add_argument("--date", type=date.fromisoformat, default=datetime.now().date(),
+                        help="day of the birthdays, YYYY-MM-DD")
+    parser.add_argument("--chunk", type=int, default=settings.greetings_chunk_size)
+    parser.add_argument("--concurrency", type=int, default=settings.greetings_concurrency)
+    parser.add_argument("--dry-run", action="store_true", help="send to a local SMTP stand-in, record nothing")
+    args = parser.parse_args(argv)
+
+    engine = create_engine(args.database_url)
+    db = sessionmaker(bind=engine)()
+    try:
+        result = asyncio.run(greet(db, args.date, args.chunk, args.concurrency, args.dry_run))
+    finally:
+        db.close()
+        engine.dispose()
+    print(f"{'dry run: ' if args.dry_run else ''}sent {result['sent']} of {result['queued']} greetings, "
+          f"{result['failed']} failed, {result['unrecorded']} not recorded, in {result['seconds']:.1f}s ({result['rate']:,.1f} messages/s)")
+    return result
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+"""
+Synthetic data generator for benchmark and staging databases.
+
+Generates clients and users deterministically for a given seed and bulk-loads them with
+COPY on PostgreSQL and executemany on SQLite.
+
+    python -m src.scripts.seed --clients 1000000 --users 1000 --seed 42
+    python -m src.scripts.seed --database-url sqlite:///./staging.db --clients 100000 --offset 100000
+"""
+import io
+import csv
+import time
+import random
+import argparse
+
+from datetime import date, datetime
+
+from sqlalchemy import create_engine
+from sqlalchemy.engine import Engine
+
+from src.conf.config import settings
+from src.database.models import Base, Role
+from src.services.auth import auth_service
+
+FIRSTNAMES = (
+    "Ivan", "Petro", "Mykola", "Oleksandr", "Andrii", "Dmytro", "Serhii", "Yurii", "Taras", "Bohdan",
+    "Olena", "Iryna", "Natalia", "Oksana", "Tetiana", "Svitlana", "Mariia", "Anna", "Yuliia", "Kateryna",
+    "John", "Michael", "David", "James", "Robert", "Mary", "Linda", "Susan", "Karen", "Emma",
+)
+LASTNAMES = (
+    "Shevchenko", "Bondarenko", "Kovalenko", "Tkachenko", "Kravchenko", "Oliinyk", "Shevchuk", "Polishchuk",
+    "Koval", "Bondar", "Melnyk", "Boiko", "Tkachuk", "Marchenko", "Savchenko", "Rudenko", "Moroz", "Lysenko",
+    "Smith", "Johnson", "Williams", "Brown", "Jones", "Miller", "Davis", "Wilson", "Taylor", "Anderson",
+)
+DOMAINS = ("gmail.com", "ukr.net", "meta.ua", "i.ua", "example.com")
+OPERATORS = ("50", "63", "66", "67", "68", "73", "93", "95", "96", "97", "98", "99")
+ROLE_WEIGHTS = ((Role.admin.name, 5), (Role.moderator.name, 15), (Role.user.name, 80))
+
+BIRTHDAY_FIRST = date(1950, 1, 1).toordinal()
+BIRTHDAY_SPAN = date(2006, 12, 31).toordinal() - BIRTHDAY_FIRST
+PHONE_SPACE = 10 ** 7
+PHONE_STRIDE = 7_919_993
+
+CLIENT_COLUMNS = ("firstname", "lastname", "email", "phone_number", "birthday", "additional_data",
+                  "created_at", "updated_at")
+USER_COLUMNS = ("username", "email", "password", "avatar", "role", "confirmed")
+
+
+def phone_number(index: int) -> str:
+    """
+    The phone_number function maps a row index to a unique Ukrainian mobile number in the canonical
+    +380XXXXXXXXX form accepted by Client.validate_phone_number. The subscriber part is a permutation
+    of the index, so consecutive rows do not get consecutive numbers.
+
+    :param index: int: Row index, unique up to len(OPERATORS) * 10 ** 7
+    :return: The phone number
+    """
+    operator = OPERATORS[index % len(OPERATORS)]
+    subscriber = (index // len(OPERATORS) * PHONE_STRIDE) % PHONE_SPACE
+    return f"+380{operator}{subscriber:07d}"
+
+
+def generate_clients(rng: random.Random, start: int, count: int, now: datetime) -> list[tuple]:
+    """
+    The generate_clients function builds one batch of client rows.
+
+    :param rng: random.Random: Seeded source of randomness
+    :param start: int: Index of the first row, used to keep emails and phones unique
+    :param count: int: Number of rows
+    :param now: datetime: Value of created_at and updated_at
+    :return: A list of tuples in CLIENT_COLUMNS order
+    """
+    firstnames = rng.choices(FIRSTNAMES, k=count)
+    lastnames = rng.choices(LASTNAMES, k=count)
+    domains = rng.choices(DOMAINS, k=count)
+    birthdays = [date.fromordinal(BIRTHDAY_FIRST + offset) for offset in rng.choices(range(BIRTHDAY_SPAN), k=count)]
+    return [
+        (first, last, f"{first.lower()}.{last.lower()}.{index}@{domain}", phone_number(index), birthday, "", now, now)
+        for index, first, last, domain, birthday
+        in zip(range(start, start + count), firstnames, lastnames, domains, birthdays)
+    ]
+
+
+def generate_users(rng: random.Random, start: int, count: int, password_hash: str) -> list[tuple]:
+    """
+    The generate_users function builds one batch of confirmed users sharing one pre-hashed password.
+
+    :param rng: random.Random: Seeded source of randomness
+    :param start: int: Index of the first row, used to keep emails unique
+    :param count: int: Number of rows
+    :param password_hash: str: bcrypt hash stored for every user
+    :return: A list of tuples in USER_COLUMNS order
+    """
+    names, weights = zip(*ROLE_WEIGHTS)
+    roles = rng.choices(names, weights, k=count)
+    return [
+        (f"user{index}", f"user{index}@example.com", password_hash, f"https://www.gravatar.com/avatar/{index:032x}",
+         role, True)
+        for index, role in zip(range(start, start + count), roles)
+    ]
+
+
+def bulk_load(engine: Engine, table: str, columns: tuple, rows: list[tuple]):
+    """
+    The bulk_load function inserts rows with COPY on PostgreSQL and executemany elsewhere.
+
+    :param engine: Engine: Target database
+    :param table: str: Table name
+    :param columns: tuple: Column names in row order
+    :param rows: list[tuple]: Rows to insert
+    :return: None
+    """
+    connection = engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        if engine.dialect.name == "postgresql":
+            buffer = io.StringIO()
+            csv.writer(buffer).writerows(rows)
+            buffer.seek(0)
+            cursor.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", buffer)
+        else:
+            placeholders = ", ".join("?" if engine.dialect.paramstyle == "qmark" else "%s" for _ in columns)
+            cursor.executemany(f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders})", rows)
+        cursor.close()
+        connection.commit()
+    finally:
+        connection.close()
+
+
+def seed(engine: Engine, clients: int, users: int, seed_value: int = 42, offset: int = 0, batch: int = 50_000,
+         password: str = "secret123", progress=None) -> dict:
+    """
+    The seed function creates missing tables and loads the requested number of clients and users.
+    The same seed, offset and counts always produce the same rows.
+
+    :param engine: Engine: Target database
+    :param clients: int: Number of clients to generate
+    :param users: int: Number of users to generate
+    :param seed_value: int: Seed of the generator
+    :param offset: int: Index of the first generated row, use it when appending to a seeded database
+    :param batch: int: Rows generated and loaded at once
+    :param password: str: Plain password of every generated user
+    :param progress: Optional callable receiving (table, rows_done)
+    :return: A dict with row counts and elapsed seconds
+    """
+    Base.metadata.create_all(bind=engine)
+    rng = random.Random(seed_value)
+    now = datetime(2024, 1, 1)
+    start = time.perf_counter()
+    password_hash = auth_service.get_password_hash(password)
+    for first in range(offset, offset + users, batch):
+        count = min(batch, offset + users - first)
+        bulk_load(engine, "users", USER_COLUMNS, generate_users(rng, first, count, password_hash))
+        if progress:
+            progress("users", first + count - offset)
+    for first in range(offset, offset + clients, batch):
+        count = min(batch, offset + clients - first)
+        bulk_load(engine, "clients", CLIENT_COLUMNS, generate_clients(rng, first, count, now))
+        if progress:
+            progress("clients", first + count - offset)
+    return {"clients": clients, "users": users, "seconds": time.perf_counter() - start}
+
+
+def main(argv: list[str] = None):
+    parser = argparse.ArgumentParser(description="Generate and bulk-load synthetic clients and users.")
+    parser.add_argument("--database-url", default=settings.database_url)
+    parser.add_argument("--clients", type=int, default=100_000)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--offset", type=int, default=0, help="index of the first row when appending")
+    parser.add_argument("--batch", type=int, default=50_000)
+    parser.add_argument("--password", default="secret123", help="plain password of every generated user")
+    args = parser.parse_args(argv)
+
+    engine = create_engine(args.database_url)
+
+    def progress(table, done):
+        print(f"\r{table}: {done} rows", end="", flush=True)
+
+    result = seed(engine, args.clients, args.users, args.seed, args.offset, args.batch, args.password, progress)
+    rate = (result["clients"] + result["users"]) / result["seconds"] * 60
+    print(f"\nloaded {result['clients']} clients and {result['users']} users in {result['seconds']:.1f}s "
+          f"({rate:,.0f} rows/min)")
+
+
+if __name__ == "__main__":
+    main()
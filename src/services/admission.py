@@ -0,0 +1,195 @@
+import time
+import asyncio
+
+from collections import deque
+
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from src.conf.config import settings
+from src.services.metrics import ADMISSION_IN_FLIGHT, ADMISSION_LIMIT, ADMISSION_QUEUE_TIME, ADMISSION_REJECTIONS
+
+# (methods, path prefix, group); the first match wins, unmatched requests and group None are not limited
+ROUTE_GROUPS = (
+    (frozenset({"POST"}), "/api/auth/", "auth"),
+    (frozenset({"PATCH"}), "/api/users/avatar", "uploads"),
+    (frozenset({"GET"}), "/api/clients/events", None),
+    (frozenset({"GET"}), "/api/clients", "reads"),
+    (frozenset({"POST", "PUT", "PATCH", "DELETE"}), "/api/", "writes"),
+)
+
+REJECT_BODY = b'{"detail":"Server is overloaded, try again later"}'
+
+
+def route_group(method: str, path: str) -> str | None:
+    """
+    The route_group function maps a request to its admission group.
+
+    :param method: str: HTTP method
+    :param path: str: Request path
+    :return: The group name, or None when the request is not limited
+    """
+    for methods, prefix, group in ROUTE_GROUPS:
+        if method in methods and path.startswith(prefix):
+            return group
+    return None
+
+
+class AdaptiveLimiter:
+    """
+    Concurrency limit of one route group with a bounded FIFO wait queue.
+
+    The limit adapts with AIMD: every request finishing within the target latency while the limit
+    is in use adds 1 / limit (about +1 per round trip of the whole window), and a request slower
+    than the target multiplies the limit by ``backoff``, at most once per target interval so that
+    one burst of slow requests does not collapse it to the minimum.
+    """
+
+    def __init__(self, name: str, limit: int, max_limit: int, target: float, queue_size: int, queue_timeout: float,
+                 min_limit: int = 1, backoff: float = 0.9):
+        """
+        The __init__ function sets the initial limit and the queue bounds.
+
+        :param self: Represent the instance of the class
+        :param name: str: Route group, used as the metrics label
+        :param limit: int: Initial concurrency limit
+        :param max_limit: int: Upper bound of the adaptive limit
+        :param target: float: Target latency in seconds
+        :param queue_size: int: Number of requests allowed to wait for a slot
+        :param queue_timeout: float: Seconds a request may wait before it is rejected
+        :param min_limit: int: Lower bound of the adaptive limit
+        :param backoff: float: Multiplicative decrease factor
+        :return: None
+        """
+        self.name = name
+        self.limit = float(limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.target = target
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.backoff = backoff
+        self.in_flight = 0
+        self.waiters = deque()
+        self.decreased_at = 0.0
+        ADMISSION_LIMIT.labels(name).set(self.limit)
+
+    def _has_capacity(self) -> bool:
+        return self.in_flight < int(self.limit)
+
+    async def acquire(self) -> str | None:
+        """
+        The acquire function takes a slot, waiting in the queue when the limit is reached.
+
+        :param self: Represent the instance of the class
+        :return: None when admitted, otherwise the rejection reason: "queue_full" or "queue_timeout"
+        """
+        if self._has_capacity() and not self.waiters:
+            self._enter()
+            return None
+        if len(self.waiters) >= self.queue_size:
+            return "queue_full"
+        waiter = asyncio.get_running_loop().create_future()
+        self.waiters.append(waiter)
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), self.queue_timeout)
+        except asyncio.TimeoutError:
+            if waiter.done() and not waiter.cancelled():
+                self._release_slot()
+            return "queue_timeout"
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self._release_slot()
+            raise
+        finally:
+            if not waiter.done():
+                waiter.cancel()
+            try:
+                self.waiters.remove(waiter)
+            except ValueError:
+                pass
+            ADMISSION_QUEUE_TIME.labels(self.name).observe(time.perf_counter() - start)
+        return None
+
+    def _enter(self):
+        self.in_flight += 1
+        ADMISSION_IN_FLIGHT.labels(self.name).set(self.in_flight)
+
+    def _release_slot(self):
+        self.in_flight -= 1
+        ADMISSION_IN_FLIGHT.labels(self.name).set(self.in_flight)
+        self._wake()
+
+    def _wake(self):
+        while self.waiters and self._has_capacity():
+            waiter = self.waiters.popleft()
+            if not waiter.done():
+                self._enter()
+                waiter.set_result(None)
+
+    def release(self, latency: float):
+        """
+        The release function frees the slot and adapts the limit to the observed latency.
+
+        :param self: Represent the instance of the class
+        :param latency: float: Seconds the request took once admitted
+        :return: None
+        """
+        now = time.monotonic()
+        if latency > self.target:
+            if now - self.decreased_at >= self.target:
+                self.limit = max(self.min_limit, self.limit * self.backoff)
+                self.decreased_at = now
+        elif self.in_flight >= int(self.limit):
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+        ADMISSION_LIMIT.labels(self.name).set(self.limit)
+        self._release_slot()
+
+    @property
+    def retry_after(self) -> int:
+        return max(1, round(self.queue_timeout + self.target))
+
+
+class AdmissionMiddleware:
+    """
+    ASGI middleware that sheds load before it reaches the database pool, bcrypt and Redis.
+
+    Requests are grouped by ``ROUTE_GROUPS`` and each group has its own AdaptiveLimiter. A request
+    that finds the group at its limit waits in a bounded queue for at most ``admission_queue_ms``;
+    when the queue is full or the wait runs out it is rejected with 503 and Retry-After.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        self.limiters = {
+            group: AdaptiveLimiter(group, limit, settings.admission_max_limits.get(group, limit),
+                                   settings.admission_target_ms.get(group, 500) / 1000,
+                                   settings.admission_queue_size, settings.admission_queue_ms / 1000)
+            for group, limit in settings.admission_limits.items()
+        }
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        limiter = None
+        if scope["type"] == "http" and settings.admission_enabled:
+            limiter = self.limiters.get(route_group(scope["method"], scope["path"]))
+        if limiter is None:
+            await self.app(scope, receive, send)
+            return
+        reason = await limiter.acquire()
+        if reason is not None:
+            ADMISSION_REJECTIONS.labels(limiter.name, reason).inc()
+            await self._reject(send, limiter.retry_after)
+            return
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            limiter.release(time.perf_counter() - start)
+
+    @staticmethod
+    async def _reject(send: Send, retry_after: int):
+        await send({"type": "http.response.start", "status": 503,
+                    "headers": [(b"content-type", b"application/json"),
+                                (b"content-length", str(len(REJECT_BODY)).encode()),
+                                (b"retry-after", str(retry_after).encode())]})
+        await send({"type": "http.response.body", "body": REJECT_BODY})
@@ -0,0 +1,198 @@
+import json
+import asyncio
+import logging
+
+from collections import deque
+from datetime import date, datetime
+
+import redis
+from sqlalchemy import insert
+
+from src.conf.config import settings
+from src.database.db import SessionLocal
+from src.database.models import AuditEntry
+from src.services.auth import auth_service
+from src.services.metrics import AUDIT_FLUSH_DURATION, AUDIT_DROPPED
+from src.services.resilience import redis_breaker, DependencyUnavailable
+
+logger = logging.getLogger(__name__)
+
+AUDITED_FIELDS = ("firstname", "lastname", "email", "phone_number", "birthday", "additional_data")
+STREAM = "audit:clients"
+GROUP = "audit-writers"
+# entries read by a worker that died before inserting them are adopted by another after this idle time
+CLAIM_IDLE_MS = 60_000
+
+
+def snapshot(client) -> dict:
+    return {name: _plain(getattr(client, name)) for name in AUDITED_FIELDS}
+
+
+def _plain(value):
+    return value.isoformat() if isinstance(value, date) else value
+
+
+def diff(before: dict | None, after: dict | None) -> dict:
+    """
+    The diff function returns the audited fields that differ between two snapshots of a client.
+
+    :param before: dict | None: Snapshot before the change, None for a new client
+    :param after: dict | None: Snapshot after the change, None for a deleted client
+    :return: A dict of field to [old, new] values
+    """
+    before, after = before or {}, after or {}
+    return {name: [before.get(name), after.get(name)] for name in AUDITED_FIELDS
+            if before.get(name) != after.get(name)}
+
+
+class AuditLog:
+    """
+    Write-behind audit log of client mutations.
+
+    record only appends to a buffer: this worker's memory, or with audit_backend "redis" a Redis
+    stream shared by the workers, which survives a worker crash. run flushes the buffer with one
+    bulk insert whenever it holds audit_batch_size entries or every audit_flush_seconds, so
+    entries reach the audit_log table with that delay. The memory buffer keeps at most
+    audit_buffer_max entries while the database is unavailable and drops the oldest beyond that.
+    Entries of the Redis stream are deleted only after they are inserted, so a crash between the
+    two inserts them twice rather than losing them.
+    """
+
+    def __init__(self, backend: str = None, session_factory=SessionLocal):
+        """
+        The __init__ function sets up an empty buffer.
+
+        :param self: Represent the instance of the class
+        :param backend: str: memory or redis, settings.audit_backend by default
+        :param session_factory: Creates the sessions of the bulk inserts
+        :return: None
+        """
+        self.backend = backend or settings.audit_backend
+        self.session_factory = session_factory
+        self.buffer = deque()
+        self.wake = None
+        self.consumer = f"worker-{id(self)}"
+        self.group_ready = False
+
+    @property
+    def r(self):
+        return auth_service.r
+
+    def record(self, action: str, client_id: int, actor_id: int | None, changes: dict):
+        """
+        The record function buffers one audit entry; it never touches the database.
+
+        :param self: Represent the instance of the class
+        :param action: str: created, updated or deleted
+        :param client_id: int: Id of the client
+        :param actor_id: int | None: Id of the user who made the change
+        :param changes: dict: Changed fields, see diff
+        :return: None
+        """
+        entry = {"client_id": client_id, "action": action, "user_id": actor_id, "changes": changes,
+                 "created_at": datetime.now().isoformat()}
+        if self.backend == "redis":
+            try:
+                redis_breaker.call(self.r.xadd, STREAM, {"entry": json.dumps(entry)})
+                return
+            except (redis.RedisError, DependencyUnavailable):
+                logger.warning("Audit stream is unavailable, buffering the entry in memory")
+        self.buffer.append(entry)
+        if len(self.buffer) > settings.audit_buffer_max:
+            self.buffer.popleft()
+            AUDIT_DROPPED.labels().inc()
+        if self.wake is not None and len(self.buffer) >= settings.audit_batch_size:
+            self.wake.set()
+
+    def _insert(self, entries: list[dict]):
+        rows = [{**entry, "created_at": datetime.fromisoformat(entry["created_at"])} for entry in entries]
+        with AUDIT_FLUSH_DURATION.labels().time():
+            with self.session_factory() as db:
+                db.execute(insert(AuditEntry), rows)
+                db.commit()
+
+    async def flush_memory(self) -> int:
+        entries = [self.buffer.popleft() for _ in range(min(len(self.buffer), settings.audit_batch_size))]
+        if not entries:
+            return 0
+        try:
+            await asyncio.to_thread(self._insert, entries)
+        except Exception:
+            self.buffer.extendleft(reversed(entries))
+            raise
+        return len(entries)
+
+    def _read_stream(self) -> list[tuple]:
+        if not self.group_ready:
+            try:
+                self.r.xgroup_create(STREAM, GROUP, id="0", mkstream=True)
+            except redis.ResponseError as error:
+                if "BUSYGROUP" not in str(error):
+                    raise
+            self.group_ready = True
+        _, messages, *_ = self.r.xautoclaim(STREAM, GROUP, self.consumer, CLAIM_IDLE_MS,
+                                            count=settings.audit_batch_size)
+        if not messages:
+            messages = (self.r.xreadgroup(GROUP, self.consumer, {STREAM: ">"}, count=settings.audit_batch_size)
+                        or [(STREAM, [])])[0][1]
+        return messages
+
+    async def flush_stream(self) -> int:
+        messages = redis_breaker.call(self._read_stream)
+        if not messages:
+            return 0
+        await asyncio.to_thread(self._insert, [json.loads(fields[b"entry"]) for _, fields in messages])
+        ids = [message_id for message_id, _ in messages]
+        pipe = self.r.pipeline(transaction=False)
+        pipe.xack(STREAM, GROUP, *ids)
+        pipe.xdel(STREAM, *ids)
+        redis_breaker.call(pipe.execute)
+        return len(messages)
+
+    async def flush(self) -> int:
+        """
+        The flush function inserts the buffered entries, one bulk insert per audit_batch_size entries.
+
+        :param self: Represent the instance of the class
+        :return: The number of entries inserted
+        """
+        if self.wake is not None:
+            self.wake.clear()
+        count = 0
+        while flushed := await self.flush_memory():
+            count += flushed
+        if self.backend == "redis":
+            while flushed := await self.flush_stream():
+                count += flushed
+        return count
+
+    async def run(self):
+        """
+        The run function flushes the buffer on size or time until it is cancelled, and once more then.
+
+        :param self: Represent the instance of the class
+        :return: None
+        """
+        # An Event is bound to the loop that first waits on it, so every run gets its own.
+        self.wake = asyncio.Event()
+        if len(self.buffer) >= settings.audit_batch_size:
+            self.wake.set()
+        try:
+            while True:
+                try:
+                    await asyncio.wait_for(self.wake.wait(), settings.audit_flush_seconds)
+                except asyncio.TimeoutError:
+                    pass
+                try:
+                    await self.flush()
+                except Exception as error:
+                    logger.warning("Audit flush failed, retrying later: %r", error)
+        finally:
+            try:
+                await self.flush()
+            except Exception as error:
+                logger.error("Final audit flush failed, %s entries lost: %r", len(self.buffer), error)
+            self.wake = None
+
+
+audit_log = AuditLog()
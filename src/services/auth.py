@@ -1,26 +1,51 @@
 import redis
 import pickle
+import logging
 
 from typing import Optional
+from contextvars import ContextVar
 
 from jose import JWTError, jwt
 from fastapi import HTTPException, status, Depends
 from fastapi.security import OAuth2PasswordBearer
-from passlib.context import CryptContext
 from datetime import datetime, timedelta
 from sqlalchemy.orm import Session
 
-from src.database.db import get_db
+from src.database.db import get_read_db
 from src.repository import users as repository_users
 from src.conf.config import settings
+from src.services.metrics import USER_CACHE, PASSWORD_HASH_DURATION
+from src.services.resilience import redis_breaker, DependencyUnavailable
+
+logger = logging.getLogger(__name__)
+
+# user of a /api/batch request, authenticated once for all its sub-requests
+batch_user: ContextVar = ContextVar("batch_user", default=None)
 
 
 class Auth:
-    pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+    _pwd_context = None
+    ACTIVE_USERS_KEY = "users:active"
     SECRET_KEY = settings.secret_key
     ALGORITHM = settings.algorithm
     oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")
-    r = redis.Redis(host=settings.redis_host, port=settings.redis_port, db=0)
+    r = redis.Redis(host=settings.redis_host, port=settings.redis_port, db=0,
+                    socket_timeout=settings.redis_timeout_ms / 1000,
+                    socket_connect_timeout=settings.redis_timeout_ms / 1000)
+
+    @property
+    def pwd_context(self):
+        """
+        The pwd_context property creates the passlib context on first use, so importing the app
+        does not load passlib and its bcrypt backend until a password is hashed or verified.
+
+        :param self: Represent the instance of the class
+        :return: The CryptContext
+        """
+        if Auth._pwd_context is None:
+            from passlib.context import CryptContext
+            Auth._pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+        return Auth._pwd_context
 
     def verify_password(self, plain_password, hashed_password):
         """
@@ -33,7 +58,8 @@ class Auth:
         :param hashed_password: Compare the password that was hashed and stored in the database,
         :return: A boolean value, true if the password is correct and false otherwise
         """
-        return self.pwd_context.verify(plain_password, hashed_password)
+        with PASSWORD_HASH_DURATION.labels("verify").time():
+            return self.pwd_context.verify(plain_password, hashed_password)
 
     def get_password_hash(self, password: str):
         """
@@ -44,7 +70,8 @@ class Auth:
         :param password: str: Get the password from the user
         :return: A hash of the password
         """
-        return self.pwd_context.hash(password)
+        with PASSWORD_HASH_DURATION.labels("hash").time():
+            return self.pwd_context.hash(password)
 
     async def create_access_token(self, data: dict, expires_delta: Optional[float] = None):
         """
@@ -102,7 +129,7 @@ class Auth:
         except JWTError:
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='Could not validate credentials')
 
-    async def get_current_user(self, token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+    async def get_current_user(self, token: str = Depends(oauth2_scheme), db: Session = Depends(get_read_db)):
         """
         The get_current_user function is a dependency that will be used in the
             protected endpoints. It takes a token as an argument and returns the user
@@ -113,6 +140,9 @@ class Auth:
         :param db: Session: Get the database session
         :return: A user object
         """
+        user = batch_user.get()
+        if user is not None:
+            return user
         credentials_exception = HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Could not validate credentials",
@@ -131,17 +161,71 @@ class Auth:
         except JWTError as e:
             raise credentials_exception
 
-        user = self.r.get(f"user:{email}")
+        try:
+            user = redis_breaker.call(self.r.get, f"user:{email}")
+        except (redis.RedisError, DependencyUnavailable):
+            USER_CACHE.labels("error").inc()
+            user = await repository_users.get_user_by_email(email, db)
+            if user is None:
+                raise credentials_exception
+            return user
         if user is None:
+            USER_CACHE.labels("miss").inc()
             user = await repository_users.get_user_by_email(email, db)
             if user is None:
                 raise credentials_exception
-            self.r.set(f"user:{email}", pickle.dumps(user))
-            self.r.expire(f"user:{email}", 900)
+            self.cache_user(user)
         else:
+            USER_CACHE.labels("hit").inc()
             user = pickle.loads(user)
         return user
 
+    def cache_user(self, user) -> bool:
+        """
+        The cache_user function stores a user in the Redis user cache read by get_current_user.
+
+        :param self: Represent the instance of the class
+        :param user: User: The user to cache
+        :return: True if the user was cached, False if Redis is unavailable
+        """
+        try:
+            redis_breaker.call(self.r.set, f"user:{user.email}", pickle.dumps(user), ex=900)
+        except (redis.RedisError, DependencyUnavailable):
+            return False
+        return True
+
+    def remember_login(self, email: str):
+        """
+        The remember_login function records the login time of a user in a sorted set,
+        so the warm-up can pre-load the most recently active users into the cache.
+
+        :param self: Represent the instance of the class
+        :param email: str: Email of the user that logged in
+        :return: None, errors are logged and never raised
+        """
+        try:
+            redis_breaker.call(self.r.zadd, self.ACTIVE_USERS_KEY, {email: datetime.utcnow().timestamp()})
+            redis_breaker.call(self.r.zremrangebyrank, self.ACTIVE_USERS_KEY, 0, -settings.warmup_users - 1)
+        except (redis.RedisError, DependencyUnavailable):
+            pass
+        except Exception:
+            # bookkeeping for the warm-up only, it must never fail a login
+            logger.exception("Recording the login of %s failed", email)
+
+    def recent_logins(self, limit: int) -> list[str]:
+        """
+        The recent_logins function returns the emails of the users that logged in last, most recent first.
+
+        :param self: Represent the instance of the class
+        :param limit: int: Maximum number of emails to return
+        :return: A list of emails, empty if Redis is unavailable
+        """
+        try:
+            emails = redis_breaker.call(self.r.zrevrange, self.ACTIVE_USERS_KEY, 0, limit - 1)
+        except (redis.RedisError, DependencyUnavailable):
+            return []
+        return [email.decode() for email in emails]
+
     async def decode_access_token(self, access_token: str):
         """
         The decode_access_token function takes an access token and decodes it using the SECRET_KEY.
@@ -0,0 +1,168 @@
+import redis
+
+from sqlalchemy import func, or_, and_
+from sqlalchemy.orm import Session
+
+from src.conf.config import settings
+from src.database.models import Client
+from src.services.auth import auth_service
+from src.services.resilience import redis_breaker, DependencyUnavailable
+
+KEY = "clients:names"
+READY_KEY = "clients:names:ready"
+BUILDING_KEY = "clients:names:building"
+REBUILDING_KEY = "clients:names:rebuilding"
+SEPARATOR = "\x00"
+
+# applies ZADD or ZREM to the index and, while a rebuild runs, to the set being built
+WRITE_SCRIPT = """local args = {unpack(ARGV, 2)}
+redis.call(ARGV[1], KEYS[1], unpack(args))
+if redis.call('EXISTS', KEYS[2]) == 1 then
+    redis.call(ARGV[1], KEYS[3], unpack(args))
+end
+"""
+
+# swaps the built set in and ends the rebuild: every write runs wholly before or after it
+SWAP_SCRIPT = """if redis.call('EXISTS', KEYS[1]) == 1 then
+    redis.call('RENAME', KEYS[1], KEYS[2])
+else
+    redis.call('DEL', KEYS[2])
+end
+redis.call('DEL', KEYS[3])
+redis.call('SET', KEYS[4], 1)
+"""
+
+
+def normalize(text: str) -> str:
+    return " ".join((text or "").lower().split())
+
+
+def entries(client_id: int, firstname: str, lastname: str) -> list[str]:
+    """
+    The entries function returns the sorted set members of a client: "firstname lastname" and
+    "lastname firstname", so a prefix of either name matches. Every member scores 0 and sorts by
+    its bytes, the id and display names follow the normalized name after NUL separators.
+
+    :param client_id: int: Id of the client
+    :param firstname: str: First name
+    :param lastname: str: Last name
+    :return: The members of the client
+    """
+    firstname, lastname = firstname or "", lastname or ""
+    tail = SEPARATOR.join((str(client_id), firstname, lastname))
+    names = {normalize(f"{firstname} {lastname}"), normalize(f"{lastname} {firstname}")}
+    return [f"{name}{SEPARATOR}{tail}" for name in names if name]
+
+
+class AutocompleteIndex:
+    """
+    Prefix index of client names in a Redis sorted set, read with ZRANGEBYLEX.
+
+    Client create, update and delete keep it current, also while rebuild runs. When Redis is
+    unavailable or the set has not been built by rebuild yet (or was lost with Redis data), lookups
+    fall back to the lower(firstname) / lower(lastname) prefix indexes of the database.
+    """
+
+    @property
+    def r(self):
+        return auth_service.r
+
+    def _write(self, *args):
+        try:
+            script = self.r.register_script(WRITE_SCRIPT)
+            redis_breaker.call(script, keys=[KEY, REBUILDING_KEY, BUILDING_KEY], args=args)
+        except (redis.RedisError, DependencyUnavailable):
+            pass
+
+    def add(self, client_id: int, firstname: str, lastname: str):
+        self._write("ZADD", *(part for member in entries(client_id, firstname, lastname) for part in (0, member)))
+
+    def remove(self, client_id: int, firstname: str, lastname: str):
+        self._write("ZREM", *entries(client_id, firstname, lastname))
+
+    def update(self, client_id: int, old: tuple, new: tuple):
+        if old != new:
+            self.remove(client_id, *old)
+            self.add(client_id, *new)
+
+    def _lookup(self, prefix: str, limit: int) -> list[dict] | None:
+        start = b"[" + prefix.encode()
+        pipe = self.r.pipeline(transaction=False)
+        # both spellings of a client can match, so read twice the limit before removing duplicates
+        pipe.zrangebylex(KEY, start, start + b"\xff", 0, limit * 2)
+        pipe.exists(READY_KEY)
+        members, ready = redis_breaker.call(pipe.execute)
+        if not ready:
+            return None
+        matches = {}
+        for member in members:
+            _, client_id, firstname, lastname = member.decode().split(SEPARATOR)
+            matches.setdefault(int(client_id), {"id": int(client_id), "firstname": firstname, "lastname": lastname})
+        return list(matches.values())[:limit]
+
+    def lookup(self, prefix: str, limit: int, db: Session) -> list[dict]:
+        """
+        The lookup function returns up to limit clients whose first or last name, or "first last"
+        or "last first", starts with prefix, in alphabetical order.
+
+        :param self: Represent the instance of the class
+        :param prefix: str: Beginning of the name, case insensitive
+        :param limit: int: Maximum number of clients
+        :param db: Session: Database session for the fallback
+        :return: A list of dicts with id, firstname and lastname
+        """
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+        try:
+            matches = self._lookup(prefix, limit)
+        except (redis.RedisError, DependencyUnavailable):
+            matches = None
+        if matches is None:
+            matches = self.lookup_db(prefix, limit, db)
+        return matches
+
+    @staticmethod
+    def lookup_db(prefix: str, limit: int, db: Session) -> list[dict]:
+        def starts_with(column, text):
+            escaped = text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            return column.like(f"{escaped}%", escape="\\")
+
+        firstname, lastname = func.lower(Client.firstname), func.lower(Client.lastname)
+        if " " in prefix:
+            first, rest = prefix.split(" ", 1)
+            condition = or_(and_(firstname == first, starts_with(lastname, rest)),
+                            and_(lastname == first, starts_with(firstname, rest)))
+        else:
+            condition = or_(starts_with(firstname, prefix), starts_with(lastname, prefix))
+        rows = (db.query(Client.id, Client.firstname, Client.lastname).filter(condition)
+                .order_by(firstname, lastname, Client.id).limit(limit).all())
+        return [{"id": row.id, "firstname": row.firstname, "lastname": row.lastname} for row in rows]
+
+    def rebuild(self, db: Session, batch: int = 10_000) -> int:
+        """
+        The rebuild function loads every client into a new sorted set and swaps it in with RENAME,
+        so lookups never see a half-built index. While it runs the rebuilding marker is set and
+        add and remove write to the new set as well, so client writes made during a rebuild are
+        not lost by the swap. The marker expires by itself if a rebuild dies halfway.
+
+        :param self: Represent the instance of the class
+        :param db: Session: Database session
+        :param batch: int: Clients read and written at once
+        :return: The number of clients indexed
+        """
+        after_id, count = 0, 0
+        self.r.delete(BUILDING_KEY)
+        self.r.set(REBUILDING_KEY, 1, ex=settings.autocomplete_rebuild_seconds)
+        while rows := (db.query(Client.id, Client.firstname, Client.lastname).filter(Client.id > after_id)
+                       .order_by(Client.id).limit(batch).all()):
+            members = {}
+            for row in rows:
+                members.update(dict.fromkeys(entries(row.id, row.firstname, row.lastname), 0))
+            self.r.zadd(BUILDING_KEY, members)
+            after_id, count = rows[-1].id, count + len(rows)
+        self.r.register_script(SWAP_SCRIPT)(keys=[BUILDING_KEY, KEY, REBUILDING_KEY, READY_KEY])
+        return count
+
+
+autocomplete_index = AutocompleteIndex()
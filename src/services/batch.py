@@ -0,0 +1,162 @@
+import json
+import asyncio
+import logging
+import posixpath
+
+from urllib.parse import urlsplit
+
+from fastapi.middleware.asyncexitstack import AsyncExitStackMiddleware
+from starlette.concurrency import run_in_threadpool
+from starlette.middleware.exceptions import ExceptionMiddleware
+from starlette.requests import Request
+
+from src.conf.config import settings
+from src.database.db import SessionLocal, guarded, shared_session
+
+logger = logging.getLogger(__name__)
+
+# sub-requests may not nest batches, open event streams or use their own credentials
+EXCLUDED_PATHS = ("/api/batch", "/api/auth/", "/api/clients/events")
+
+
+def normalize_path(path: str) -> str:
+    url = urlsplit(path)
+    normalized = posixpath.normpath(url.path) + ("/" if url.path.endswith("/") and url.path != "/" else "")
+    return normalized + (f"?{url.query}" if url.query else "")
+
+
+def allowed(path: str) -> bool:
+    path = urlsplit(path).path
+    return path.startswith("/api/") and not path.startswith(EXCLUDED_PATHS)
+
+
+def groups(methods: list[str]) -> list[list[int]]:
+    """
+    The groups function splits sub-requests into the steps of a batch: runs of consecutive GET
+    sub-requests form one step and run concurrently, every other sub-request is a step of its own,
+    so writes happen in order and the reads after a write see it.
+
+    :param methods: list[str]: HTTP methods of the sub-requests in batch order
+    :return: Lists of sub-request indexes
+    """
+    steps = []
+    for index, method in enumerate(methods):
+        if method == "GET" and steps and methods[steps[-1][-1]] == "GET":
+            steps[-1].append(index)
+        else:
+            steps.append([index])
+    return steps
+
+
+class BatchDispatcher:
+    """
+    Runs the sub-requests of a batch through the routes of the application in-process.
+
+    A sub-request is an ASGI call of the router behind the exception handlers and the dependency
+    exit stack, without the middleware of the batch request: admission, metrics and timeouts apply
+    to the batch as a whole. Route dependencies still run per sub-request, so roles and rate limits
+    are checked and charged as usual; the user comes from the batch. A sub-request that runs alone
+    uses the database session of the batch, the GET sub-requests of a concurrent step each open a
+    session of their own, at most ``batch_read_concurrency`` at a time, because a session must not
+    be used by two queries at once.
+    """
+
+    def __init__(self, request: Request):
+        """
+        The __init__ function prepares the sub-requests of a batch request.
+
+        :param self: Represent the instance of the class
+        :param request: Request: The batch request, its headers are passed on to every sub-request
+        :return: None
+        """
+        self.app = ExceptionMiddleware(AsyncExitStackMiddleware(request.app.router),
+                                       handlers=request.app.exception_handlers)
+        self.scope = {name: request.scope[name] for name in ("type", "asgi", "http_version", "scheme", "server",
+                                                             "client", "root_path", "app") if name in request.scope}
+        self.headers = [(name, value) for name, value in request.headers.raw
+                        if name not in (b"content-length", b"content-type")]
+        self.readers = asyncio.Semaphore(settings.batch_read_concurrency)
+
+    async def call(self, method: str, path: str, body=None) -> tuple[int, object]:
+        """
+        The call function runs one sub-request.
+
+        :param self: Represent the instance of the class
+        :param method: str: HTTP method
+        :param path: str: Path with an optional query string
+        :param body: JSON body, None for none
+        :return: The status code and the JSON body of the response, or its text when it is not JSON
+        """
+        url = urlsplit(path)
+        payload = b"" if body is None else json.dumps(body).encode()
+        headers = list(self.headers)
+        if body is not None:
+            headers += [(b"content-type", b"application/json"), (b"content-length", str(len(payload)).encode())]
+        scope = {**self.scope, "method": method, "path": url.path, "raw_path": url.path.encode(),
+                 "query_string": url.query.encode(), "headers": headers}
+        received, status, content_type, chunks = False, 500, b"", []
+
+        async def receive():
+            nonlocal received
+            if received:
+                return {"type": "http.disconnect"}
+            received = True
+            return {"type": "http.request", "body": payload, "more_body": False}
+
+        async def send(message):
+            nonlocal status, content_type
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                content_type = dict(message.get("headers", ())).get(b"content-type", b"")
+            elif message["type"] == "http.response.body":
+                chunks.append(message.get("body", b""))
+
+        try:
+            await self.app(scope, receive, send)
+        except Exception:
+            logger.exception("Batch sub-request %s %s failed", method, path)
+            return 500, {"detail": "Internal Server Error"}
+        content = b"".join(chunks)
+        if content and content_type.startswith(b"application/json"):
+            return status, json.loads(content)
+        return status, content.decode(errors="replace") or None
+
+    async def read(self, method: str, path: str, body=None) -> tuple[int, object]:
+        """
+        The read function runs a sub-request of a concurrent step with a database session of its own.
+
+        :param self: Represent the instance of the class
+        :param method: str: HTTP method
+        :param path: str: Path with an optional query string
+        :param body: JSON body, None for none
+        :return: The status code and the JSON body of the response, see call
+        """
+        async with self.readers:
+            db = guarded(SessionLocal())
+            token = shared_session.set(db)
+            try:
+                return await self.call(method, path, body)
+            finally:
+                shared_session.reset(token)
+                await run_in_threadpool(db.close)
+
+    async def run(self, requests: list) -> list[dict]:
+        """
+        The run function runs the sub-requests step by step, see groups. A step of one sub-request uses
+        the session of the batch, the sub-requests of a longer step run concurrently, see read.
+
+        :param self: Represent the instance of the class
+        :param requests: list: Sub-requests with id, method, path and body
+        :return: A response with the id, status and body of every sub-request, in batch order
+        """
+        responses = [None] * len(requests)
+        for step in groups([sub.method for sub in requests]):
+            if len(step) == 1:
+                sub = requests[step[0]]
+                results = [await self.call(sub.method, sub.path, sub.body)]
+            else:
+                results = await asyncio.gather(*(self.read(requests[index].method, requests[index].path,
+                                                           requests[index].body) for index in step))
+            for index, (status, body) in zip(step, results):
+                responses[index] = {"id": requests[index].id, "status": status, "body": body}
+        return responses
@@ -0,0 +1,160 @@
+import time
+import pickle
+import asyncio
+import logging
+
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+
+import redis
+
+from src.conf.config import settings
+from src.services.auth import auth_service
+from src.services.resilience import redis_breaker, DependencyUnavailable
+
+logger = logging.getLogger(__name__)
+
+
+class BirthdayCache:
+    """
+    Cache of birthday windows keyed by (generation, date, days).
+
+    The generation is a counter of the clients table kept in Redis and bumped by every client
+    create, update and delete, so a write makes every cached window unreachable at once and a new
+    day starts with new keys. Without Redis the windows are cached per worker for a short time
+    under a local generation that only counts this worker's writes.
+    """
+    GENERATION_KEY = "clients:generation"
+
+    def __init__(self):
+        self.local_generation = 0
+        self.missed_bump = False
+        self.local = OrderedDict()
+
+    @property
+    def r(self):
+        return auth_service.r
+
+    def generation(self) -> str | None:
+        """
+        The generation function returns the current generation of the clients table.
+        A bump that could not reach Redis is applied first.
+
+        :param self: Represent the instance of the class
+        :return: The Redis generation, or None when Redis is unavailable
+        """
+        try:
+            if self.missed_bump:
+                redis_breaker.call(self.r.incr, self.GENERATION_KEY)
+                self.missed_bump = False
+            return str(int(redis_breaker.call(self.r.get, self.GENERATION_KEY) or 0))
+        except (redis.RedisError, DependencyUnavailable):
+            return None
+
+    def bump(self):
+        """
+        The bump function invalidates every cached window after a write to the clients table.
+
+        :param self: Represent the instance of the class
+        :return: None
+        """
+        self.local_generation += 1
+        self.local.clear()
+        try:
+            redis_breaker.call(self.r.incr, self.GENERATION_KEY)
+        except (redis.RedisError, DependencyUnavailable):
+            self.missed_bump = True
+
+    def _get_local(self, key: str) -> bytes | None:
+        entry = self.local.get(key)
+        if entry is None or entry[1] < time.monotonic():
+            return None
+        return entry[0]
+
+    def _set_local(self, key: str, data: bytes, seconds: float):
+        self.local[key] = (data, time.monotonic() + seconds)
+        self.local.move_to_end(key)
+        while len(self.local) > settings.birthday_cache_local_size:
+            self.local.popitem(last=False)
+
+    async def get(self, days: int, compute, today: date | None = None) -> list:
+        """
+        The get function returns the clients with a birthday in the next days days, from the cache
+        when possible. On a miss compute(today) is awaited and its result is cached.
+        Cached clients are pickled, so every caller gets its own detached copies.
+
+        :param self: Represent the instance of the class
+        :param days: int: Length of the window
+        :param compute: Coroutine function that loads the window for a day from the database
+        :param today: date | None: First day of the window, today by default
+        :return: A list of clients
+        """
+        today = today or datetime.now().date()
+        generation = self.generation()
+        if generation is None:
+            key = f"birthdays:local{self.local_generation}:{today.isoformat()}:{days}"
+            seconds = settings.birthday_cache_local_seconds
+        else:
+            key = f"birthdays:{generation}:{today.isoformat()}:{days}"
+            # a key names one generation, so keeping it locally is safe until the next write or day
+            seconds = settings.birthday_cache_seconds
+        data = self._get_local(key)
+        if data is None and generation is not None:
+            try:
+                data = redis_breaker.call(self.r.get, key)
+            except (redis.RedisError, DependencyUnavailable):
+                data = None
+        if data is not None:
+            self._set_local(key, data, seconds)
+            return pickle.loads(data)
+
+        clients = await compute(today)
+        data = pickle.dumps(clients)
+        if generation is not None:
+            try:
+                redis_breaker.call(self.r.set, key, data, ex=settings.birthday_cache_seconds)
+            except (redis.RedisError, DependencyUnavailable):
+                pass
+        self._set_local(key, data, seconds)
+        return clients
+
+    async def precompute(self, compute, today: date) -> int:
+        """
+        The precompute function fills the cache for the common windows of a day. Only one worker
+        precomputes a day when Redis is available.
+
+        :param self: Represent the instance of the class
+        :param compute: Coroutine function of (days, today) that loads a window from the database
+        :param today: date: The day to precompute
+        :return: The number of windows computed
+        """
+        try:
+            first = redis_breaker.call(self.r.set, f"birthdays:precompute:{today.isoformat()}", 1,
+                                       nx=True, ex=settings.birthday_cache_seconds)
+        except (redis.RedisError, DependencyUnavailable):
+            first = True
+        if not first:
+            return 0
+        for days in settings.birthday_cache_windows:
+            await self.get(days, lambda day, days=days: compute(days, day), today)
+        return len(settings.birthday_cache_windows)
+
+    async def run_at_midnight(self, compute):
+        """
+        The run_at_midnight function precomputes the common windows right after every local midnight.
+
+        :param self: Represent the instance of the class
+        :param compute: Coroutine function of (days, today) that loads a window from the database
+        :return: None
+        """
+        while True:
+            now = datetime.now()
+            midnight = datetime.combine(now.date() + timedelta(days=1), datetime.min.time())
+            await asyncio.sleep((midnight - now).total_seconds())
+            try:
+                await self.precompute(compute, datetime.now().date())
+            except Exception as error:
+                logger.warning("Birthday precompute failed: %r", error)
+
+
+birthday_cache = BirthdayCache()
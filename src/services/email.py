@@ -1,27 +1,144 @@
+import asyncio
 import logging
 
 from pathlib import Path
+from email.message import EmailMessage
+from email.utils import formataddr
 
-from fastapi_mail import FastMail, MessageSchema, ConnectionConfig, MessageType
-from fastapi_mail.errors import ConnectionErrors
 from pydantic import EmailStr
 
 from src.services.auth import auth_service
 from src.conf.config import settings
+from src.services.metrics import EMAIL_SEND_DURATION
+from src.services.resilience import smtp_breaker, DependencyUnavailable
 
-conf = ConnectionConfig(
-    MAIL_USERNAME=settings.mail_username,
-    MAIL_PASSWORD=settings.mail_password,
-    MAIL_FROM=EmailStr(settings.mail_from),
-    MAIL_PORT=settings.mail_port,
-    MAIL_SERVER=settings.mail_server,
-    MAIL_FROM_NAME="Reset Password",
-    MAIL_STARTTLS=False,
-    MAIL_SSL_TLS=True,
-    USE_CREDENTIALS=True,
-    VALIDATE_CERTS=True,
-    TEMPLATE_FOLDER=Path(__file__).parent / 'templates',
-)
+TEMPLATE_FOLDER = Path(__file__).parent / 'templates'
+
+
+def mail_config():
+    """
+    The mail_config function builds the SMTP settings. fastapi_mail is imported here rather than
+    at module level because it pulls in httpx, aiosmtplib and email validation, which most
+    processes importing this module (tests, scripts, workers that never send mail) do not need.
+
+    :return: A fastapi_mail ConnectionConfig
+    """
+    from fastapi_mail import ConnectionConfig
+
+    return ConnectionConfig(
+        MAIL_USERNAME=settings.mail_username,
+        MAIL_PASSWORD=settings.mail_password,
+        MAIL_FROM=EmailStr(settings.mail_from),
+        MAIL_PORT=settings.mail_port,
+        MAIL_SERVER=settings.mail_server,
+        MAIL_FROM_NAME="Reset Password",
+        MAIL_STARTTLS=False,
+        MAIL_SSL_TLS=True,
+        USE_CREDENTIALS=True,
+        VALIDATE_CERTS=True,
+        TEMPLATE_FOLDER=TEMPLATE_FOLDER,
+        TIMEOUT=settings.smtp_timeout_seconds,
+    )
+
+
+class MailClient:
+    """
+    SMTP client of a worker that keeps one logged-in connection open between messages, so a message
+    costs its own transfer instead of a connect, TLS handshake and login each. The connection is opened
+    on the first send, sends take turns on it, and it is closed by close when the worker stops. Servers
+    drop idle connections, so a send that fails on a reused connection is tried once more on a new one.
+    """
+
+    def __init__(self):
+        self.config = None
+        self.connection = None
+        self.lock = None
+        self.loop = None
+
+    def _config(self):
+        if self.config is None:
+            self.config = mail_config()
+        return self.config
+
+    def render(self, email: str, subject: str, template_name: str, **context) -> EmailMessage:
+        """
+        The render function builds a message from one of the email templates.
+
+        :param self: Represent the instance of the class
+        :param email: str: The recipient
+        :param subject: str: The subject line
+        :param template_name: str: File name of the template in TEMPLATE_FOLDER
+        :param context: Variables of the template
+        :return: The message
+        """
+        config = self._config()
+        message = EmailMessage()
+        message["From"] = formataddr((config.MAIL_FROM_NAME or "", config.MAIL_FROM))
+        message["To"] = email
+        message["Subject"] = subject
+        message.set_content(config.template_engine().get_template(template_name).render(**context), subtype="html")
+        return message
+
+    async def _connect(self):
+        from fastapi_mail.connection import Connection
+
+        return await Connection(self._config()).__aenter__()
+
+    async def _drop(self):
+        connection, self.connection = self.connection, None
+        if connection is not None:
+            try:
+                await connection.session.quit()
+            except Exception:
+                connection.session.close()
+
+    async def send(self, message: EmailMessage):
+        """
+        The send function sends a message over the shared connection, opening it when there is none.
+
+        :param self: Represent the instance of the class
+        :param message: EmailMessage: The message, see render
+        :return: None
+        """
+        from aiosmtplib import SMTPException
+
+        loop = asyncio.get_running_loop()
+        if self.loop is not loop:
+            # a connection and a lock belong to the event loop they were made on
+            self.loop, self.lock, self.connection = loop, asyncio.Lock(), None
+        timeout = settings.smtp_timeout_seconds
+        async with self.lock:
+            if self.connection is not None:
+                try:
+                    await smtp_breaker.call_async(self.connection.session.send_message, message, timeout=timeout)
+                    return
+                except (SMTPException, OSError, asyncio.TimeoutError) as error:
+                    logging.info("Reconnecting to SMTP, the kept connection failed: %r", error)
+                    await self._drop()
+            self.connection = await smtp_breaker.call_async(self._connect, timeout=timeout)
+            try:
+                await smtp_breaker.call_async(self.connection.session.send_message, message, timeout=timeout)
+            except BaseException:
+                await self._drop()
+                raise
+
+    async def close(self):
+        """
+        The close function quits the kept connection, if any, and forgets the SMTP settings.
+
+        :param self: Represent the instance of the class
+        :return: None
+        """
+        if self.loop is asyncio.get_running_loop():
+            await self._drop()
+        self.config = self.connection = self.lock = self.loop = None
+
+
+mail_client = MailClient()
+
+
+async def close_mail_client():
+    await mail_client.close()
 
 
 async def send_email(email: EmailStr, username: str, host: str):
@@ -33,18 +150,16 @@ async def send_email(email: EmailStr, username: str, host: str):
     :param host: str: Pass the hostname of the server to the email template
     :return: A coroutine object
     """
+    from aiosmtplib import SMTPException
+    from fastapi_mail.errors import ConnectionErrors
+
     try:
         token_verification = auth_service.create_email_token({"sub": email})
-        message = MessageSchema(
-            subject="Confirm your email!",
-            recipients=[email],
-            template_body={"host": host, "username": username, "token": token_verification},
-            subtype=MessageType.html
-        )
-
-        fm = FastMail(conf)
-        await fm.send_message(message, template_name="email_template.html")
-    except ConnectionErrors as err:
+        message = mail_client.render(email, "Confirm your email!", "email_template.html",
+                                     host=host, username=username, token=token_verification)
+        with EMAIL_SEND_DURATION.labels("email_template.html").time():
+            await mail_client.send(message)
+    except (ConnectionErrors, SMTPException, OSError, DependencyUnavailable, asyncio.TimeoutError) as err:
         logging.error(err)
 
 
@@ -58,17 +173,14 @@ async def send_email_with_password(email: EmailStr, username: str, new_password:
     :param host: str: Pass the host url to the template
     :return: A coroutine, which is a special object that can be used with asyncio
     """
+    from aiosmtplib import SMTPException
+    from fastapi_mail.errors import ConnectionErrors
+
     try:
         token_verification = auth_service.create_email_token({"sub": email})
-        message = MessageSchema(
-            subject="Your new password",
-            recipients=[email],
-            template_body={"host": host, "username": username, "new_password": new_password,
-                           "token": token_verification},
-            subtype=MessageType.html
-        )
-
-        fm = FastMail(conf)
-        await fm.send_message(message, template_name="reset_password_email.html")
-    except ConnectionErrors as err:
+        message = mail_client.render(email, "Your new password", "reset_password_email.html", host=host,
+                                     username=username, new_password=new_password, token=token_verification)
+        with EMAIL_SEND_DURATION.labels("reset_password_email.html").time():
+            await mail_client.send(message)
+    except (ConnectionErrors, SMTPException, OSError, DependencyUnavailable, asyncio.TimeoutError) as err:
         logging.error(err)
@@ -0,0 +1,177 @@
+import json
+import asyncio
+import logging
+
+import redis
+import redis.asyncio as aioredis
+
+from src.conf.config import settings
+from src.services.auth import auth_service
+from src.services.metrics import SSE_SUBSCRIBERS, SSE_RESYNCS
+from src.services.resilience import redis_breaker, DependencyUnavailable
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "clients:events"
+RESYNC = "event: resync\ndata: {}\n\n"
+KEEPALIVE = ": keep-alive\n\n"
+
+
+def publish(op: str, client_id: int):
+    """
+    The publish function announces a client mutation to the event streams of every worker.
+    Events are best effort: when Redis is unavailable the mutation is not announced and the
+    subscribers are told to resync once the workers reconnect.
+
+    :param op: str: created, updated or deleted
+    :param client_id: int: Id of the client
+    :return: None
+    """
+    message = json.dumps({"op": op, "id": client_id}, separators=(",", ":"))
+    try:
+        redis_breaker.call(auth_service.r.publish, CHANNEL, message)
+    except (redis.RedisError, DependencyUnavailable):
+        pass
+
+
+class Subscriber:
+    """
+    One connected event stream: a bounded queue of ready-to-send SSE frames.
+
+    A subscriber that does not keep up is not allowed to grow its queue: on overflow the queued
+    frames are dropped and replaced by a single resync event, after which the client reloads
+    what it shows, e.g. from the change feed, and keeps receiving new events.
+    """
+
+    __slots__ = ("queue",)
+
+    def __init__(self, size: int):
+        self.queue = asyncio.Queue(maxsize=size)
+
+    def deliver(self, frame: str) -> bool:
+        try:
+            self.queue.put_nowait(frame)
+            return True
+        except asyncio.QueueFull:
+            self.resync()
+            return False
+
+    def resync(self):
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.queue.put_nowait(RESYNC)
+
+    def ping(self):
+        if self.queue.empty():
+            self.queue.put_nowait(KEEPALIVE)
+
+
+class EventHub:
+    """
+    Fan-out of client mutation events to the event streams connected to this worker.
+
+    The worker holds one Redis subscription to CHANNEL and one keep-alive timer for all its
+    subscribers, only while it has any. An event is formatted once and put into every subscriber
+    queue, so an idle subscriber costs a queue and a put per event, and no connection, task or timer.
+    """
+
+    def __init__(self, queue_size: int = None):
+        self.queue_size = queue_size or settings.events_queue_size
+        self.subscribers = set()
+        self.tasks = []
+
+    def subscribe(self) -> Subscriber:
+        """
+        The subscribe function registers a new subscriber, starting the Redis listener for the first one.
+
+        :param self: Represent the instance of the class
+        :return: The subscriber
+        """
+        subscriber = Subscriber(self.queue_size)
+        self.subscribers.add(subscriber)
+        SSE_SUBSCRIBERS.labels().set(len(self.subscribers))
+        if not self.tasks or self.tasks[0].done():
+            self.close()
+            self.tasks = [asyncio.create_task(self.listen()), asyncio.create_task(self.keep_alive())]
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        """
+        The unsubscribe function removes a subscriber and stops listening when it was the last one.
+
+        :param self: Represent the instance of the class
+        :param subscriber: Subscriber: The subscriber to remove
+        :return: None
+        """
+        self.subscribers.discard(subscriber)
+        SSE_SUBSCRIBERS.labels().set(len(self.subscribers))
+        if not self.subscribers:
+            self.close()
+
+    def close(self):
+        for task in self.tasks:
+            task.cancel()
+        self.tasks = []
+
+    def broadcast(self, frame: str):
+        for subscriber in list(self.subscribers):
+            if not subscriber.deliver(frame):
+                SSE_RESYNCS.labels("overflow").inc()
+
+    def resync_all(self):
+        for subscriber in list(self.subscribers):
+            subscriber.resync()
+        SSE_RESYNCS.labels("reconnect").inc(len(self.subscribers))
+
+    async def keep_alive(self):
+        while True:
+            await asyncio.sleep(settings.events_keepalive_seconds)
+            for subscriber in list(self.subscribers):
+                subscriber.ping()
+
+    async def listen(self):
+        """
+        The listen function relays the messages of CHANNEL to the subscribers until it is cancelled.
+        When the subscription breaks it reconnects, and since events may have been missed meanwhile,
+        every subscriber is told to resync.
+
+        :param self: Represent the instance of the class
+        :return: None
+        """
+        client = aioredis.Redis(host=settings.redis_host, port=settings.redis_port, db=0,
+                                socket_connect_timeout=settings.redis_timeout_ms / 1000)
+        reconnect = False
+        try:
+            while True:
+                try:
+                    async with client.pubsub() as pubsub:
+                        await pubsub.subscribe(CHANNEL)
+                        if reconnect:
+                            self.resync_all()
+                        async for message in pubsub.listen():
+                            if message["type"] == "message":
+                                self.broadcast(f"event: client\ndata: {message['data'].decode()}\n\n")
+                except (redis.RedisError, OSError) as error:
+                    logger.warning("Client events subscription failed, reconnecting: %r", error)
+                reconnect = True
+                await asyncio.sleep(settings.events_retry_seconds)
+        finally:
+            await client.close()
+
+    async def stream(self):
+        """
+        The stream function is the body of one event stream: SSE frames until the client disconnects.
+
+        :param self: Represent the instance of the class
+        :return: An async iterator of SSE frames
+        """
+        subscriber = self.subscribe()
+        try:
+            yield f"retry: {int(settings.events_retry_seconds * 1000)}\n\n"
+            while True:
+                yield await subscriber.queue.get()
+        finally:
+            self.unsubscribe(subscriber)
+
+
+client_events = EventHub()
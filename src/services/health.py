@@ -0,0 +1,175 @@
+import time
+import asyncio
+
+from sqlalchemy import text
+from sqlalchemy.pool import QueuePool
+
+from src.conf.config import settings
+from src.database.db import replica_router
+from src.services import warmup
+from src.services.auth import auth_service
+from src.services.metrics import DB_POOL_WAITING, READINESS_CHECK_DURATION
+from src.services.resilience import STATE_NAMES, redis_breaker, smtp_breaker, cloudinary_breaker
+
+
+class Degraded(Exception):
+    """
+    Raised by a check whose dependency answers but cannot take more work right now, e.g. a saturated pool.
+    The dependency is reported as degraded, not as failed, so it does not make the worker not ready.
+    """
+
+
+def pool_stats(bind) -> dict:
+    """
+    The pool_stats function reports how busy the connection pool of an engine is.
+    Saturation is the share of the pool capacity (pool_size + max_overflow) checked out.
+
+    :param bind: Engine: The engine to report
+    :return: A dict of connection counts and saturation
+    """
+    pool = bind.pool
+    if not isinstance(pool, QueuePool):
+        return {"checked_out": pool.checkedout(), "saturation": None}
+    capacity = pool.size() + max(pool._max_overflow, 0)
+    return {
+        "checked_out": pool.checkedout(),
+        "idle": pool.checkedin(),
+        "capacity": capacity,
+        "waiting": DB_POOL_WAITING.labels(pool._orig_logging_name or "default").value,
+        "saturation": round(pool.checkedout() / capacity, 3) if capacity else None,
+    }
+
+
+def ping_database(bind):
+    """
+    The ping_database function runs SELECT 1 on a pooled connection. A saturated pool is reported
+    as degraded without waiting for a connection, so probes never queue behind requests. A busy pool
+    means the database is serving requests: failing readiness would take the worker out of rotation
+    just when it is loaded, and move its load onto the others.
+
+    :param bind: Engine: The engine to check
+    :return: None
+    """
+    stats = pool_stats(bind)
+    if stats["saturation"] is not None and stats["saturation"] >= 1 and not stats["idle"]:
+        raise Degraded("pool saturated")
+    with bind.connect() as connection:
+        connection.execute(text("SELECT 1"))
+
+
+async def check_database():
+    if replica_router.primary is None:
+        raise ConnectionError("no engine, the application has not started")
+    await asyncio.to_thread(ping_database, replica_router.primary)
+
+
+async def check_redis():
+    await asyncio.to_thread(auth_service.r.ping)
+
+
+async def check_tcp(host: str, port: int):
+    """
+    The check_tcp function opens and closes a TCP connection, which is enough to know an SMTP server
+    or the storage API accepts connections without logging in or spending API quota.
+
+    :param host: str: Host to connect to
+    :param port: int: Port to connect to
+    :return: None
+    """
+    _, writer = await asyncio.open_connection(host, port)
+    writer.close()
+    await writer.wait_closed()
+
+
+CHECKS = {
+    "database": (check_database, None),
+    "redis": (check_redis, redis_breaker),
+    "smtp": (lambda: check_tcp(settings.mail_server, settings.mail_port), smtp_breaker),
+    "storage": (lambda: check_tcp(settings.cloudinary_host, 443), cloudinary_breaker),
+}
+
+
+async def run_check(name: str, check, breaker) -> dict:
+    """
+    The run_check function runs one check within readiness_timeout_ms and times it.
+
+    :param name: str: Dependency name
+    :param check: Coroutine function that raises if the dependency is unavailable
+    :param breaker: CircuitBreaker: The breaker of the dependency, reported next to the result
+    :return: A dict with ok, latency_ms, the error or degradation if any and the circuit state
+    """
+    start = time.perf_counter()
+    result = {"ok": True}
+    try:
+        await asyncio.wait_for(check(), settings.readiness_timeout_ms / 1000)
+    except Degraded as degraded:
+        result = {"ok": True, "degraded": str(degraded)}
+    except asyncio.TimeoutError:
+        result = {"ok": False, "error": "timeout"}
+    except Exception as error:
+        result = {"ok": False, "error": str(error) or type(error).__name__}
+    elapsed = time.perf_counter() - start
+    READINESS_CHECK_DURATION.labels(name).observe(elapsed)
+    result["latency_ms"] = round(elapsed * 1000, 2)
+    if breaker is not None:
+        result["circuit"] = STATE_NAMES[breaker.state]
+    return result
+
+
+class Readiness:
+    """
+    Readiness of the worker, checked concurrently for every dependency and cached for
+    readiness_cache_seconds. Probes arriving while a check runs wait for that check,
+    so a probe storm costs one round of checks per interval.
+    """
+
+    def __init__(self, checks: dict):
+        self.checks = checks
+        self.result = None
+        self.checked_at = 0.0
+        self.pending = None
+
+    async def _check(self) -> dict:
+        names = list(self.checks)
+        results = await asyncio.gather(*(run_check(name, *self.checks[name]) for name in names))
+        checks = dict(zip(names, results))
+        if not all(checks[name]["ok"] for name in settings.readiness_critical if name in checks):
+            status = "not_ready"
+        elif all(result["ok"] and "degraded" not in result for result in results):
+            status = "ready"
+        else:
+            status = "degraded"
+        return {"status": status, "checks": checks}
+
+    async def get(self) -> dict:
+        """
+        The get function returns the readiness report, running the checks when the cached one is stale.
+        While warming up the worker is not ready and no checks run.
+
+        :param self: Represent the instance of the class
+        :return: A dict with status, per-dependency checks and pool saturation
+        """
+        if not warmup.state.ready:
+            return {"status": "not_ready", "warm_up": "running"}
+        if self.result is None or time.monotonic() - self.checked_at >= settings.readiness_cache_seconds:
+            if self.pending is None:
+                self.pending = asyncio.ensure_future(self._check())
+                self.pending.add_done_callback(self._store)
+            await asyncio.shield(self.pending)
+        pools = {bind.pool._orig_logging_name or "default": pool_stats(bind)
+                 for bind in replica_router.engines()}
+        return {**self.result, "age_seconds": round(time.monotonic() - self.checked_at, 3), "pools": pools}
+
+    def _store(self, pending: asyncio.Future):
+        self.pending = None
+        if not pending.cancelled() and pending.exception() is None:
+            self.result = pending.result()
+            self.checked_at = time.monotonic()
+
+    def reset(self):
+        self.result = None
+        self.checked_at = 0.0
+        self.pending = None
+
+
+readiness = Readiness(CHECKS)
@@ -0,0 +1,314 @@
+import math
+import time
+import logging
+
+from collections import OrderedDict
+
+from redis.exceptions import NoScriptError, RedisError
+from fastapi import Depends
+from starlette.requests import Request
+from starlette.responses import Response
+from fastapi_limiter import FastAPILimiter
+
+from src.conf.config import settings
+from src.database.models import User
+from src.services.auth import auth_service
+from src.services.metrics import RATE_LIMIT_REJECTIONS
+from src.services.resilience import redis_breaker, DependencyUnavailable
+
+logger = logging.getLogger(__name__)
+
+
+class _Bucket:
+    __slots__ = ("tokens", "expires_at", "blocked_until")
+
+    def __init__(self):
+        self.tokens = 0
+        self.expires_at = 0.0
+        self.blocked_until = 0.0
+
+
+class HybridRateLimiter:
+    """
+    Drop-in replacement for ``fastapi_limiter.depends.RateLimiter``.
+
+    Every worker keeps a local token bucket per rate key and leases tokens from the
+    shared Redis window in batches, so most requests are admitted without a network
+    round trip. Tokens are debited from the global window when they are leased and a
+    local bucket expires together with the Redis window it was leased from, so a key is
+    never admitted more than ``times`` per window; tokens a worker leased but did not
+    spend are lost with the window rather than used by another worker. Limits below
+    ``settings.rate_limit_lease_min_times`` are not leased at all, every request takes
+    exactly its cost from Redis. A rejection is cached locally until the window resets.
+
+    While Redis is unreachable (or its circuit is open) tokens are leased from a
+    per-worker window instead, so each worker enforces ``times`` on its own.
+    """
+    lease_script = """local key = KEYS[1]
+local limit = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+local want = tonumber(ARGV[3])
+local need = tonumber(ARGV[4])
+
+local used = tonumber(redis.call('get', key) or "0")
+local available = limit - used
+local ttl = window
+if used > 0 then
+ ttl = redis.call("PTTL", key)
+ if ttl < 1 then ttl = 1 end
+end
+if available < need then
+ return {0, ttl, available}
+end
+local granted = math.min(want, available)
+if used > 0 then
+ redis.call("INCRBY", key, granted)
+else
+ redis.call("SET", key, granted, "px", window)
+end
+return {granted, ttl, available - granted}"""
+    lease_sha: str = None
+    buckets: OrderedDict = OrderedDict()
+    local_windows: OrderedDict = OrderedDict()
+
+    def __init__(self, times: int = 1, milliseconds: int = 0, seconds: int = 0, minutes: int = 0, hours: int = 0,
+                 lease: int = None):
+        """
+        The __init__ function takes the same window arguments as fastapi_limiter's RateLimiter.
+
+        :param self: Represent the instance of the class
+        :param times: int: Number of requests allowed per window
+        :param milliseconds: int: Milliseconds part of the window
+        :param seconds: int: Seconds part of the window
+        :param minutes: int: Minutes part of the window
+        :param hours: int: Hours part of the window
+        :param lease: int: Number of tokens to lease from Redis at once, defaults to a share of times
+        :return: None
+        """
+        self.times = times
+        self.milliseconds = milliseconds + 1000 * seconds + 60000 * minutes + 3600000 * hours
+        self.lease = self.lease_size(times, lease)
+
+    @staticmethod
+    def lease_size(times: int, lease: int = None) -> int:
+        """
+        The lease_size function picks how many tokens a worker takes from Redis at once.
+
+        :param times: int: Number of requests allowed per window
+        :param lease: int: Requested lease size, defaults to a share of times, or 1 below rate_limit_lease_min_times
+        :return: The lease size, between 1 and times
+        """
+        if lease is None:
+            lease = int(times * settings.rate_limit_lease_ratio) if times >= settings.rate_limit_lease_min_times else 1
+        return max(1, min(lease, times))
+
+    @classmethod
+    def reset(cls):
+        """
+        The reset function drops every locally leased token and cached rejection.
+
+        :param cls: Represent the class
+        :return: None
+        """
+        cls.buckets.clear()
+        cls.local_windows.clear()
+
+    @classmethod
+    def _bucket(cls, key: str) -> _Bucket:
+        bucket = cls.buckets.get(key)
+        if bucket is None:
+            bucket = cls.buckets[key] = _Bucket()
+            if len(cls.buckets) > settings.rate_limit_local_keys:
+                cls.buckets.popitem(last=False)
+        else:
+            cls.buckets.move_to_end(key)
+        return bucket
+
+    async def _lease(self, key: str, want: int, need: int, times: int) -> tuple[int, int, int]:
+        """
+        The _lease function takes up to ``want`` tokens from the shared Redis window in one round trip.
+        Nothing is taken unless at least ``need`` tokens are left.
+
+        :param self: Represent the instance of the class
+        :param key: str: Redis key of the window
+        :param want: int: Number of tokens to take
+        :param need: int: Fewest tokens worth taking
+        :param times: int: Size of the window budget
+        :return: The number of granted tokens, the milliseconds until the window resets and the tokens left in it
+        """
+        try:
+            return await redis_breaker.call_async(self._lease_shared, key, want, need, times,
+                                                  timeout=settings.redis_timeout_ms / 1000)
+        except (RedisError, OSError, TimeoutError, DependencyUnavailable) as error:
+            logger.debug("Rate limiting locally, Redis is unavailable: %r", error)
+            return self._lease_local(key, want, need, times)
+
+    async def _lease_shared(self, key: str, want: int, need: int, times: int) -> tuple[int, int, int]:
+        redis = FastAPILimiter.redis
+        cls = type(self)
+        if cls.lease_sha is None:
+            cls.lease_sha = await redis.script_load(cls.lease_script)
+        args = (1, key, str(times), str(self.milliseconds), str(want), str(need))
+        try:
+            result = await redis.evalsha(cls.lease_sha, *args)
+        except NoScriptError:
+            cls.lease_sha = await redis.script_load(cls.lease_script)
+            result = await redis.evalsha(cls.lease_sha, *args)
+        granted, ttl, left = map(int, result)
+        return granted, ttl, left
+
+    def _lease_local(self, key: str, want: int, need: int, times: int) -> tuple[int, int, int]:
+        """
+        The _lease_local function is the fallback of _lease: the same fixed window, kept in this worker.
+
+        :param self: Represent the instance of the class
+        :param key: str: Rate key
+        :param want: int: Number of tokens to take
+        :param need: int: Fewest tokens worth taking
+        :param times: int: Size of the window budget
+        :return: The number of granted tokens, the milliseconds until the window resets and the tokens left in it
+        """
+        cls = type(self)
+        now = time.monotonic()
+        window = cls.local_windows.get(key)
+        if window is None or now >= window[1]:
+            window = cls.local_windows[key] = [0, now + self.milliseconds / 1000]
+            if len(cls.local_windows) > settings.rate_limit_local_keys:
+                cls.local_windows.popitem(last=False)
+        ttl = max(1, int((window[1] - now) * 1000))
+        available = times - window[0]
+        if available < need:
+            return 0, ttl, available
+        granted = min(want, available)
+        window[0] += granted
+        return granted, ttl, available - granted
+
+    async def acquire(self, key: str, cost: int = 1, times: int = None) -> int:
+        """
+        The acquire function admits ``cost`` units for the key, leasing from Redis only when the local bucket is short.
+
+        :param self: Represent the instance of the class
+        :param key: str: Rate key
+        :param cost: int: Number of tokens the request consumes
+        :param times: int: Window budget for this key, defaults to the limiter's times
+        :return: 0 if admitted, otherwise the milliseconds until the window resets
+        """
+        if times is None:
+            times, lease = self.times, self.lease
+        else:
+            lease = self.lease_size(times)
+        now = time.monotonic()
+        bucket = self._bucket(key)
+        if now < bucket.blocked_until:
+            return max(1, int((bucket.blocked_until - now) * 1000))
+        if now >= bucket.expires_at:
+            bucket.tokens = 0
+        if bucket.tokens < cost:
+            need = cost - bucket.tokens
+            granted, ttl, left = await self._lease(key, max(lease, need), need, times)
+            if granted == 0:
+                if left <= 0:
+                    bucket.blocked_until = now + ttl / 1000
+                return ttl
+            # Measured from before the round trip, so the bucket never outlives the Redis window.
+            bucket.expires_at = now + ttl / 1000
+            bucket.tokens += granted
+        bucket.tokens -= cost
+        return 0
+
+    async def __call__(self, request: Request, response: Response):
+        """
+        The __call__ function lets the limiter be used as a FastAPI dependency.
+
+        :param self: Represent the instance of the class
+        :param request: Request: Identify the caller
+        :param response: Response: Passed to the callback when the request is rejected
+        :return: The callback result when the request is rejected, otherwise None
+        """
+        if not FastAPILimiter.redis:
+            raise Exception("You must call FastAPILimiter.init in startup event of fastapi!")
+        rate_key = await FastAPILimiter.identifier(request)
+        key = f"{FastAPILimiter.prefix}:{rate_key}:{self.times}:{self.milliseconds}"
+        pexpire = await self.acquire(key)
+        if pexpire != 0:
+            RATE_LIMIT_REJECTIONS.labels("ip").inc()
+            return await FastAPILimiter.http_callback(request, response, pexpire)
+
+
+class CostRateLimiter(HybridRateLimiter):
+    """
+    Per-user rate limiter where each route declares its cost.
+
+    All routes guarded by a CostRateLimiter draw from one budget per user and role,
+    so expensive queries use it up faster than cheap lookups. Budgets are set per role
+    in ``settings.rate_limit_budgets`` and refill every ``rate_limit_budget_seconds``.
+    """
+
+    def __init__(self, cost: int = 1):
+        """
+        The __init__ function sets the cost the route charges against the caller's budget.
+
+        :param self: Represent the instance of the class
+        :param cost: int: Number of budget units one request consumes
+        :return: None
+        """
+        super().__init__(times=max(settings.rate_limit_budgets.values()),
+                         seconds=settings.rate_limit_budget_seconds)
+        self.cost = cost
+
+    def request_cost(self, request: Request) -> int:
+        return self.cost
+
+    @staticmethod
+    def budget(role: str) -> int:
+        """
+        The budget function returns the number of units a role may spend per window.
+
+        :param role: str: Name of the user's role
+        :return: The budget of the role
+        """
+        return settings.rate_limit_budgets.get(role, settings.rate_limit_budgets["user"])
+
+    async def __call__(self, request: Request, response: Response,
+                       current_user: User = Depends(auth_service.get_current_user)):
+        """
+        The __call__ function charges the route's cost to the current user's budget.
+
+        :param self: Represent the instance of the class
+        :param request: Request: Passed to the callback when the request is rejected
+        :param response: Response: Passed to the callback when the request is rejected
+        :param current_user: User: The authenticated user whose budget is charged
+        :return: The callback result when the request is rejected, otherwise None
+        """
+        if not FastAPILimiter.redis:
+            raise Exception("You must call FastAPILimiter.init in startup event of fastapi!")
+        role = getattr(current_user.role, "name", current_user.role) or "user"
+        key = f"{FastAPILimiter.prefix}:user:{current_user.id}:{role}:{self.milliseconds}"
+        pexpire = await self.acquire(key, self.request_cost(request), self.budget(role))
+        if pexpire != 0:
+            RATE_LIMIT_REJECTIONS.labels("user").inc()
+            return await FastAPILimiter.http_callback(request, response, pexpire)
+
+
+class BatchCostRateLimiter(CostRateLimiter):
+    """
+    Cost limiter of batch routes: one request costs its base cost plus one unit for every
+    ``per_unit`` values of the ``param`` query parameter, so a batch is charged once, by its size.
+    """
+
+    def __init__(self, cost: int = 1, per_unit: int = 10, param: str = "ids"):
+        """
+        The __init__ function sets the base cost and how many items one more unit buys.
+
+        :param self: Represent the instance of the class
+        :param cost: int: Units charged for any request
+        :param per_unit: int: Items charged one unit
+        :param param: str: Query parameter holding the items
+        :return: None
+        """
+        super().__init__(cost)
+        self.per_unit = per_unit
+        self.param = param
+
+    def request_cost(self, request: Request) -> int:
+        return self.cost + math.ceil(len(request.query_params.getlist(self.param)) / self.per_unit)
@@ -0,0 +1,306 @@
+import time
+import threading
+import weakref
+
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from starlette.types import ASGIApp, Receive, Scope, Send, Message
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+class _Metric(ABC):
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        """
+        The __init__ function registers the metric in the module registry.
+
+        :param self: Represent the instance of the class
+        :param name: str: Metric name in Prometheus format
+        :param documentation: str: HELP text of the metric
+        :param labelnames: tuple: Names of the metric labels
+        :return: None
+        """
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.children = {}
+        self.lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def labels(self, *values):
+        """
+        The labels function returns the child series for the given label values, creating it on first use.
+
+        :param self: Represent the instance of the class
+        :param values: Label values in the order of labelnames
+        :return: The child series
+        """
+        child = self.children.get(values)
+        if child is None:
+            with self.lock:
+                child = self.children.setdefault(values, self._child())
+        return child
+
+    @abstractmethod
+    def _child(self):
+        """
+        The _child function creates the series of one combination of label values.
+
+        :param self: Represent the instance of the class
+        :return: A new child series
+        """
+
+    @abstractmethod
+    def _render_child(self, values: tuple, child) -> list[str]:
+        """
+        The _render_child function formats one child series in the Prometheus text format.
+
+        :param self: Represent the instance of the class
+        :param values: tuple: Label values of the child
+        :param child: The child series
+        :return: The exposition lines of the child
+        """
+
+    def _label_text(self, values: tuple, extra: str = "") -> str:
+        pairs = [f'{name}="{_escape(value)}"' for name, value in zip(self.labelnames, values)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for values, child in list(self.children.items()):
+            lines.extend(self._render_child(values, child))
+        return lines
+
+
+class _Value:
+    __slots__ = ("value", "lock")
+
+    def __init__(self):
+        self.value = 0.0
+        self.lock = threading.Lock()
+
+    def inc(self, amount: float = 1):
+        with self.lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1):
+        with self.lock:
+            self.value -= amount
+
+    def set(self, value: float):
+        self.value = value
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _child(self):
+        return _Value()
+
+    def _render_child(self, values, child):
+        return [f"{self.name}_total{self._label_text(values)} {child.value}"]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def _child(self):
+        return _Value()
+
+    def _render_child(self, values, child):
+        return [f"{self.name}{self._label_text(values)} {child.value}"]
+
+
+class _Observations:
+    __slots__ = ("bounds", "counts", "sum", "lock")
+
+    def __init__(self, bounds: tuple):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect_left(self.bounds, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    @contextmanager
+    def time(self):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        """
+        The __init__ function registers a histogram with the given bucket upper bounds.
+
+        :param self: Represent the instance of the class
+        :param name: str: Metric name in Prometheus format
+        :param documentation: str: HELP text of the metric
+        :param labelnames: tuple: Names of the metric labels
+        :param buckets: tuple: Sorted bucket upper bounds, +Inf is added automatically
+        :return: None
+        """
+        self.buckets = tuple(buckets)
+        super().__init__(name, documentation, labelnames)
+
+    def _child(self):
+        return _Observations(self.buckets)
+
+    def _render_child(self, values, child):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), child.counts):
+            cumulative += count
+            le = 'le="+Inf"' if bound == float("inf") else f'le="{float(bound)!r}"'
+            lines.append(f"{self.name}_bucket{self._label_text(values, le)} {cumulative}")
+        lines.append(f"{self.name}_sum{self._label_text(values)} {child.sum}")
+        lines.append(f"{self.name}_count{self._label_text(values)} {cumulative}")
+        return lines
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+REGISTRY: list[_Metric] = []
+
+HTTP_REQUEST_DURATION = Histogram("http_request_duration_seconds", "HTTP request latency",
+                                  ("method", "route", "status"))
+DB_QUERIES_PER_REQUEST = Histogram("db_queries_per_request", "Number of SQL statements per HTTP request",
+                                   ("route",), COUNT_BUCKETS)
+DB_TIME_PER_REQUEST = Histogram("db_time_per_request_seconds", "Time spent in SQL statements per HTTP request",
+                                ("route",))
+DB_QUERY_DURATION = Histogram("db_query_duration_seconds", "SQL statement latency", ("operation",))
+DB_SLOW_QUERIES = Counter("db_slow_queries", "SQL statements slower than the slow query threshold", ("route",))
+DB_REPEATED_QUERIES = Counter("db_repeated_queries", "Identical SQL fingerprints repeated within one request",
+                              ("route",))
+USER_CACHE = Counter("user_cache_requests", "Redis user cache lookups in get_current_user", ("result",))
+PASSWORD_HASH_DURATION = Histogram("password_hash_duration_seconds", "bcrypt hash and verify latency",
+                                   ("operation",))
+RATE_LIMIT_REJECTIONS = Counter("rate_limit_rejections", "Requests rejected by a rate limiter", ("limiter",))
+EMAIL_SEND_DURATION = Histogram("email_send_duration_seconds", "SMTP send latency", ("template",))
+AVATAR_UPLOAD_DURATION = Histogram("avatar_upload_duration_seconds", "Cloudinary avatar upload latency")
+DB_POOL_CONNECTIONS = Gauge("db_pool_connections", "Pooled database connections by state", ("pool", "state"))
+DB_POOL_WAITING = Gauge("db_pool_waiting", "Requests waiting for a pooled database connection", ("pool",))
+DB_POOL_WAIT = Histogram("db_pool_wait_seconds", "Time to check out a pooled database connection", ("pool",))
+DB_POOL_TIMEOUTS = Counter("db_pool_timeouts", "Checkouts that gave up waiting for a pooled connection", ("pool",))
+DB_STATEMENT_TIMEOUTS = Counter("db_statement_timeouts", "SQL statements interrupted by timeout or client disconnect",
+                                ("route", "reason"))
+CIRCUIT_STATE = Gauge("circuit_state", "Circuit breaker state: 0 closed, 1 half-open, 2 open", ("dependency",))
+DEPENDENCY_FAILURES = Counter("dependency_failures", "Failed or timed out calls to external dependencies",
+                              ("dependency",))
+ADMISSION_LIMIT = Gauge("admission_limit", "Current adaptive concurrency limit", ("group",))
+ADMISSION_IN_FLIGHT = Gauge("admission_in_flight", "Admitted requests in progress", ("group",))
+ADMISSION_QUEUE_TIME = Histogram("admission_queue_seconds", "Time spent waiting for admission", ("group",))
+ADMISSION_REJECTIONS = Counter("admission_rejections", "Requests shed by admission control", ("group", "reason"))
+SSE_SUBSCRIBERS = Gauge("sse_subscribers", "Client event streams connected to this worker")
+SSE_RESYNCS = Counter("sse_resyncs", "Event stream subscribers told to resync", ("reason",))
+AUDIT_FLUSH_DURATION = Histogram("audit_flush_seconds", "Latency of bulk inserts of audit entries")
+AUDIT_DROPPED = Counter("audit_dropped", "Audit entries dropped from a full in-memory buffer")
+READINESS_CHECK_DURATION = Histogram("readiness_check_seconds", "Latency of readiness checks by dependency",
+                                     ("dependency",))
+
+
+class RequestStats:
+    """
+    Per-request counters shared by the middleware and the database hooks through ``current_request``.
+    """
+    __slots__ = ("scope", "db_queries", "db_time", "fingerprints")
+
+    def __init__(self, scope: Scope = None):
+        self.scope = scope
+        self.db_queries = 0
+        self.db_time = 0.0
+        self.fingerprints = None
+
+    @property
+    def route(self) -> str:
+        return route_name(self.scope) if self.scope is not None else "unmatched"
+
+
+_route_maps: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+
+
+def route_name(scope: Scope) -> str:
+    """
+    The route_name function returns the path template of the route that handles the request,
+    so metrics and logs are labelled by ``/api/clients/{client_id}`` rather than by the raw path.
+
+    :param scope: Scope: ASGI scope of the request
+    :return: The route path template, or "unmatched" before routing or for mounted apps
+    """
+    endpoint = scope.get("endpoint")
+    if endpoint is None:
+        return "unmatched"
+    app = scope["app"]
+    routes = _route_maps.get(app)
+    if routes is None:
+        routes = _route_maps[app] = {route.endpoint: route.path for route in app.routes if hasattr(route, "endpoint")}
+    return routes.get(endpoint, "unmatched")
+
+
+current_request: ContextVar[RequestStats | None] = ContextVar("current_request", default=None)
+
+
+def render() -> str:
+    """
+    The render function returns every registered metric in the Prometheus text exposition format.
+
+    :return: The metrics page
+    """
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware that records the latency of every HTTP request by route template and status code,
+    and the number of SQL statements and time spent in the database while serving it.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        status_code = 500
+        stats = RequestStats(scope)
+        token = current_request.set(stats)
+
+        async def send_wrapper(message: Message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            current_request.reset(token)
+            route = stats.route
+            HTTP_REQUEST_DURATION.labels(scope["method"], route, str(status_code)).observe(elapsed)
+            DB_QUERIES_PER_REQUEST.labels(route).observe(stats.db_queries)
+            DB_TIME_PER_REQUEST.labels(route).observe(stats.db_time)
@@ -0,0 +1,232 @@
+import sys
+import json
+import time
+import uuid
+import asyncio
+import logging
+import threading
+
+from pathlib import Path
+from urllib.parse import parse_qs
+
+from starlette.types import ASGIApp, Receive, Scope, Send, Message
+
+from src.conf.config import settings
+from src.database.db import get_db
+from src.database.models import Role
+from src.services.auth import auth_service
+
+logger = logging.getLogger(__name__)
+
+PROJECT_ROOT = str(Path(__file__).resolve().parents[2])
+FORMATS = ("speedscope", "collapsed")
+
+
+class SamplingProfiler:
+    """
+    Wall-clock sampling profiler for a single request.
+
+    A background thread snapshots the stacks of the event loop thread and of every worker
+    thread that is running project code. When the event loop is idle waiting for I/O, the
+    sample is attributed to the request task's suspended coroutine chain instead, so time
+    spent awaiting Redis or the rate limiter shows up under the dependency that awaited it.
+    Sync dependencies such as get_db run in the threadpool and are sampled in their own thread.
+    Other requests served concurrently by the same worker can appear in the samples.
+    """
+
+    def __init__(self, interval: float, task: asyncio.Task = None):
+        """
+        The __init__ function prepares a profiler for the calling (event loop) thread.
+
+        :param self: Represent the instance of the class
+        :param interval: float: Seconds between samples
+        :param task: asyncio.Task: Task serving the request, used to attribute awaited time
+        :return: None
+        """
+        self.interval = interval
+        self.task = task
+        self.loop_thread = threading.get_ident()
+        self.frames = {}
+        self.frame_list = []
+        self.samples = {}
+        self.started = self.finished = 0.0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+
+    def start(self):
+        self.started = time.perf_counter()
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.finished = time.perf_counter()
+
+    def _frame_index(self, code) -> int:
+        key = (code.co_filename, code.co_firstlineno, code.co_name)
+        index = self.frames.get(key)
+        if index is None:
+            index = self.frames[key] = len(self.frame_list)
+            self.frame_list.append({"name": getattr(code, "co_qualname", code.co_name),
+                                    "file": code.co_filename, "line": code.co_firstlineno})
+        return index
+
+    def _stack(self, frame) -> list:
+        stack = []
+        while frame is not None:
+            stack.append(frame.f_code)
+            frame = frame.f_back
+        stack.reverse()
+        return stack
+
+    def _awaiting_stack(self) -> list:
+        if self.task is None or self.task.done():
+            return []
+        return [frame.f_code for frame in self.task.get_stack(limit=100)]
+
+    def _run(self):
+        own = threading.get_ident()
+        last = time.perf_counter()
+        while not self._stop.wait(self.interval):
+            now = time.perf_counter()
+            weight, last = now - last, now
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own:
+                    continue
+                stack = self._stack(frame)
+                if thread_id == self.loop_thread:
+                    if stack and stack[-1].co_filename.endswith("selectors.py"):
+                        awaiting = self._awaiting_stack()
+                        if awaiting:
+                            stack = awaiting
+                elif not any(code.co_filename.startswith(PROJECT_ROOT) and "site-packages" not in code.co_filename
+                             for code in stack):
+                    continue
+                key = (thread_id, tuple(self._frame_index(code) for code in stack))
+                self.samples[key] = self.samples.get(key, 0.0) + weight
+
+    def collapsed(self) -> str:
+        """
+        The collapsed function renders the samples in Brendan Gregg's collapsed stack format.
+
+        :param self: Represent the instance of the class
+        :return: One "thread;frame;frame weight_in_microseconds" line per distinct stack
+        """
+        lines = []
+        for (thread_id, stack), weight in self.samples.items():
+            names = [f"thread-{thread_id}"] + [self.frame_list[index]["name"] for index in stack]
+            lines.append(f"{';'.join(names)} {int(weight * 1e6)}")
+        return "\n".join(lines) + "\n"
+
+    def speedscope(self, name: str) -> dict:
+        """
+        The speedscope function renders the samples as a speedscope "sampled" profile per thread.
+
+        :param self: Represent the instance of the class
+        :param name: str: Name shown in the speedscope UI
+        :return: A dict following https://www.speedscope.app/file-format-schema.json
+        """
+        profiles = {}
+        for (thread_id, stack), weight in self.samples.items():
+            profile = profiles.setdefault(thread_id, {
+                "type": "sampled", "name": "event loop" if thread_id == self.loop_thread else f"thread {thread_id}",
+                "unit": "milliseconds", "startValue": 0, "endValue": 0, "samples": [], "weights": [],
+            })
+            profile["samples"].append(list(stack))
+            profile["weights"].append(weight * 1000)
+            profile["endValue"] += weight * 1000
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": name,
+            "exporter": "src.services.profiler",
+            "activeProfileIndex": 0,
+            "shared": {"frames": self.frame_list},
+            "profiles": list(profiles.values()),
+        }
+
+
+async def is_admin(scope: Scope, token: str) -> bool:
+    """
+    The is_admin function checks that the bearer token belongs to an admin.
+    It honours dependency overrides of get_db so it uses the same database as the routes.
+
+    :param scope: Scope: ASGI scope of the request
+    :param token: str: Bearer access token
+    :return: True if the token belongs to an admin
+    """
+    provider = scope["app"].dependency_overrides.get(get_db, get_db)
+    sessions = provider()
+    db = next(sessions)
+    try:
+        user = await auth_service.get_current_user(token, db)
+    except Exception:
+        return False
+    finally:
+        sessions.close()
+    role = getattr(user.role, "name", user.role)
+    return role == Role.admin.name
+
+
+class ProfilingMiddleware:
+    """
+    ASGI middleware that profiles a single request on demand.
+
+    A request is profiled when it carries the ``X-Profile`` header (or a ``profile`` query parameter)
+    with the value ``speedscope`` or ``collapsed`` and a bearer token of an admin. The profile is
+    written to ``settings.profile_dir`` and its file name is returned in the ``X-Profile-File`` header.
+    Requests without the flag only pay for a scan of the header list.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    @staticmethod
+    def _requested(scope: Scope) -> tuple[str | None, str | None]:
+        profile = token = None
+        for name, value in scope["headers"]:
+            if name == b"x-profile":
+                profile = value.decode("latin-1")
+            elif name == b"authorization":
+                token = value.decode("latin-1")
+        if profile is None and b"profile=" in scope["query_string"]:
+            profile = parse_qs(scope["query_string"].decode("latin-1")).get("profile", [None])[0]
+        if profile is None or token is None or not token.lower().startswith("bearer "):
+            return None, None
+        return (profile if profile in FORMATS else FORMATS[0]), token[7:]
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        profile_format, token = self._requested(scope)
+        if profile_format is None or not await is_admin(scope, token):
+            await self.app(scope, receive, send)
+            return
+
+        suffix = "speedscope.json" if profile_format == "speedscope" else "collapsed.txt"
+        filename = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}.{suffix}"
+
+        async def send_wrapper(message: Message):
+            if message["type"] == "http.response.start":
+                message.setdefault("headers", [])
+                message["headers"] = list(message["headers"]) + [(b"x-profile-file", filename.encode())]
+            await send(message)
+
+        profiler = SamplingProfiler(settings.profile_interval_ms / 1000, asyncio.current_task())
+        profiler.start()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            profiler.stop()
+            self._store(profiler, profile_format, filename, f"{scope['method']} {scope['path']}")
+
+    @staticmethod
+    def _store(profiler: SamplingProfiler, profile_format: str, filename: str, name: str):
+        directory = Path(settings.profile_dir)
+        directory.mkdir(parents=True, exist_ok=True)
+        if profile_format == "speedscope":
+            content = json.dumps(profiler.speedscope(name))
+        else:
+            content = profiler.collapsed()
+        (directory / filename).write_text(content)
+        logger.info("Stored profile of %s in %s", name, directory / filename)
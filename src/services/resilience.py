@@ -0,0 +1,170 @@
+import time
+import asyncio
+import logging
+import threading
+
+from redis.exceptions import ConnectionError as RedisConnectionError, TimeoutError as RedisTimeoutError
+
+from src.conf.config import settings
+from src.services.metrics import CIRCUIT_STATE, DEPENDENCY_FAILURES
+
+logger = logging.getLogger(__name__)
+
+CLOSED, HALF_OPEN, OPEN = 0, 1, 2
+STATE_NAMES = {CLOSED: "closed", HALF_OPEN: "half-open", OPEN: "open"}
+
+
+class DependencyUnavailable(Exception):
+    def __init__(self, dependency: str, retry_after: float = 1.0):
+        super().__init__(f"{dependency} is unavailable")
+        self.dependency = dependency
+        self.retry_after = retry_after
+
+
+class CircuitOpenError(DependencyUnavailable):
+    pass
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker of one external dependency.
+
+    After ``failure_threshold`` consecutive failures the circuit opens and calls fail immediately
+    with CircuitOpenError for ``reset_timeout`` seconds. Then a single trial call is let through
+    (half-open): its success closes the circuit, its failure opens it again.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0,
+                 exceptions: tuple = (Exception,)):
+        """
+        The __init__ function creates a closed circuit.
+
+        :param self: Represent the instance of the class
+        :param name: str: Dependency name, used in metrics and errors
+        :param failure_threshold: int: Consecutive failures that open the circuit
+        :param reset_timeout: float: Seconds the circuit stays open before a trial call
+        :param exceptions: tuple: Exception types counted as failures, any other error means the dependency answered
+        :return: None
+        """
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.exceptions = exceptions + (asyncio.TimeoutError,)
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.lock = threading.Lock()
+        CIRCUIT_STATE.labels(name).set(CLOSED)
+
+    def _set_state(self, state: int):
+        if state != self.state:
+            logger.warning("Circuit %s is %s", self.name, STATE_NAMES[state])
+        self.state = state
+        CIRCUIT_STATE.labels(self.name).set(state)
+
+    @property
+    def retry_after(self) -> float:
+        return max(0.0, self.opened_at + self.reset_timeout - time.monotonic())
+
+    def allow(self):
+        """
+        The allow function raises CircuitOpenError unless the call may go through.
+
+        :param self: Represent the instance of the class
+        :return: None
+        """
+        with self.lock:
+            if self.state == CLOSED:
+                return
+            if self.state == OPEN and self.retry_after <= 0:
+                self._set_state(HALF_OPEN)
+                return
+        raise CircuitOpenError(self.name, self.retry_after or 1.0)
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self._set_state(CLOSED)
+
+    def record_failure(self):
+        DEPENDENCY_FAILURES.labels(self.name).inc()
+        with self.lock:
+            self.failures += 1
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+                self._set_state(OPEN)
+
+    def release_trial(self):
+        """
+        The release_trial function frees the trial of a half-open circuit whose call was cancelled,
+        e.g. on client disconnect. A cancelled call says nothing about the dependency, so the next
+        call may be the trial right away; without this the circuit would stay half-open for good.
+
+        :param self: Represent the instance of the class
+        :return: None
+        """
+        with self.lock:
+            if self.state == HALF_OPEN:
+                self.opened_at = time.monotonic() - self.reset_timeout
+                self._set_state(OPEN)
+
+    def reset(self):
+        with self.lock:
+            self.failures = 0
+            self._set_state(CLOSED)
+
+    def call(self, func, *args, **kwargs):
+        """
+        The call function runs a blocking call through the breaker.
+
+        :param self: Represent the instance of the class
+        :param func: Callable to run
+        :return: The result of func
+        """
+        self.allow()
+        try:
+            result = func(*args, **kwargs)
+        except self.exceptions:
+            self.record_failure()
+            raise
+        except Exception:
+            self.record_success()
+            raise
+        except BaseException:
+            self.release_trial()
+            raise
+        self.record_success()
+        return result
+
+    async def call_async(self, func, *args, timeout: float = None, **kwargs):
+        """
+        The call_async function awaits a coroutine function through the breaker, with an optional timeout.
+
+        :param self: Represent the instance of the class
+        :param func: Coroutine function to await
+        :param timeout: float: Seconds to wait before the call counts as failed
+        :return: The result of func
+        """
+        self.allow()
+        try:
+            result = await asyncio.wait_for(func(*args, **kwargs), timeout)
+        except self.exceptions:
+            self.record_failure()
+            raise
+        except Exception:
+            self.record_success()
+            raise
+        except BaseException:
+            self.release_trial()
+            raise
+        self.record_success()
+        return result
+
+
+def _breaker(name: str, exceptions: tuple = (Exception,)) -> CircuitBreaker:
+    return CircuitBreaker(name, settings.breaker_failure_threshold, settings.breaker_reset_seconds, exceptions)
+
+
+redis_breaker = _breaker("redis", (RedisConnectionError, RedisTimeoutError, OSError))
+smtp_breaker = _breaker("smtp")
+cloudinary_breaker = _breaker("cloudinary", (DependencyUnavailable,))
@@ -0,0 +1,189 @@
+import time
+import asyncio
+
+from contextvars import ContextVar
+
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from src.conf.config import settings
+from src.services.metrics import route_name
+
+SQLITE_PROGRESS_OPS = 10_000
+PG_QUERY_CANCELED = "57014"
+
+
+class StatementTimeoutError(Exception):
+    def __init__(self, reason: str):
+        super().__init__(f"Statement interrupted: {reason}")
+        self.reason = reason
+
+
+def route_timeout(route: str) -> float:
+    """
+    The route_timeout function returns the statement timeout of a route in seconds.
+
+    :param route: str: Route path template, e.g. /api/clients/search/
+    :return: The timeout from statement_timeouts_ms, or statement_timeout_ms for other routes
+    """
+    return settings.statement_timeouts_ms.get(route, settings.statement_timeout_ms) / 1000
+
+
+class StatementGuard:
+    """
+    Statement timeout and cancellation state of one request.
+
+    Sessions created by get_db and get_read_db attach the guard to every connection they begin a
+    transaction on: PostgreSQL gets ``SET LOCAL statement_timeout``, SQLite gets a progress handler
+    that aborts a statement running longer than the timeout. ``cancel`` interrupts the statement in
+    progress (psycopg2 ``cancel``, sqlite3 ``interrupt``) and is safe to call from another thread.
+    """
+
+    def __init__(self, scope: Scope = None, timeout: float = None):
+        """
+        The __init__ function creates the guard of a request.
+
+        :param self: Represent the instance of the class
+        :param scope: Scope: ASGI scope, used to look up the route timeout once the route is known
+        :param timeout: float: Timeout in seconds, overrides the route timeout
+        :return: None
+        """
+        self.scope = scope
+        self._timeout = timeout
+        self.started = 0.0
+        self.executing = False
+        self.reason = None
+        self.connections = {}
+
+    @property
+    def timeout(self) -> float:
+        if self._timeout is None:
+            route = route_name(self.scope) if self.scope is not None else None
+            self._timeout = route_timeout(route)
+        return self._timeout
+
+    @property
+    def route(self) -> str:
+        return route_name(self.scope) if self.scope is not None else "-"
+
+    def attach(self, connection):
+        """
+        The attach function applies the timeout to a connection at the start of a transaction.
+
+        :param self: Represent the instance of the class
+        :param connection: Connection: SQLAlchemy connection the session began on
+        :return: None
+        """
+        dbapi = connection.connection.dbapi_connection
+        dialect = connection.dialect.name
+        if dialect == "postgresql":
+            connection.exec_driver_sql(f"SET LOCAL statement_timeout = {int(self.timeout * 1000)}")
+        elif dialect == "sqlite":
+            dbapi.set_progress_handler(self._progress, SQLITE_PROGRESS_OPS)
+        connection.info["statement_guard"] = self
+        self.connections[id(dbapi)] = (dialect, dbapi, connection.info)
+
+    def detach(self):
+        for dialect, dbapi, info in self.connections.values():
+            if dialect == "sqlite":
+                dbapi.set_progress_handler(None, 0)
+            info.pop("statement_guard", None)
+        self.connections.clear()
+
+    def _progress(self) -> int:
+        if self.reason is not None:
+            return 1
+        if time.monotonic() - self.started > self.timeout:
+            self.reason = "timeout"
+            return 1
+        return 0
+
+    def cancel(self, reason: str = "disconnect"):
+        """
+        The cancel function interrupts the statement the request is running, if any.
+
+        :param self: Represent the instance of the class
+        :param reason: str: Reason recorded in metrics
+        :return: None
+        """
+        if not self.executing:
+            return
+        self.reason = self.reason or reason
+        for dialect, dbapi, _ in list(self.connections.values()):
+            if dialect == "postgresql":
+                dbapi.cancel()
+            elif dialect == "sqlite":
+                dbapi.interrupt()
+
+    def interrupted(self, error: Exception) -> str | None:
+        """
+        The interrupted function tells whether a database error was caused by this guard.
+
+        :param self: Represent the instance of the class
+        :param error: Exception: Error raised by the driver
+        :return: "timeout" or "disconnect", or None for unrelated errors
+        """
+        if self.reason is not None:
+            return self.reason
+        if getattr(getattr(error, "orig", None), "pgcode", None) == PG_QUERY_CANCELED:
+            return "timeout"
+        return None
+
+
+current_guard: ContextVar[StatementGuard | None] = ContextVar("current_guard", default=None)
+
+
+def _has_body(scope: Scope) -> bool:
+    for name, value in scope["headers"]:
+        if name == b"transfer-encoding" or (name == b"content-length" and value != b"0"):
+            return True
+    return False
+
+
+class StatementTimeoutMiddleware:
+    """
+    ASGI middleware that gives each request a StatementGuard and cancels its database statement
+    when the client disconnects.
+
+    Once the request body has been read, a watcher task waits for ``http.disconnect``; messages
+    it receives are handed on to the application unchanged. The watcher can only react while the
+    event loop is free, which is why the repositories run their statements in the threadpool;
+    a statement run inline on the event loop is bounded by the statement timeout only.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        guard = StatementGuard(scope)
+        token = current_guard.set(guard)
+        messages = asyncio.Queue()
+        watcher = None
+
+        async def watch():
+            while True:
+                message = await receive()
+                messages.put_nowait(message)
+                if message["type"] == "http.disconnect":
+                    guard.cancel("disconnect")
+                    return
+
+        async def receive_wrapper():
+            nonlocal watcher
+            if watcher is not None:
+                return await messages.get()
+            message = await receive()
+            if message["type"] == "http.request" and not message.get("more_body", False):
+                watcher = asyncio.create_task(watch())
+            return message
+
+        if not _has_body(scope):
+            watcher = asyncio.create_task(watch())
+        try:
+            await self.app(scope, receive_wrapper, send)
+        finally:
+            current_guard.reset(token)
+            if watcher is not None:
+                watcher.cancel()
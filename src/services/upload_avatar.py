@@ -1,17 +1,47 @@
 import hashlib
-import cloudinary
-import cloudinary.uploader
+
+from functools import lru_cache
 
 from src.conf.config import settings
+from src.services.metrics import AVATAR_UPLOAD_DURATION
+from src.services.resilience import cloudinary_breaker, DependencyUnavailable
 
 
-class UploadService:
+@lru_cache(maxsize=None)
+def cloudinary_sdk():
+    """
+    The cloudinary_sdk function imports and configures the cloudinary SDK on first use, so importing
+    the app does not pay for it (and for its urllib3 and certifi imports) until an avatar is uploaded.
+
+    :return: The configured cloudinary module
+    """
+    import cloudinary
+    import cloudinary.uploader
+    import cloudinary.exceptions
+
     cloudinary.config(
         cloud_name=settings.cloudinary_name,
         api_key=settings.cloudinary_api_key,
         api_secret=settings.cloudinary_api_secret,
         secure=True
     )
+    return cloudinary
+
+
+def _upload(file, public_id):
+    cloudinary = cloudinary_sdk()
+    # raised by cloudinary for transport failures and 5xx answers; subclasses are client errors
+    unavailable = (cloudinary.exceptions.Error, cloudinary.exceptions.GeneralError)
+    try:
+        return cloudinary.uploader.upload(file, public_id=public_id, overwrite=True,
+                                          timeout=settings.cloudinary_timeout_seconds)
+    except cloudinary.exceptions.Error as error:
+        if type(error) in unavailable:
+            raise DependencyUnavailable("cloudinary") from error
+        raise
+
+
+class UploadService:
 
     @staticmethod
     def create_name_avatar(email: str, prefix: str):
@@ -39,7 +69,8 @@ class UploadService:
         :param public_id: Set the public id of the image
         :return: A dictionary with the following fields
         """
-        r = cloudinary.uploader.upload(file, public_id=public_id, overwrite=True)
+        with AVATAR_UPLOAD_DURATION.labels().time():
+            r = cloudinary_breaker.call(_upload, file, public_id)
         return r
 
     @staticmethod
@@ -52,7 +83,7 @@ class UploadService:
         :param version: Get the latest version of an image
         :return: A url to an image
         """
-        src_url = cloudinary.CloudinaryImage(public_id).build_url(width=250, height=250, crop="fill", version=version)
+        src_url = cloudinary_sdk().CloudinaryImage(public_id).build_url(width=250, height=250, crop="fill", version=version)
         return src_url
 
     
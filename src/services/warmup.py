@@ -0,0 +1,123 @@
+import time
+import asyncio
+import logging
+
+from sqlalchemy import text
+
+from src.conf.config import settings
+from src.database.db import SessionLocal, replica_router
+from src.repository import users as repository_users
+from src.services.auth import auth_service
+
+logger = logging.getLogger(__name__)
+
+
+class WarmupState:
+    """
+    Readiness of the worker. It is ready unless a warm-up is running, so the health check
+    reports the worker as not ready until the first requests no longer pay for cold caches.
+    """
+
+    def __init__(self):
+        self.ready = True
+        self.report = {}
+
+    def start(self):
+        self.ready = False
+        self.report = {}
+
+    def finish(self):
+        self.ready = True
+
+
+state = WarmupState()
+
+
+def open_connections(bind, count: int) -> int:
+    """
+    The open_connections function checks out count connections at once and returns them to the pool,
+    so the pool keeps them open for the first requests. Only pool_size connections stay pooled.
+
+    :param bind: Engine: The engine whose pool is filled
+    :param count: int: Number of connections to open
+    :return: The number of connections opened
+    """
+    size = getattr(bind.pool, "size", None)
+    if callable(size):
+        count = min(count, size())
+    connections = []
+    try:
+        for _ in range(count):
+            connection = bind.connect()
+            connections.append(connection)
+            connection.execute(text("SELECT 1"))
+    finally:
+        for connection in connections:
+            connection.close()
+    return len(connections)
+
+
+def warm_password_hashing() -> bool:
+    """
+    The warm_password_hashing function hashes and verifies one password, which loads passlib
+    and detects its bcrypt backend.
+
+    :return: True if the password verified
+    """
+    return auth_service.verify_password("warm-up", auth_service.get_password_hash("warm-up"))
+
+
+async def warm_tokens() -> bool:
+    """
+    The warm_tokens function creates and decodes one access token, which prepares the jose key.
+
+    :return: True if the token decoded to its subject
+    """
+    token = await auth_service.create_access_token(data={"sub": "warm-up"})
+    return await auth_service.decode_access_token(token) == "warm-up"
+
+
+async def load_active_users(limit: int) -> int:
+    """
+    The load_active_users function puts the users that logged in last into the Redis user cache.
+    Without recorded logins the newest logged-in users are loaded.
+
+    :param limit: int: Maximum number of users to load
+    :return: The number of users cached
+    """
+    db = SessionLocal()
+    try:
+        users = await repository_users.get_active_users(auth_service.recent_logins(limit), limit, db)
+    finally:
+        db.close()
+    return sum(auth_service.cache_user(user) for user in users)
+
+
+async def warm_up():
+    """
+    The warm_up function runs every warm-up step and records in state.report how long each one took
+    and what it did. A failing step is logged and skipped: the worker becomes ready regardless,
+    it only stays cold where the step failed.
+
+    :return: None
+    """
+    steps = {
+        "connections": lambda: asyncio.to_thread(
+            lambda: sum(open_connections(bind, settings.warmup_connections)
+                        for bind in replica_router.engines())),
+        "passwords": lambda: asyncio.to_thread(warm_password_hashing),
+        "tokens": warm_tokens,
+        "users": lambda: load_active_users(settings.warmup_users),
+    }
+    try:
+        for name, step in steps.items():
+            start = time.perf_counter()
+            try:
+                result = await step()
+            except Exception as error:
+                logger.warning("Warm-up step %s failed: %r", name, error)
+                result = None
+            state.report[name] = {"result": result, "seconds": round(time.perf_counter() - start, 4)}
+        logger.info("Warm-up done: %s", state.report)
+    finally:
+        state.finish()
@@ -0,0 +1,175 @@
+import time
+import logging
+
+from datetime import date
+
+import pytest
+from fastapi import Request, Response
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import InvalidRequestError, TimeoutError as PoolTimeoutError
+
+from src.conf.config import settings
+from src.database import db as database
+from src.database.db import (fingerprint, instrument_engine, pool_options, ReplicaRouter, ReadSessionLocal, SessionLocal,
+                             get_read_db)
+from src.database.models import Base, Client
+from src.services.metrics import (RequestStats, current_request, DB_POOL_CONNECTIONS, DB_POOL_WAIT, DB_POOL_TIMEOUTS,
+                                  DB_POOL_WAITING)
+
+
+@pytest.fixture()
+def engine():
+    return instrument_engine(create_engine("sqlite://"))
+
+
+@pytest.fixture()
+def stats():
+    stats = RequestStats()
+    token = current_request.set(stats)
+    yield stats
+    current_request.reset(token)
+
+
+def test_fingerprint_normalizes_literals_and_parameters():
+    first = fingerprint("SELECT * FROM users WHERE email = 'a@b.c' AND id = 10")
+    second = fingerprint("SELECT *  FROM users\nWHERE email = 'x@y.z' AND id = 7")
+    assert first == second == "SELECT * FROM users WHERE email = ? AND id = ?"
+
+
+def test_fingerprint_collapses_in_lists():
+    assert fingerprint("SELECT 1 FROM t WHERE id IN (?, ?, ?)") == fingerprint("SELECT 1 FROM t WHERE id IN (?, ?)")
+
+
+def test_query_count_attached_to_request(engine, stats):
+    with engine.connect() as conn:
+        conn.execute(text("SELECT 1"))
+        conn.execute(text("SELECT 2"))
+    assert stats.db_queries == 2
+    assert stats.db_time > 0
+
+
+def test_slow_query_logged(engine, stats, monkeypatch, caplog):
+    monkeypatch.setattr(settings, "slow_query_ms", 0)
+    with caplog.at_level(logging.WARNING, logger="src.database.db"):
+        with engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+    assert "Slow query" in caplog.text
+
+
+def test_repeated_fingerprint_flagged_in_debug_mode(engine, stats, monkeypatch, caplog):
+    monkeypatch.setattr(settings, "sql_debug", True)
+    with caplog.at_level(logging.WARNING, logger="src.database.db"):
+        with engine.connect() as conn:
+            conn.execute(text("SELECT :x"), {"x": 1})
+            conn.execute(text("SELECT :x"), {"x": 2})
+    assert "Possible N+1" in caplog.text
+    assert stats.fingerprints["SELECT ?"] == 2
+
+
+@pytest.fixture()
+def replicas(tmp_path):
+    engines = []
+    for name in ("replica_1", "replica_2"):
+        bind = create_engine(f"sqlite:///{tmp_path / name}.db")
+        Base.metadata.create_all(bind=bind)
+        with bind.begin() as conn:
+            conn.execute(Client.__table__.insert().values(firstname=name, lastname="Replica", email=f"{name}@example.com",
+                                                         phone_number="+380630000000", birthday=date(1990, 1, 1)))
+        engines.append(bind)
+    yield engines
+    for bind in engines:
+        bind.dispose()
+
+
+def make_request(cookie: str = None) -> Request:
+    headers = [(b"cookie", cookie.encode())] if cookie else []
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": headers, "query_string": b""})
+
+
+def test_round_robin_alternates_replicas(engine, replicas):
+    router = ReplicaRouter(engine, replicas)
+    assert [router.pick() for _ in range(4)] == replicas * 2
+
+
+def test_lag_aware_skips_lagging_replica(engine, replicas, monkeypatch):
+    lags = {replicas[0]: 30.0, replicas[1]: 0.5}
+    monkeypatch.setattr(ReplicaRouter, "measure_lag", staticmethod(lambda bind: lags[bind]))
+    router = ReplicaRouter(engine, replicas, "lag", max_lag=5.0, check_interval=0)
+    assert router.pick() is replicas[1]
+    lags[replicas[1]] = float("inf")
+    assert router.pick() is engine
+
+
+def test_unknown_strategy_rejected(engine):
+    with pytest.raises(ValueError):
+        ReplicaRouter(engine, [], "random")
+
+
+def test_read_session_is_read_only(replicas):
+    session = ReadSessionLocal(bind=replicas[0])
+    session.add(Client(firstname="New", lastname="Client", email="new@example.com", phone_number="+380631111111",
+                       birthday=date(1990, 1, 1)))
+    with pytest.raises(InvalidRequestError):
+        session.flush()
+    session.close()
+
+
+def test_get_read_db_routes_to_replica(engine, replicas, monkeypatch):
+    monkeypatch.setattr(database, "replica_router", ReplicaRouter(engine, replicas))
+    primary = object()
+    names = []
+    for _ in range(2):
+        sessions = get_read_db(make_request(), primary)
+        session = next(sessions)
+        names.append(session.query(Client.firstname).scalar())
+        sessions.close()
+    assert names == ["replica_1", "replica_2"]
+
+
+def test_get_read_db_sticks_to_primary_after_write(engine, replicas, monkeypatch):
+    monkeypatch.setattr(database, "replica_router", ReplicaRouter(engine, replicas))
+    primary = object()
+    sessions = get_read_db(make_request(f"rw_until={time.time() + 5}"), primary)
+    assert next(sessions) is primary
+    sessions = get_read_db(make_request(f"rw_until={time.time() - 5}"), primary)
+    assert next(sessions) is not primary
+
+
+def test_commit_sets_read_your_writes_cookie(replicas):
+    response = Response()
+    session = SessionLocal(bind=replicas[0])
+    session.info["response"] = response
+    session.commit()
+    session.close()
+    assert response.headers["set-cookie"].startswith("rw_until=")
+
+
+def test_pool_options_follow_settings(monkeypatch):
+    monkeypatch.setattr(settings, "db_pool_size", 7)
+    monkeypatch.setattr(settings, "db_pool_fail_fast", False)
+    options = pool_options("postgresql://localhost/db", "primary")
+    assert options["pool_size"] == 7
+    assert options["pool_timeout"] == settings.db_pool_timeout
+    assert pool_options("sqlite://", "memory") == {}
+
+
+def test_pool_fails_fast_and_reports_saturation(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "db_pool_size", 1)
+    monkeypatch.setattr(settings, "db_max_overflow", 0)
+    monkeypatch.setattr(settings, "db_pool_fail_fast", True)
+    monkeypatch.setattr(settings, "db_pool_wait_budget_ms", 20)
+    url = f"sqlite:///{tmp_path / 'pool.db'}"
+    bind = create_engine(url, **pool_options(url, "test_pool"))
+    timeouts = DB_POOL_TIMEOUTS.labels("test_pool").value
+    with bind.connect():
+        assert DB_POOL_CONNECTIONS.labels("test_pool", "checked_out").value == 1
+        start = time.perf_counter()
+        with pytest.raises(PoolTimeoutError):
+            bind.connect()
+        assert time.perf_counter() - start < 1
+    assert DB_POOL_TIMEOUTS.labels("test_pool").value == timeouts + 1
+    assert DB_POOL_CONNECTIONS.labels("test_pool", "checked_out").value == 0
+    assert DB_POOL_CONNECTIONS.labels("test_pool", "idle").value == 1
+    assert DB_POOL_WAITING.labels("test_pool").value == 0
+    assert sum(DB_POOL_WAIT.labels("test_pool").counts) == 2
+    bind.dispose()
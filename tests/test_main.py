@@ -1,6 +1,17 @@
+import sys
+import asyncio
+import subprocess
+from pathlib import Path
+from unittest.mock import patch
+
+from fastapi import APIRouter
+from fastapi_limiter import FastAPILimiter
 from fastapi.testclient import TestClient
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
 
-from main import app
+import main
+from main import app, create_app
+from src.database.db import SessionLocal, create_engines, replica_router
 
 client = TestClient(app)
 
@@ -10,3 +21,54 @@ def test_read_main():
     assert response.status_code == 200
 
 
+def test_lifespan_owns_the_engines(tmp_path):
+    created = []
+
+    def engines():
+        created.append(create_engines(f"sqlite:///{tmp_path / 'lifespan.db'}", []))
+        return created[-1]
+
+    async def scenario():
+        other = create_app()
+        async with main.lifespan(other):
+            engine = other.state.engine
+            assert engine is created[0][0] and other.state.replica_engines == []
+            assert other.state.session_factory is SessionLocal and SessionLocal.kw["bind"] is engine
+            assert replica_router.engines() == [engine]
+            tasks = asyncio.all_tasks() - {asyncio.current_task()}
+        assert all(task.done() for task in tasks)
+        return engine
+
+    with patch.object(FastAPILimiter, "redis", None), patch.object(main, "create_engines", engines):
+        engine = asyncio.run(scenario())
+    assert SessionLocal.kw["bind"] is None and replica_router.engines() == []
+    assert engine.pool.checkedin() == 0
+
+
+def test_pool_timeout_returns_503():
+    router = APIRouter()
+
+    @router.get("/test/pool-timeout")
+    def exhausted():
+        raise PoolTimeoutError("QueuePool limit reached")
+
+    app.include_router(router)
+    try:
+        response = client.get("/test/pool-timeout")
+    finally:
+        app.router.routes.pop()
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "1"
+
+
+def test_create_app_builds_independent_apps():
+    other = create_app()
+    assert other is not app
+    assert {route.path for route in other.routes} >= {"/", "/metrics", "/api/clients/", "/api/auth/login"}
+
+
+def test_heavy_modules_load_lazily():
+    code = "import sys, main; print(sorted(m for m in ('cloudinary', 'fastapi_mail', 'passlib') if m in sys.modules))"
+    result = subprocess.run([sys.executable, "-c", code], cwd=Path(__file__).parents[1], capture_output=True,
+                            text=True, check=True)
+    assert result.stdout.strip() == "[]"
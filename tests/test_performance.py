@@ -0,0 +1,183 @@
+import os
+import json
+import pickle
+import time
+import statistics
+import tempfile
+from pathlib import Path
+from unittest.mock import MagicMock, AsyncMock, patch
+
+import pytest
+from sqlalchemy import event
+
+from src.database.models import User
+from src.services.auth import auth_service
+
+# Latencies are compared with tests/perf_baseline.json. To record a new baseline run the test with
+# PERF_RECORD_BASELINE=1; it is written to PERF_BASELINE_OUTPUT (a temp file by default) for review
+# and is copied over the checked-in one by hand.
+BASELINE_FILE = Path(__file__).parent / "perf_baseline.json"
+BASELINE_OUTPUT = Path(os.environ.get("PERF_BASELINE_OUTPUT", Path(tempfile.gettempdir()) / "perf_baseline.json"))
+RECORD_BASELINE = os.environ.get("PERF_RECORD_BASELINE") == "1"
+TOLERANCE = float(os.environ.get("PERF_TOLERANCE", "0.3"))
+ROUNDS = 30
+REPEATS = 3
+
+CLIENT = {
+    "firstname": "Petro",
+    "lastname": "Petrenko",
+    "email": "petro@example.com",
+    "phone_number": "+380631112233",
+    "birthday": "1990-08-19",
+    "additional_data": "some text",
+}
+
+QUERY_BUDGETS = {
+    "GET /api/clients/{client_id}": 1,
+    "GET /api/clients/": 1,
+    "GET /api/clients/search/": 1,
+    "GET /api/clients/birthday/": 1,
+    "GET /api/users/me/": 0,
+}
+LOGIN_QUERY_BUDGET = 3
+
+ROUTES = {
+    "GET /api/clients/{client_id}": "/api/clients/1",
+    "GET /api/clients/": "/api/clients/",
+    "GET /api/clients/search/": "/api/clients/search/?data=petr",
+    "GET /api/clients/birthday/": "/api/clients/birthday/",
+    "GET /api/users/me/": "/api/users/me/",
+}
+
+
+class QueryCounter:
+    def __init__(self, bind):
+        self.bind = bind
+        self.statements = []
+
+    def _record(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+    def __enter__(self):
+        self.statements.clear()
+        event.listen(self.bind, "after_cursor_execute", self._record)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.bind, "after_cursor_execute", self._record)
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+
+def limiter_redis():
+    """Redis of FastAPILimiter that grants every lease of the rate limiters."""
+    return AsyncMock(evalsha=AsyncMock(return_value=[1, 60000, 0]))
+
+
+@pytest.fixture()
+def queries(session):
+    return QueryCounter(session.get_bind())
+
+
+@pytest.fixture()
+def limiter(monkeypatch):
+    monkeypatch.setattr('fastapi_limiter.FastAPILimiter.redis', limiter_redis())
+    monkeypatch.setattr('fastapi_limiter.FastAPILimiter.identifier', AsyncMock())
+    monkeypatch.setattr('fastapi_limiter.FastAPILimiter.http_callback', AsyncMock())
+
+
+@pytest.fixture()
+def admin(client, user, session, monkeypatch):
+    monkeypatch.setattr("src.routes.auth.send_email", MagicMock())
+    client.post("/api/auth/signup", json=user)
+    current_user: User = session.query(User).filter(User.email == user.get('email')).first()
+    current_user.confirmed = True
+    current_user.role = "admin"
+    session.commit()
+    response = client.post("/api/auth/login", data={"username": user.get('email'), "password": user.get('password')})
+    current_user = session.query(User).filter(User.email == user.get('email')).first()
+    return {"token": response.json()["access_token"], "cached": pickle.dumps(current_user)}
+
+
+@pytest.fixture()
+def warm_cache(admin):
+    with patch.object(auth_service, "r") as redis_mock:
+        redis_mock.get.side_effect = lambda key: admin["cached"] if key.startswith("user:") else None
+        yield redis_mock
+
+
+@pytest.fixture()
+def seeded(client, admin, limiter):
+    with patch.object(auth_service, "r") as redis_mock:
+        redis_mock.get.return_value = None
+        client.post("/api/clients/", json=CLIENT, headers={"Authorization": f"Bearer {admin['token']}"})
+
+
+def calibrate() -> float:
+    """
+    Time of a fixed CPU-bound loop, used to normalize latencies across machines.
+    """
+    samples = []
+    for _ in range(5):
+        start = time.perf_counter()
+        sum(i * i for i in range(100_000))
+        samples.append(time.perf_counter() - start)
+    return min(samples)
+
+
+@pytest.mark.parametrize("route", QUERY_BUDGETS)
+def test_query_budget(client, admin, seeded, warm_cache, limiter, queries, route):
+    with queries:
+        response = client.get(ROUTES[route], headers={"Authorization": f"Bearer {admin['token']}"})
+    assert response.status_code == 200, response.text
+    assert queries.count <= QUERY_BUDGETS[route], "\n".join(queries.statements)
+
+
+def test_login_query_budget(client, user, admin, queries):
+    with queries:
+        response = client.post("/api/auth/login", data={"username": user.get('email'),
+                                                        "password": user.get('password')})
+    assert response.status_code == 200, response.text
+    assert queries.count <= LOGIN_QUERY_BUDGET, "\n".join(queries.statements)
+
+
+def measure(client, path: str, headers: dict) -> float:
+    """
+    Fastest of ROUNDS requests in calibration units. Each of REPEATS tries is calibrated right before
+    it and the lowest one is kept, so a noisy neighbour slowing the machine down does not count.
+    """
+    costs = []
+    for _ in range(REPEATS):
+        unit = calibrate()
+        samples = []
+        for _ in range(ROUNDS):
+            start = time.perf_counter()
+            client.get(path, headers=headers)
+            samples.append(time.perf_counter() - start)
+        costs.append(min(samples) / unit)
+    return min(costs)
+
+
+def test_latency_budget(client, admin, seeded, warm_cache, limiter):
+    headers = {"Authorization": f"Bearer {admin['token']}"}
+    measured = {}
+    for route, path in ROUTES.items():
+        client.get(path, headers=headers)
+        measured[route] = measure(client, path, headers)
+
+    if RECORD_BASELINE:
+        BASELINE_OUTPUT.write_text(json.dumps(measured, indent=2, sort_keys=True) + "\n")
+        pytest.skip(f"baseline written to {BASELINE_OUTPUT}")
+    if not BASELINE_FILE.exists():
+        pytest.skip("no latency baseline, record one with PERF_RECORD_BASELINE=1")
+    baseline = json.loads(BASELINE_FILE.read_text())
+    slower = [route for route, cost in measured.items()
+              if route in baseline and cost > baseline[route] * (1 + TOLERANCE)]
+    for route in slower:
+        # Measure once more before failing, a single slow try is more often noise than a regression.
+        measured[route] = min(measured[route], measure(client, ROUTES[route], headers))
+    regressions = {route: f"{measured[route]:.2f} > {baseline[route]:.2f}" for route in slower
+                   if measured[route] > baseline[route] * (1 + TOLERANCE)}
+    assert not regressions, f"latency regressed beyond {TOLERANCE:.0%} of the baseline: {regressions}"
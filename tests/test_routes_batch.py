@@ -0,0 +1,116 @@
+import asyncio
+from unittest.mock import MagicMock, patch, AsyncMock
+
+import pytest
+from fastapi import FastAPI
+from starlette.requests import Request
+
+from src.database.db import shared_session
+from src.database.models import User
+from src.repository import users as repository_users
+from src.services.auth import auth_service
+from src.schemas import SubRequest
+from src.services.batch import BatchDispatcher, groups
+
+CLIENT = {
+    "firstname": "Olena",
+    "lastname": "Koval",
+    "email": "olena_koval@example.com",
+    "phone_number": "+380501112244",
+    "birthday": "1991-03-12",
+    "additional_data": "batch",
+}
+
+
+def limiter_redis():
+    """Redis of FastAPILimiter that grants every lease of the rate limiters."""
+    return AsyncMock(evalsha=AsyncMock(return_value=[1, 60000, 0]))
+
+
+@pytest.fixture()
+def token(client, user, session, monkeypatch):
+    mock_send_email = MagicMock()
+    monkeypatch.setattr("src.routes.auth.send_email", mock_send_email)
+    client.post("/api/auth/signup", json=user)
+    current_user: User = session.query(User).filter(User.email == user.get('email')).first()
+    current_user.confirmed = True
+    current_user.role = "admin"
+    session.commit()
+    response = client.post(
+        "/api/auth/login",
+        data={"username": user.get('email'), "password": user.get('password')},
+    )
+    data = response.json()
+    return data["access_token"]
+
+
+@pytest.fixture()
+def limiter(monkeypatch):
+    monkeypatch.setattr('fastapi_limiter.FastAPILimiter.redis', limiter_redis())
+    monkeypatch.setattr('fastapi_limiter.FastAPILimiter.identifier', AsyncMock())
+    monkeypatch.setattr('fastapi_limiter.FastAPILimiter.http_callback', AsyncMock())
+
+
+def test_groups_run_reads_together_and_writes_alone():
+    assert groups(["GET", "GET", "POST", "GET", "DELETE", "PUT", "GET", "GET"]) == [[0, 1], [2], [3], [4], [5], [6, 7]]
+
+
+def test_batch(client, token, limiter):
+    get_user_by_email = AsyncMock(wraps=repository_users.get_user_by_email)
+    with patch.object(auth_service, "r") as redis_mock, \
+            patch.object(repository_users, "get_user_by_email", get_user_by_email):
+        redis_mock.get.return_value = None
+        response = client.post("api/batch/", headers={"Authorization": f"Bearer {token}"}, json={"requests": [
+            {"id": "create", "method": "POST", "path": "/api/clients/", "body": CLIENT},
+            {"id": "list", "path": "/api/clients/?fields=email"},
+            {"id": "missing", "path": "/api/clients/999"},
+            {"id": "invalid", "method": "POST", "path": "/api/clients/", "body": {"firstname": "O"}},
+        ]})
+    assert response.status_code == 200, response.text
+    responses = {item["id"]: item for item in response.json()["responses"]}
+    assert responses["create"]["status"] == 201
+    assert responses["create"]["body"]["email"] == CLIENT["email"]
+    assert responses["list"] == {"id": "list", "status": 200, "body": [{"email": CLIENT["email"]}]}
+    assert responses["missing"]["status"] == 404
+    assert responses["missing"]["body"] == {"detail": "Client not found"}
+    assert responses["invalid"]["status"] == 422
+    get_user_by_email.assert_awaited_once()
+
+
+def test_concurrent_reads_use_their_own_sessions(monkeypatch):
+    sessions = {}
+
+    async def call(self, method, path, body=None):
+        sessions[path] = shared_session.get()
+        await asyncio.sleep(0)
+        return 200, None
+
+    monkeypatch.setattr(BatchDispatcher, "call", call)
+    dispatcher = BatchDispatcher(Request({"type": "http", "headers": [], "app": FastAPI()}))
+    requests = [SubRequest(path="/api/clients/1"), SubRequest(path="/api/clients/2"),
+                SubRequest(method="DELETE", path="/api/clients/3")]
+    batch_session = object()
+    token = shared_session.set(batch_session)
+    try:
+        asyncio.run(dispatcher.run(requests))
+    finally:
+        shared_session.reset(token)
+    first, second = sessions["/api/clients/1"], sessions["/api/clients/2"]
+    assert first is not second and batch_session not in (first, second)
+    assert sessions["/api/clients/3"] is batch_session
+
+
+def test_batch_rejects_excluded_paths(client, token, limiter):
+    with patch.object(auth_service, "r") as redis_mock:
+        redis_mock.get.return_value = None
+        response = client.post("api/batch/", headers={"Authorization": f"Bearer {token}"}, json={"requests": [
+            {"path": "/api/clients/../batch/"},
+            {"path": "/api/clients/events/"},
+        ]})
+    assert response.status_code == 422, response.text
+    assert "/api/batch/" in response.json()["detail"]
+
+
+def test_batch_requires_authentication(client):
+    response = client.post("api/batch/", json={"requests": [{"path": "/api/clients/"}]})
+    assert response.status_code == 401, response.text
@@ -1,9 +1,13 @@
+from datetime import date, datetime, timedelta
 from unittest.mock import MagicMock, patch, AsyncMock
 
 import pytest
 
-from src.database.models import User
+from src.database.models import User, AuditEntry, Client
 from src.services.auth import auth_service
+from src.services.birthday_cache import birthday_cache
+from src.routes.clients import encode_cursor
+from src.conf.config import settings
 
 CLIENT = {
     "firstname": "Ivan",
@@ -15,6 +19,11 @@ CLIENT = {
 }
 
 
+def limiter_redis():
+    """Redis of FastAPILimiter that grants every lease of the rate limiters."""
+    return AsyncMock(evalsha=AsyncMock(return_value=[1, 60000, 0]))
+
+
 @pytest.fixture()
 def token(client, user, session, monkeypatch):
     mock_send_email = MagicMock()
@@ -35,7 +44,7 @@ def token(client, user, session, monkeypatch):
 def test_create_client(client, token, monkeypatch):
     with patch.object(auth_service, "r") as redis_mock:
         redis_mock.get.return_value = None
-        monkeypatch.setattr('fastapi_limiter.FastAPILimiter.redis', AsyncMock())
+        monkeypatch.setattr('fastapi_limiter.FastAPILimiter.redis', limiter_redis())
         monkeypatch.setattr('fastapi_limiter.FastAPILimiter.identifier', AsyncMock())
         monkeypatch.setattr('fastapi_limiter.FastAPILimiter.http_callback', AsyncMock())
         response = client.post("api/clients", json=CLIENT, headers={"Authorization": f"Bearer {token}"})
@@ -49,7 +58,7 @@ def test_create_client(client, token, monkeypatch):
 def test_create_client_second_time_email(client, token, monkeypatch):
     with patch.object(auth_service, "r") as redis_mock:
         redis_mock.get.return_value = None
-        monkeypatch.setattr('fastapi_limiter.FastAPILimiter.redis', AsyncMock())
+        monkeypatch.setattr('fastapi_limiter.FastAPILimiter.redis', limiter_redis())
         monkeypatch.setattr('fastapi_limiter.FastAPILimiter.identifier', AsyncMock())
         monkeypatch.setattr('fastapi_limiter.FastAPILimiter.http_callback', AsyncMock())
         response = client.post("api/clients", json=CLIENT, headers={"Authorization": f"Bearer {token}"})
@@ -62,7 +71,7 @@ def test_create_client_second_time_email(client, token, monkeypatch):
 def test_create_client_second_time_phone(client, token, monkeypatch):
     with patch.object(auth_service, "r") as redis_mock:
         redis_mock.get.return_value = None
-        monkeypatch.setattr('fastapi_limiter.FastAPILimiter.redis', AsyncMock())
+        monkeypatch.setattr('fastapi_limiter.FastAPILimiter.redis', limiter_redis())
         monkeypatch.setattr('fastapi_limiter.FastAPILimiter.identifier', AsyncMock())
         monkeypatch.setattr('fastapi_limiter.FastAPILimiter.http_callback', AsyncMock())
         client_second = {
@@ -83,7 +92,7 @@ def test_create_client_second_time_phone(client, token, monkeypatch):
 def test_search_clients(client, token, monkeypatch):
     with patch.object(auth_service, "r") as redis_mock:
         redis_mock.get.return_value = None
-        monkeypatch.setattr('fastapi_limiter.FastAPILimiter.redis', AsyncMock())
+        monkeypatch.setattr('fastapi_limiter.FastAPILimiter.redis', limiter_redis())
         monkeypatch.setattr('fastapi_limiter.FastAPILimiter.identifier', AsyncMock())
         monkeypatch.setattr('fastapi_limiter.FastAPILimiter.http_callback', AsyncMock())
         params = "ivan"
@@ -96,7 +105,7 @@ def test_search_clients(client, token, monkeypatch):
 def test_get_clients(client, token, monkeypatch):
     with patch.object(auth_service, "r") as redis_mock:
         redis_mock.get.return_value = None
-        monkeypatch.setattr('fastapi_limiter.FastAPILimiter.redis', AsyncMock())
+        monkeypatch.setattr('fastapi_limiter.FastAPILimiter.redis', limiter_redis())
         monkeypatch.setattr('fastapi_limiter.FastAPILimiter.identifier', AsyncMock())
         monkeypatch.setattr('fastapi_limiter.FastAPILimiter.http_callback', AsyncMock())
         response = client.get("api/clients", headers={"Authorization": f"Bearer {token}"})
@@ -111,7 +120,7 @@ def test_get_clients_by_id(client, token, monkeypatch):
     with patch.object(auth_service, "r") as redis_mock:
         redis_mock.get.return_value = None
         client_id = 1
-        monkeypatch.setattr('fastapi_limiter.FastAPILimiter.redis', AsyncMock())
+        monkeypatch.setattr('fastapi_limiter.FastAPILimiter.redis', limiter_redis())
         monkeypatch.setattr('fastapi_limiter.FastAPILimiter.identifier', AsyncMock())
         monkeypatch.setattr('fastapi_limiter.FastAPILimiter.http_callback', AsyncMock())
         response = client.get(f"api/clients/{client_id}", headers={"Authorization": f"Bearer {token}"})
@@ -122,10 +131,57 @@ def test_get_clients_by_id(client, token, monkeypatch):
         assert CLIENT["firstname"] == data["firstname"]
 
 
+def test_get_clients_with_fields(client, token, monkeypatch):
+    with patch.object(auth_service, "r") as redis_mock:
+        redis_mock.get.return_value = None
+        monkeypatch.setattr('fastapi_limiter.FastAPILimiter.redis', limiter_redis())
+        monkeypatch.setattr('fastapi_limiter.FastAPILimiter.identifier', AsyncMock())
+        monkeypatch.setattr('fastapi_limiter.FastAPILimiter.http_callback', AsyncMock())
+        headers = {"Authorization": f"Bearer {token}"}
+        response = client.get("api/clients", params={"fields": "id,email"}, headers=headers)
+        assert response.status_code == 200, response.text
+        assert response.json() == [{"id": 1, "email": CLIENT["email"]}]
+
+        response = client.get("api/clients/1", params={"fields": "birthday, phone_number,birthday"}, headers=headers)
+        assert response.status_code == 200, response.text
+        assert response.json() == {"birthday": CLIENT["birthday"], "phone_number": CLIENT["phone_number"]}
+
+        response = client.get("api/clients/search/", params={"data": "ivan", "fields": "additional_data"},
+                              headers=headers)
+        assert response.status_code == 200, response.text
+        assert response.json() == [{"additional_data": CLIENT["additional_data"]}]
+
+        response = client.get("api/clients", params={"fields": "id,password"}, headers=headers)
+        assert response.status_code == 422, response.text
+        assert "password" in response.json()["detail"]
+
+
+def test_get_clients_batch(client, token, monkeypatch):
+    with patch.object(auth_service, "r") as redis_mock:
+        redis_mock.get.return_value = None
+        monkeypatch.setattr('fastapi_limiter.FastAPILimiter.redis', limiter_redis())
+        monkeypatch.setattr('fastapi_limiter.FastAPILimiter.identifier', AsyncMock())
+        monkeypatch.setattr('fastapi_limiter.FastAPILimiter.http_callback', AsyncMock())
+        headers = {"Authorization": f"Bearer {token}"}
+        response = client.get("api/clients/batch/", params={"ids": [99, 1, 1]}, headers=headers)
+        assert response.status_code == 200, response.text
+        data = response.json()
+        assert [item["id"] for item in data["clients"]] == [1]
+        assert data["clients"][0]["email"] == CLIENT["email"]
+        assert data["missing"] == [99]
+
+        response = client.get("api/clients/batch/", params={"ids": [1, 2], "fields": "email"}, headers=headers)
+        assert response.status_code == 200, response.text
+        assert response.json() == {"clients": [{"email": CLIENT["email"]}], "missing": [2]}
+
+        response = client.get("api/clients/batch/", params={"ids": list(range(1, 102))}, headers=headers)
+        assert response.status_code == 422, response.text
+
+
 def test_get_clients_by_id_not_found(client, token, monkeypatch):
     with patch.object(auth_service, "r") as redis_mock:
         redis_mock.get.return_value = None
-        monkeypatch.setattr('fastapi_limiter.FastAPILimiter.redis', AsyncMock())
+        monkeypatch.setattr('fastapi_limiter.FastAPILimiter.redis', limiter_redis())
         monkeypatch.setattr('fastapi_limiter.FastAPILimiter.identifier', AsyncMock())
         monkeypatch.setattr('fastapi_limiter.FastAPILimiter.http_callback', AsyncMock())
         response = client.get("api/clients/1000000", headers={"Authorization": f"Bearer {token}"})
@@ -138,7 +194,7 @@ def test_get_clients_by_id_not_found(client, token, monkeypatch):
 def test_update_client(client, token, monkeypatch):
     with patch.object(auth_service, "r") as redis_mock:
         redis_mock.get.return_value = None
-        monkeypatch.setattr('fastapi_limiter.FastAPILimiter.redis', AsyncMock())
+        monkeypatch.setattr('fastapi_limiter.FastAPILimiter.redis', limiter_redis())
         monkeypatch.setattr('fastapi_limiter.FastAPILimiter.identifier', AsyncMock())
         monkeypatch.setattr('fastapi_limiter.FastAPILimiter.http_callback', AsyncMock())
         client_id = 1
@@ -165,7 +221,7 @@ def test_update_client(client, token, monkeypatch):
 def test_update_client_not_found(client, token, monkeypatch):
     with patch.object(auth_service, "r") as redis_mock:
         redis_mock.get.return_value = None
-        monkeypatch.setattr('fastapi_limiter.FastAPILimiter.redis', AsyncMock())
+        monkeypatch.setattr('fastapi_limiter.FastAPILimiter.redis', limiter_redis())
         monkeypatch.setattr('fastapi_limiter.FastAPILimiter.identifier', AsyncMock())
         monkeypatch.setattr('fastapi_limiter.FastAPILimiter.http_callback', AsyncMock())
         updated_client = {
@@ -184,10 +240,25 @@ def test_update_client_not_found(client, token, monkeypatch):
         assert data["detail"] == "Client not found"
 
 
+def test_autocomplete_clients(client, token, monkeypatch):
+    with patch.object(auth_service, "r") as redis_mock:
+        redis_mock.get.return_value = None
+        redis_mock.pipeline.return_value.execute.return_value = [[], 0]
+        monkeypatch.setattr('fastapi_limiter.FastAPILimiter.redis', limiter_redis())
+        monkeypatch.setattr('fastapi_limiter.FastAPILimiter.identifier', AsyncMock())
+        monkeypatch.setattr('fastapi_limiter.FastAPILimiter.http_callback', AsyncMock())
+        response = client.get("api/clients/autocomplete/", params={"q": "pav"},
+                              headers={"Authorization": f"Bearer {token}"})
+        assert response.status_code == 200, response.text
+        data = response.json()
+        assert data[0]["firstname"] == "Pavlo"
+        assert set(data[0]) == {"id", "firstname", "lastname"}
+
+
 def test_get_birthday(client, token, monkeypatch):
     with patch.object(auth_service, "r") as redis_mock:
         redis_mock.get.return_value = None
-        monkeypatch.setattr('fastapi_limiter.FastAPILimiter.redis', AsyncMock())
+        monkeypatch.setattr('fastapi_limiter.FastAPILimiter.redis', limiter_redis())
         monkeypatch.setattr('fastapi_limiter.FastAPILimiter.identifier', AsyncMock())
         monkeypatch.setattr('fastapi_limiter.FastAPILimiter.http_callback', AsyncMock())
         response = client.get("api/clients/birthday/", headers={"Authorization": f"Bearer {token}"})
@@ -196,11 +267,36 @@ def test_get_birthday(client, token, monkeypatch):
         assert isinstance(data, list)
 
 
+def test_get_birthday_in_window(client, token, session, monkeypatch):
+    soon = date.today() + timedelta(days=3)
+    birthday = soon.replace(year=1996)  # a leap year, so February 29 exists
+    guest = Client(firstname="Olena", lastname="Koval", email="olena@example.com", phone_number="+380501112299",
+                   birthday=birthday, additional_data="")
+    session.add(guest)
+    session.commit()
+    birthday_cache.bump()
+    try:
+        with patch.object(auth_service, "r") as redis_mock:
+            redis_mock.get.return_value = None
+            monkeypatch.setattr('fastapi_limiter.FastAPILimiter.redis', limiter_redis())
+            monkeypatch.setattr('fastapi_limiter.FastAPILimiter.identifier', AsyncMock())
+            monkeypatch.setattr('fastapi_limiter.FastAPILimiter.http_callback', AsyncMock())
+            response = client.get("api/clients/birthday/", params={"days": 7},
+                                  headers={"Authorization": f"Bearer {token}"})
+            assert response.status_code == 200, response.text
+            assert {"firstname": "Olena", "lastname": "Koval", "birthday": birthday.isoformat(),
+                    "email": "olena@example.com"} in response.json()
+    finally:
+        session.delete(guest)
+        session.commit()
+        birthday_cache.bump()
+
+
 def test_remove_client(client, token, monkeypatch):
     with patch.object(auth_service, "r") as redis_mock:
         redis_mock.get.return_value = None
         client_id = 1
-        monkeypatch.setattr('fastapi_limiter.FastAPILimiter.redis', AsyncMock())
+        monkeypatch.setattr('fastapi_limiter.FastAPILimiter.redis', limiter_redis())
         monkeypatch.setattr('fastapi_limiter.FastAPILimiter.identifier', AsyncMock())
         monkeypatch.setattr('fastapi_limiter.FastAPILimiter.http_callback', AsyncMock())
         response = client.delete(f"api/clients/{client_id}", headers={"Authorization": f"Bearer {token}"})
@@ -210,10 +306,52 @@ def test_remove_client(client, token, monkeypatch):
         assert data["id"] == client_id
 
 
+def test_get_client_audit(client, token, session, monkeypatch):
+    session.add(AuditEntry(client_id=1, action="updated", user_id=1, changes={"firstname": ["Ivan", "Pavlo"]},
+                           created_at=datetime(2023, 6, 5, 12, 0)))
+    session.commit()
+    with patch.object(auth_service, "r") as redis_mock:
+        redis_mock.get.return_value = None
+        monkeypatch.setattr('fastapi_limiter.FastAPILimiter.redis', limiter_redis())
+        monkeypatch.setattr('fastapi_limiter.FastAPILimiter.identifier', AsyncMock())
+        monkeypatch.setattr('fastapi_limiter.FastAPILimiter.http_callback', AsyncMock())
+        response = client.get("api/clients/1/audit", headers={"Authorization": f"Bearer {token}"})
+        assert response.status_code == 200, response.text
+        data = response.json()
+        assert [(entry["action"], entry["changes"]) for entry in data] == [("updated", {"firstname": ["Ivan", "Pavlo"]})]
+
+
+def test_client_changes(client, token, monkeypatch):
+    with patch.object(auth_service, "r") as redis_mock:
+        redis_mock.get.return_value = None
+        monkeypatch.setattr('fastapi_limiter.FastAPILimiter.redis', limiter_redis())
+        monkeypatch.setattr('fastapi_limiter.FastAPILimiter.identifier', AsyncMock())
+        monkeypatch.setattr('fastapi_limiter.FastAPILimiter.http_callback', AsyncMock())
+        monkeypatch.setattr('src.conf.config.settings.changes_settle_seconds', 0)
+        headers = {"Authorization": f"Bearer {token}"}
+        response = client.get("api/clients/changes/", headers=headers)
+        assert response.status_code == 200, response.text
+        data = response.json()
+        assert [(change["id"], change["deleted"], change["client"]) for change in data["changes"]] == [(1, True, None)]
+        assert data["has_more"] is False
+
+        response = client.get("api/clients/changes/", params={"since": data["cursor"]}, headers=headers)
+        assert response.status_code == 200, response.text
+        assert response.json() == {"changes": [], "cursor": data["cursor"], "has_more": False}
+
+        response = client.get("api/clients/changes/", params={"since": "not a cursor"}, headers=headers)
+        assert response.status_code == 422, response.text
+
+        expired = encode_cursor(datetime.now() - timedelta(days=settings.changes_retention_days + 1), 1)
+        response = client.get("api/clients/changes/", params={"since": expired}, headers=headers)
+        assert response.status_code == 410, response.text
+        assert "without since" in response.json()["detail"]
+
+
 def test_remove_client_not_found(client, token, monkeypatch):
     with patch.object(auth_service, "r") as redis_mock:
         redis_mock.get.return_value = None
-        monkeypatch.setattr('fastapi_limiter.FastAPILimiter.redis', AsyncMock())
+        monkeypatch.setattr('fastapi_limiter.FastAPILimiter.redis', limiter_redis())
         monkeypatch.setattr('fastapi_limiter.FastAPILimiter.identifier', AsyncMock())
         monkeypatch.setattr('fastapi_limiter.FastAPILimiter.http_callback', AsyncMock())
         response = client.delete("api/clients/100000", headers={"Authorization": f"Bearer {token}"})
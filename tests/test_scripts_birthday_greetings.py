@@ -0,0 +1,147 @@
+import asyncio
+from datetime import date
+from unittest.mock import AsyncMock
+
+import pytest
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+
+from src.database.models import Base, Client, Greeting
+from src.repository.clients import get_birthday_clients
+from src.scripts import birthday_greetings
+from src.scripts.birthday_greetings import GreetingJob, SMTPStandIn, greet
+from src.services.resilience import smtp_breaker
+
+TODAY = date(2023, 6, 5)
+
+
+@pytest.fixture()
+def db(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'greetings.db'}")
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(bind=engine)()
+    for index in range(30):
+        birthday = date(1990, 6, 5) if index % 3 else date(1990, 6, 6)
+        session.add(Client(firstname=f"Ivan{index}", lastname="Ivanov", email=f"ivan{index}@example.com",
+                           phone_number=f"+3805011122{index:02d}", birthday=birthday))
+    session.commit()
+    yield session
+    session.close()
+    engine.dispose()
+    smtp_breaker.reset()
+
+
+def greeted(db) -> int:
+    return db.execute(select(func.count()).select_from(Greeting)).scalar()
+
+
+def test_chunks_page_through_todays_birthdays(db):
+    first = asyncio.run(get_birthday_clients(TODAY, 0, 15, db))
+    second = asyncio.run(get_birthday_clients(TODAY, first[-1].id, 15, db))
+    assert len(first) == 15 and len(second) == 5
+    assert all(client.birthday == date(1990, 6, 5) for client in first + second)
+
+
+def test_february_29_is_greeted_on_february_28(db):
+    db.add(Client(firstname="Leap", lastname="Day", email="leap@example.com", phone_number="+380509999999",
+                  birthday=date(2000, 2, 29)))
+    db.commit()
+    assert [client.email for client in asyncio.run(get_birthday_clients(date(2023, 2, 28), 0, 10, db))] == \
+           ["leap@example.com"]
+    assert asyncio.run(get_birthday_clients(date(2024, 2, 28), 0, 10, db)) == []
+    assert len(asyncio.run(get_birthday_clients(date(2024, 2, 29), 0, 10, db))) == 1
+
+
+def test_dry_run_sends_to_stand_in_without_recording(db):
+    result = asyncio.run(greet(db, TODAY, chunk=7, concurrency=3, dry_run=True))
+    assert result["queued"] == result["sent"] == result["delivered"] == 20
+    assert result["connections"] == 3
+    assert result["rate"] > 0
+    assert greeted(db) == 0
+
+
+def test_run_records_greetings_and_resumes(db):
+    async def scenario():
+        async with SMTPStandIn() as stand_in:
+            await birthday_greetings.repository_clients.record_greeting(3, TODAY, db)
+            first = await GreetingJob(db, stand_in.config(), TODAY, chunk=4, concurrency=2).run()
+            second = await GreetingJob(db, stand_in.config(), TODAY, chunk=4, concurrency=2).run()
+        return first, second, stand_in
+
+    first, second, stand_in = asyncio.run(scenario())
+    assert first["sent"] == 19
+    assert second["queued"] == 0
+    assert greeted(db) == 20
+    sender, recipients, data = stand_in.messages[0]
+    assert recipients[0].endswith("@example.com")
+    assert b"Happy birthday" in data
+
+
+def test_unreachable_smtp_fails_without_recording(db):
+    async def scenario():
+        async with SMTPStandIn() as stand_in:
+            config = stand_in.config()
+        return await GreetingJob(db, config, TODAY, chunk=10, concurrency=2).run()
+
+    result = asyncio.run(scenario())
+    assert result["sent"] == 0
+    assert result["failed"] == 20
+    assert greeted(db) == 0
+
+
+def test_greeting_recorded_by_another_run_is_skipped(db, monkeypatch):
+    record_greeting = birthday_greetings.repository_clients.record_greeting
+
+    async def racing(client_id, today, session):
+        if client_id == 2:
+            await record_greeting(client_id, today, session)
+        await record_greeting(client_id, today, session)
+
+    monkeypatch.setattr(birthday_greetings.repository_clients, "record_greeting", racing)
+
+    async def scenario():
+        async with SMTPStandIn() as stand_in:
+            result = await GreetingJob(db, stand_in.config(), TODAY, chunk=4, concurrency=2).run()
+        return result, stand_in
+
+    result, stand_in = asyncio.run(scenario())
+    assert result["queued"] == 20
+    assert result["sent"] == 19
+    assert greeted(db) == 20
+    assert b"From: Birthday greetings <" in stand_in.messages[0][2]
+
+
+def test_failing_commit_is_counted_and_the_run_goes_on(db, monkeypatch):
+    record_greeting = birthday_greetings.repository_clients.record_greeting
+
+    async def flaky(client_id, today, session):
+        if client_id % 4 == 0:
+            session.add(Greeting(client_id=client_id, sent_on=today))
+            raise OperationalError("COMMIT", {}, Exception("database is locked"))
+        await record_greeting(client_id, today, session)
+
+    monkeypatch.setattr(birthday_greetings.repository_clients, "record_greeting", flaky)
+
+    async def scenario():
+        async with SMTPStandIn() as stand_in:
+            return await GreetingJob(db, stand_in.config(), TODAY, chunk=4, concurrency=2).run()
+
+    result = asyncio.run(scenario())
+    assert result["queued"] == 20
+    assert result["unrecorded"] == 4
+    assert result["sent"] == 16
+    assert greeted(db) == 16
+
+
+def test_run_stops_when_every_sender_died(db, monkeypatch):
+    monkeypatch.setattr(birthday_greetings.repository_clients, "record_greeting",
+                        AsyncMock(side_effect=RuntimeError("broken")))
+
+    async def scenario():
+        async with SMTPStandIn() as stand_in:
+            job = GreetingJob(db, stand_in.config(), TODAY, chunk=2, concurrency=2)
+            await asyncio.wait_for(job.run(), 5)
+
+    with pytest.raises(RuntimeError, match="broken"):
+        asyncio.run(scenario())
@@ -0,0 +1,35 @@
+import random
+from datetime import datetime
+
+from sqlalchemy import create_engine, func, select
+
+from src.database.models import Client, User
+from src.scripts.seed import generate_clients, phone_number, seed
+
+
+def test_generate_clients_is_deterministic():
+    now = datetime(2024, 1, 1)
+    first = generate_clients(random.Random(1), 0, 100, now)
+    second = generate_clients(random.Random(1), 0, 100, now)
+    assert first == second
+
+
+def test_phone_numbers_are_unique_and_valid():
+    phones = [phone_number(index) for index in range(100_000)]
+    assert len(set(phones)) == len(phones)
+    client = Client()
+    assert all(client.validate_phone_number("phone_number", phone) == phone for phone in phones[:1000])
+
+
+def test_emails_are_unique():
+    rows = generate_clients(random.Random(1), 0, 10_000, datetime(2024, 1, 1))
+    assert len({row[2] for row in rows}) == len(rows)
+
+
+def test_seed_sqlite(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path}/seed.db")
+    result = seed(engine, clients=2_500, users=20, batch=1_000)
+    assert result["clients"] == 2_500
+    with engine.connect() as conn:
+        assert conn.execute(select(func.count()).select_from(Client)).scalar() == 2_500
+        assert conn.execute(select(func.count()).select_from(User)).scalar() == 20
@@ -0,0 +1,119 @@
+import asyncio
+import unittest
+from unittest.mock import AsyncMock, patch
+
+import httpx
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from src.conf.config import settings
+from src.services.admission import AdaptiveLimiter, AdmissionMiddleware, route_group
+
+
+class TestRouteGroup(unittest.TestCase):
+    def test_groups(self):
+        self.assertEqual(route_group("POST", "/api/auth/login"), "auth")
+        self.assertEqual(route_group("PATCH", "/api/users/avatar"), "uploads")
+        self.assertEqual(route_group("GET", "/api/clients/search/"), "reads")
+        self.assertEqual(route_group("PUT", "/api/clients/1"), "writes")
+        self.assertIsNone(route_group("GET", "/api/users/me/"))
+        self.assertIsNone(route_group("GET", "/metrics"))
+
+
+class TestAdaptiveLimiter(unittest.IsolatedAsyncioTestCase):
+    def make(self, limit=1, queue_size=1, queue_timeout=0.05, target=1.0, max_limit=4):
+        return AdaptiveLimiter("test", limit, max_limit, target, queue_size, queue_timeout)
+
+    async def test_admits_up_to_limit(self):
+        limiter = self.make(limit=2)
+        self.assertIsNone(await limiter.acquire())
+        self.assertIsNone(await limiter.acquire())
+        self.assertEqual(limiter.in_flight, 2)
+
+    async def test_rejects_when_queue_is_full(self):
+        limiter = self.make(queue_size=1, queue_timeout=1)
+        await limiter.acquire()
+        waiting = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0)
+        self.assertEqual(await limiter.acquire(), "queue_full")
+        limiter.release(0.01)
+        self.assertIsNone(await waiting)
+        self.assertEqual(limiter.in_flight, 1)
+
+    async def test_rejects_after_queue_timeout(self):
+        limiter = self.make(queue_timeout=0.01)
+        await limiter.acquire()
+        self.assertEqual(await limiter.acquire(), "queue_timeout")
+        self.assertEqual(len(limiter.waiters), 0)
+        self.assertEqual(limiter.in_flight, 1)
+
+    async def test_limit_grows_when_fast_and_saturated(self):
+        limiter = self.make(limit=1)
+        await limiter.acquire()
+        limiter.release(0.01)
+        self.assertEqual(limiter.limit, 2)
+
+    async def test_limit_shrinks_when_slow(self):
+        limiter = self.make(limit=4, target=0.1)
+        await limiter.acquire()
+        limiter.release(0.5)
+        self.assertAlmostEqual(limiter.limit, 3.6)
+        await limiter.acquire()
+        limiter.release(0.5)
+        self.assertAlmostEqual(limiter.limit, 3.6)
+
+
+class TestAdmissionMiddleware(unittest.TestCase):
+    def test_sheds_excess_requests(self):
+        app = FastAPI()
+        app.add_middleware(AdmissionMiddleware)
+        started = asyncio.Event()
+        release = asyncio.Event()
+
+        @app.get("/api/clients/slow")
+        async def slow():
+            started.set()
+            await release.wait()
+            return {}
+
+        @app.get("/api/clients/probe")
+        async def probe():
+            return {}
+
+        async def scenario():
+            limits, queue = settings.admission_limits, settings.admission_queue_size
+            settings.admission_limits, settings.admission_queue_size = {"reads": 1}, 0
+            try:
+                transport = httpx.ASGITransport(app=app)
+                async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                    first = asyncio.create_task(client.get("/api/clients/slow"))
+                    await started.wait()
+                    rejected = await client.get("/api/clients/probe")
+                    release.set()
+                    await first
+                return rejected
+            finally:
+                settings.admission_limits, settings.admission_queue_size = limits, queue
+
+        response = asyncio.run(scenario())
+        self.assertEqual(response.status_code, 503)
+        self.assertIn("retry-after", response.headers)
+
+    def test_unlimited_routes_pass_through(self):
+        app = FastAPI()
+        app.add_middleware(AdmissionMiddleware)
+
+        @app.get("/metrics")
+        async def read_metrics():
+            return {}
+
+        self.assertEqual(TestClient(app).get("/metrics").status_code, 200)
+
+    def test_shed_requests_have_cors_headers(self):
+        from main import create_app
+
+        with patch.object(AdaptiveLimiter, "acquire", AsyncMock(return_value="queue_full")):
+            response = TestClient(create_app()).get("/api/clients/", headers={"Origin": "http://localhost:5500"})
+        self.assertEqual(response.status_code, 503)
+        self.assertIn("retry-after", response.headers)
+        self.assertIn("access-control-allow-origin", response.headers)
@@ -0,0 +1,208 @@
+import asyncio
+from datetime import date
+from unittest.mock import MagicMock, patch
+
+import pytest
+import redis
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from src.database.models import Base, AuditEntry, User
+from src.repository.clients import create_client, update_client, remove_client, get_client_audit
+from src.schemas import ClientModel
+from src.services.audit import AuditLog, STREAM, diff, snapshot
+from src.services.auth import auth_service
+from src.services.resilience import redis_breaker
+
+
+class FakeStreams:
+    """Just enough of Redis streams and consumer groups for the audit log."""
+
+    def __init__(self):
+        self.entries, self.pending, self.sequence = [], {}, 0
+
+    def xadd(self, key, fields):
+        self.sequence += 1
+        self.entries.append((f"{self.sequence}-0".encode(), {name.encode(): value.encode()
+                                                             for name, value in fields.items()}))
+
+    def xgroup_create(self, key, group, id="0", mkstream=False):
+        pass
+
+    def xautoclaim(self, key, group, consumer, min_idle_time, count=None):
+        return [b"0-0", [], []]
+
+    def xreadgroup(self, group, consumer, streams, count=None):
+        new = [entry for entry in self.entries if entry[0] not in self.pending][:count]
+        self.pending.update(dict(new))
+        return [[STREAM.encode(), new]] if new else []
+
+    def xack(self, key, group, *ids):
+        for message_id in ids:
+            self.pending.pop(message_id, None)
+
+    def xdel(self, key, *ids):
+        self.entries = [entry for entry in self.entries if entry[0] not in ids]
+
+    def pipeline(self, transaction=True):
+        streams, calls = self, []
+
+        class Pipeline:
+            def __getattr__(self, name):
+                return lambda *args: calls.append((name, args))
+
+            def execute(self):
+                return [getattr(streams, name)(*args) for name, args in calls]
+
+        return Pipeline()
+
+
+@pytest.fixture()
+def sessions(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'audit.db'}")
+    Base.metadata.create_all(bind=engine)
+    yield sessionmaker(bind=engine)
+    engine.dispose()
+
+
+def entries(sessions):
+    with sessions() as db:
+        return [(entry.client_id, entry.action, entry.user_id, entry.changes)
+                for entry in db.query(AuditEntry).order_by(AuditEntry.id)]
+
+
+def test_diff_of_changed_fields():
+    before = {"firstname": "Ivan", "lastname": "Ivanov", "birthday": "1990-08-19"}
+    assert diff(before, {**before, "firstname": "Petro"}) == {"firstname": ["Ivan", "Petro"]}
+    assert diff(None, {"email": "ivan@example.com"}) == {"email": [None, "ivan@example.com"]}
+    client = MagicMock(firstname="Ivan", birthday=date(1990, 8, 19))
+    assert snapshot(client)["birthday"] == "1990-08-19"
+
+
+def test_mutations_are_flushed_in_bulk(sessions, monkeypatch):
+    audit = AuditLog("memory", sessions)
+    monkeypatch.setattr("src.repository.clients.audit_log", audit)
+    admin = User(id=7)
+    body = ClientModel(firstname="Ivan", lastname="Ivanov", email="ivan@example.com",
+                       phone_number="+380501112233", birthday="1990-08-19", additional_data="")
+    with patch.object(auth_service, "r"), sessions() as db:
+        client = asyncio.run(create_client(body, db, admin))
+        asyncio.run(update_client(body, client.id, db, admin))
+        body.lastname = "Petrenko"
+        asyncio.run(update_client(body, client.id, db, admin))
+        asyncio.run(remove_client(client.id, db))
+    assert entries(sessions) == []
+    assert asyncio.run(audit.flush()) == 3
+    created, updated, deleted = entries(sessions)
+    assert created[:3] == (client.id, "created", 7)
+    assert created[3]["phone_number"] == [None, "+380501112233"]
+    assert updated == (client.id, "updated", 7, {"lastname": ["Ivanov", "Petrenko"]})
+    assert deleted[:3] == (client.id, "deleted", None)
+    assert deleted[3]["email"] == ["ivan@example.com", None]
+    with sessions() as db:
+        newest = asyncio.run(get_client_audit(client.id, 2, None, db))
+        assert [entry.action for entry in newest] == ["deleted", "updated"]
+        assert [entry.action for entry in asyncio.run(get_client_audit(client.id, 2, newest[-1].id, db))] == \
+               ["created"]
+
+
+def test_size_threshold_wakes_the_flusher(sessions, monkeypatch):
+    monkeypatch.setattr("src.conf.config.settings.audit_batch_size", 2)
+    monkeypatch.setattr("src.conf.config.settings.audit_flush_seconds", 60)
+
+    async def scenario():
+        audit = AuditLog("memory", sessions)
+        task = asyncio.create_task(audit.run())
+        await asyncio.sleep(0)
+        audit.record("created", 1, None, {})
+        assert not audit.wake.is_set()
+        audit.record("created", 2, None, {})
+        assert audit.wake.is_set()
+        await asyncio.sleep(0.2)
+        flushed = len(entries(sessions))
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        return flushed
+
+    assert asyncio.run(scenario()) == 2
+
+
+def test_full_buffer_drops_oldest(sessions, monkeypatch):
+    monkeypatch.setattr("src.conf.config.settings.audit_buffer_max", 2)
+    audit = AuditLog("memory", sessions)
+    for client_id in range(1, 4):
+        audit.record("created", client_id, None, {})
+    assert [entry["client_id"] for entry in audit.buffer] == [2, 3]
+
+
+def test_failed_flush_keeps_entries(sessions):
+    failing = MagicMock(side_effect=ConnectionError("database is down"))
+    audit = AuditLog("memory", failing)
+    audit.record("created", 1, None, {})
+    with pytest.raises(ConnectionError):
+        asyncio.run(audit.flush())
+    audit.session_factory = sessions
+    assert asyncio.run(audit.flush()) == 1
+    assert len(entries(sessions)) == 1
+
+
+def test_run_flushes_on_time_and_on_cancel(sessions, monkeypatch):
+    monkeypatch.setattr("src.conf.config.settings.audit_flush_seconds", 0.01)
+
+    async def scenario():
+        audit = AuditLog("memory", sessions)
+        task = asyncio.create_task(audit.run())
+        audit.record("created", 1, None, {})
+        await asyncio.sleep(0.2)
+        flushed = len(entries(sessions))
+        audit.record("deleted", 1, None, {})
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        return flushed
+
+    assert asyncio.run(scenario()) == 1
+    assert [entry[1] for entry in entries(sessions)] == ["created", "deleted"]
+
+
+def test_redis_stream_buffer(sessions):
+    streams = FakeStreams()
+    redis_breaker.reset()
+    with patch.object(auth_service, "r", streams):
+        audit = AuditLog("redis", sessions)
+        audit.record("created", 1, 7, {"firstname": [None, "Ivan"]})
+        audit.record("updated", 1, 7, {"firstname": ["Ivan", "Petro"]})
+        assert not audit.buffer and len(streams.entries) == 2
+        assert asyncio.run(audit.flush()) == 2
+    assert streams.entries == [] and streams.pending == {}
+    assert entries(sessions) == [(1, "created", 7, {"firstname": [None, "Ivan"]}),
+                                 (1, "updated", 7, {"firstname": ["Ivan", "Petro"]})]
+
+
+def test_redis_stream_unavailable_falls_back_to_memory(sessions):
+    r = MagicMock()
+    r.xadd.side_effect = redis.ConnectionError("Connection refused")
+    with patch.object(auth_service, "r", r):
+        audit = AuditLog("redis", sessions)
+        audit.record("created", 1, None, {})
+    assert len(audit.buffer) == 1
+    redis_breaker.reset()
+
+
+def test_run_works_on_successive_event_loops(sessions, monkeypatch):
+    monkeypatch.setattr("src.conf.config.settings.audit_batch_size", 1)
+    monkeypatch.setattr("src.conf.config.settings.audit_flush_seconds", 60)
+    audit = AuditLog("memory", sessions)
+
+    async def scenario(client_id):
+        task = asyncio.create_task(audit.run())
+        await asyncio.sleep(0)
+        audit.record("created", client_id, None, {})
+        await asyncio.sleep(0.2)
+        flushed = len(entries(sessions))
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        return flushed
+
+    assert asyncio.run(scenario(1)) == 1
+    assert asyncio.run(scenario(2)) == 2
+    assert audit.wake is None
@@ -0,0 +1,183 @@
+import asyncio
+from datetime import date
+from unittest.mock import MagicMock, patch
+
+import pytest
+import redis
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from src.database.models import Base, Client
+from src.repository.clients import create_client, update_client, remove_client
+from src.schemas import ClientModel
+from src.services.auth import auth_service
+from src.services.autocomplete import AutocompleteIndex, KEY, BUILDING_KEY, SWAP_SCRIPT, WRITE_SCRIPT, entries
+from src.services.resilience import redis_breaker
+
+
+class FakeRedis:
+    """Just enough of Redis for the autocomplete index: sorted sets with equal scores and lex ranges."""
+
+    def __init__(self):
+        self.data = {}
+
+    @staticmethod
+    def _bytes(value) -> bytes:
+        return value if isinstance(value, bytes) else str(value).encode()
+
+    def zadd(self, key, mapping):
+        self.data.setdefault(key, set()).update(self._bytes(member) for member in mapping)
+
+    def zrem(self, key, *members):
+        self.data.get(key, set()).difference_update(self._bytes(member) for member in members)
+
+    def zrangebylex(self, key, low, high, start=None, num=None):
+        members = sorted(member for member in self.data.get(key, ()) if low[1:] <= member <= high[1:])
+        return members[start:start + num] if num is not None else members
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def incr(self, key):
+        self.data[key] = self.data.get(key, 0) + 1
+
+    def publish(self, channel, message):
+        return 0
+
+    def exists(self, key):
+        return int(key in self.data)
+
+    def set(self, key, value, **kwargs):
+        self.data[key] = value
+
+    def delete(self, key):
+        self.data.pop(key, None)
+
+    def rename(self, source, target):
+        self.data[target] = self.data.pop(source)
+
+    def register_script(self, script):
+        """The scripts of the index, run as Redis would run them: whole, with nothing in between."""
+        def write(keys, args):
+            for key in keys[:1] + (keys[2:] if self.exists(keys[1]) else []):
+                if args[0] == "ZADD":
+                    self.zadd(key, args[2::2])
+                else:
+                    self.zrem(key, *args[1:])
+
+        def swap(keys, args=()):
+            if self.exists(keys[0]):
+                self.rename(keys[0], keys[1])
+            else:
+                self.delete(keys[1])
+            self.delete(keys[2])
+            self.set(keys[3], 1)
+
+        return {WRITE_SCRIPT: write, SWAP_SCRIPT: swap}[script]
+
+    def pipeline(self, transaction=True):
+        redis_client, calls = self, []
+
+        class Pipeline:
+            def __getattr__(self, name):
+                return lambda *args, **kwargs: calls.append((name, args, kwargs))
+
+            def execute(self):
+                return [getattr(redis_client, name)(*args, **kwargs) for name, args, kwargs in calls]
+
+        return Pipeline()
+
+
+NAMES = [("Ivan", "Ivanov"), ("Iryna", "Koval"), ("Petro", "Ivanenko"), ("Олена", "Іванів"), ("Ivo", "Ivanov")]
+
+
+@pytest.fixture()
+def db(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'autocomplete.db'}")
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(bind=engine)()
+    for index, (firstname, lastname) in enumerate(NAMES):
+        session.add(Client(firstname=firstname, lastname=lastname, email=f"client{index}@example.com",
+                           phone_number=f"+38050111220{index}", birthday=date(1990, 1, 1)))
+    session.commit()
+    yield session
+    session.close()
+    engine.dispose()
+
+
+@pytest.fixture()
+def fake_redis():
+    r = FakeRedis()
+    redis_breaker.reset()
+    with patch.object(auth_service, "r", r):
+        yield r
+    redis_breaker.reset()
+
+
+def names(matches):
+    return [f"{match['firstname']} {match['lastname']}" for match in matches]
+
+
+def test_entries_cover_both_name_orders():
+    assert sorted(entries(7, "Ivan", "Ivanov")) == ["ivan ivanov\x007\x00Ivan\x00Ivanov",
+                                                   "ivanov ivan\x007\x00Ivan\x00Ivanov"]
+
+
+def test_lookup_from_sorted_set(db, fake_redis):
+    index = AutocompleteIndex()
+    assert index.rebuild(db, batch=2) == len(NAMES)
+    assert names(index.lookup("iv", 10, db)) == ["Ivan Ivanov", "Petro Ivanenko", "Ivo Ivanov"]
+    assert names(index.lookup("IVANOV i", 10, db)) == ["Ivan Ivanov", "Ivo Ivanov"]
+    assert names(index.lookup("  ivan   iv", 10, db)) == ["Ivan Ivanov"]
+    assert names(index.lookup("ів", 10, db)) == ["Олена Іванів"]
+    assert len(index.lookup("i", 2, db)) == 2
+    assert index.lookup(" ", 10, db) == []
+
+
+def test_database_fallback_matches_sorted_set(db, fake_redis):
+    index = AutocompleteIndex()
+    assert names(index.lookup("iv", 10, db)) == ["Ivan Ivanov", "Ivo Ivanov", "Petro Ivanenko"]
+    assert names(index.lookup("ivanov i", 10, db)) == ["Ivan Ivanov", "Ivo Ivanov"]
+    assert index.lookup("i%", 10, db) == []
+    assert KEY not in fake_redis.data
+
+
+def test_database_fallback_without_redis(db):
+    r = MagicMock()
+    r.pipeline.side_effect = redis.ConnectionError("Connection refused")
+    with patch.object(auth_service, "r", r):
+        assert names(AutocompleteIndex().lookup("pet", 10, db)) == ["Petro Ivanenko"]
+    redis_breaker.reset()
+
+
+def test_writes_maintain_index(db, fake_redis):
+    index = AutocompleteIndex()
+    index.rebuild(db)
+    body = ClientModel(firstname="Ivanna", lastname="Shevchenko", email="ivanna@example.com",
+                       phone_number="+380501112299", birthday="1990-08-19", additional_data="")
+    client = asyncio.run(create_client(body, db))
+    assert "Ivanna Shevchenko" in names(index.lookup("ivanna", 10, db))
+    body.firstname = "Oksana"
+    asyncio.run(update_client(body, client.id, db))
+    assert index.lookup("ivanna", 10, db) == []
+    assert names(index.lookup("shev", 10, db)) == ["Oksana Shevchenko"]
+    asyncio.run(remove_client(client.id, db))
+    assert index.lookup("shev", 10, db) == []
+
+
+def test_writes_during_rebuild_are_kept(db, fake_redis):
+    index = AutocompleteIndex()
+    zadd, batches = fake_redis.zadd, []
+
+    def zadd_while_clients_change(key, mapping):
+        zadd(key, mapping)
+        batches.append(key)
+        if batches == [BUILDING_KEY]:
+            index.add(99, "Taras", "Shevchenko")
+            index.remove(2, "Iryna", "Koval")
+
+    fake_redis.zadd = zadd_while_clients_change
+    assert index.rebuild(db, batch=2) == len(NAMES)
+    assert names(index.lookup("taras", 10, db)) == ["Taras Shevchenko"]
+    assert index.lookup("iryna", 10, db) == []
+    assert BUILDING_KEY not in fake_redis.data
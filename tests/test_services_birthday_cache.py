@@ -0,0 +1,121 @@
+import asyncio
+from datetime import date
+from unittest.mock import MagicMock, patch
+
+import pytest
+import redis
+
+from src.database.models import Client
+from src.services.auth import auth_service
+from src.services.birthday_cache import BirthdayCache
+from src.services.resilience import redis_breaker
+
+TODAY = date(2023, 6, 5)
+
+
+class FakeRedis:
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value, ex=None, nx=False):
+        if nx and key in self.data:
+            return None
+        self.data[key] = value
+        return True
+
+    def incr(self, key):
+        self.data[key] = str(int(self.data.get(key, 0)) + 1).encode()
+        return int(self.data[key])
+
+
+class Window:
+    def __init__(self):
+        self.calls = []
+
+    async def __call__(self, today, days=7):
+        self.calls.append((today, days))
+        return [Client(id=len(self.calls), firstname="Ivan", birthday=today)]
+
+
+@pytest.fixture()
+def fake_redis():
+    r = FakeRedis()
+    redis_breaker.reset()
+    with patch.object(auth_service, "r", r):
+        yield r
+    redis_breaker.reset()
+
+
+@pytest.fixture()
+def down_redis():
+    r = MagicMock()
+    for method in (r.get, r.set, r.incr):
+        method.side_effect = redis.ConnectionError("Connection refused")
+    with patch.object(auth_service, "r", r):
+        yield r
+    redis_breaker.reset()
+
+
+def test_window_is_computed_once(fake_redis):
+    cache, window = BirthdayCache(), Window()
+    first = asyncio.run(cache.get(7, window, TODAY))
+    second = asyncio.run(cache.get(7, window, TODAY))
+    assert len(window.calls) == 1
+    assert [client.id for client in second] == [client.id for client in first]
+    assert second[0] is not first[0]
+    assert "birthdays:0:2023-06-05:7" in fake_redis.data
+
+
+def test_other_worker_reads_shared_cache(fake_redis):
+    window = Window()
+    asyncio.run(BirthdayCache().get(7, window, TODAY))
+    asyncio.run(BirthdayCache().get(7, window, TODAY))
+    asyncio.run(BirthdayCache().get(30, window, TODAY))
+    asyncio.run(BirthdayCache().get(7, window, date(2023, 6, 6)))
+    assert len(window.calls) == 3
+
+
+def test_bump_invalidates_every_worker(fake_redis):
+    window, worker, other = Window(), BirthdayCache(), BirthdayCache()
+    asyncio.run(worker.get(7, window, TODAY))
+    asyncio.run(other.get(7, window, TODAY))
+    worker.bump()
+    asyncio.run(other.get(7, window, TODAY))
+    assert len(window.calls) == 2
+    assert fake_redis.data[BirthdayCache.GENERATION_KEY] == b"1"
+
+
+def test_local_fallback_without_redis(down_redis):
+    cache, window = BirthdayCache(), Window()
+    asyncio.run(cache.get(7, window, TODAY))
+    asyncio.run(cache.get(7, window, TODAY))
+    assert len(window.calls) == 1
+    cache.bump()
+    asyncio.run(cache.get(7, window, TODAY))
+    assert len(window.calls) == 2
+    assert cache.missed_bump
+
+
+def test_missed_bump_is_applied_when_redis_returns(fake_redis):
+    cache = BirthdayCache()
+    cache.missed_bump = True
+    assert cache.generation() == "1"
+    assert not cache.missed_bump
+
+
+def test_precompute_runs_on_one_worker(fake_redis, monkeypatch):
+    monkeypatch.setattr("src.conf.config.settings.birthday_cache_windows", [7, 30])
+    window = Window()
+
+    async def compute(days, today):
+        return await window(today, days)
+
+    assert asyncio.run(BirthdayCache().precompute(compute, TODAY)) == 2
+    assert asyncio.run(BirthdayCache().precompute(compute, TODAY)) == 0
+    assert window.calls == [(TODAY, 7), (TODAY, 30)]
+    other = Window()
+    asyncio.run(BirthdayCache().get(30, other, TODAY))
+    assert other.calls == []
@@ -0,0 +1,99 @@
+import asyncio
+import json
+from unittest.mock import MagicMock, patch
+
+import redis
+
+from src.services import events
+from src.services.auth import auth_service
+from src.services.events import EventHub, Subscriber, CHANNEL, RESYNC, KEEPALIVE
+from src.services.resilience import redis_breaker
+
+
+def frame(op, client_id):
+    return f"event: client\ndata: {json.dumps({'op': op, 'id': client_id}, separators=(',', ':'))}\n\n"
+
+
+def drain(subscriber):
+    frames = []
+    while not subscriber.queue.empty():
+        frames.append(subscriber.queue.get_nowait())
+    return frames
+
+
+def test_publish_compact_event():
+    with patch.object(auth_service, "r") as r:
+        events.publish("updated", 5)
+    r.publish.assert_called_once_with(CHANNEL, '{"op":"updated","id":5}')
+
+
+def test_publish_without_redis():
+    r = MagicMock()
+    r.publish.side_effect = redis.ConnectionError("Connection refused")
+    with patch.object(auth_service, "r", r):
+        events.publish("created", 1)
+    redis_breaker.reset()
+
+
+def test_overflow_drops_to_resync():
+    subscriber = Subscriber(size=2)
+    assert subscriber.deliver(frame("created", 1))
+    assert subscriber.deliver(frame("created", 2))
+    assert not subscriber.deliver(frame("created", 3))
+    assert subscriber.deliver(frame("deleted", 1))
+    assert drain(subscriber) == [RESYNC, frame("deleted", 1)]
+
+
+def test_keep_alive_only_when_idle():
+    subscriber = Subscriber(size=2)
+    subscriber.ping()
+    subscriber.ping()
+    subscriber.deliver(frame("created", 1))
+    subscriber.ping()
+    assert drain(subscriber) == [KEEPALIVE, frame("created", 1)]
+
+
+def test_hub_fans_out_and_stops_with_last_subscriber():
+    async def scenario():
+        hub = EventHub(queue_size=1)
+        listening = asyncio.Event()
+
+        async def listen():
+            listening.set()
+            await asyncio.sleep(3600)
+
+        with patch.object(hub, "listen", listen):
+            slow, fast = hub.subscribe(), hub.subscribe()
+            tasks = hub.tasks
+            await listening.wait()
+            hub.broadcast(frame("created", 1))
+            first = drain(fast)
+            hub.broadcast(frame("created", 2))
+            hub.unsubscribe(slow)
+            hub.unsubscribe(fast)
+            await asyncio.sleep(0)
+        return first, drain(slow), drain(fast), tasks, hub
+
+    first, slow, fast, tasks, hub = asyncio.run(scenario())
+    assert first == [frame("created", 1)]
+    assert slow == [RESYNC]
+    assert fast == [frame("created", 2)]
+    assert all(task.cancelled() for task in tasks)
+    assert hub.tasks == [] and hub.subscribers == set()
+
+
+def test_stream_yields_frames_and_unsubscribes():
+    async def scenario():
+        hub = EventHub(queue_size=10)
+        with patch.object(hub, "listen", lambda: asyncio.sleep(3600)):
+            stream = hub.stream()
+            frames = [await stream.__anext__()]
+            hub.broadcast(frame("deleted", 7))
+            frames.append(await stream.__anext__())
+            await stream.aclose()
+        return frames, hub
+
+    frames, hub = asyncio.run(scenario())
+    assert frames[0].startswith("retry: ")
+    assert frames[1] == frame("deleted", 7)
+    assert hub.subscribers == set() and hub.tasks == []
@@ -0,0 +1,146 @@
+import time
+import socket
+import asyncio
+from unittest.mock import patch
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.pool import QueuePool
+
+from main import app
+from src.conf.config import settings
+from src.services import health, warmup
+from src.services.health import Degraded, Readiness, check_tcp, ping_database, pool_stats, run_check
+
+
+class Probe:
+    def __init__(self, delay: float = 0.0, error: Exception = None):
+        self.delay = delay
+        self.error = error
+        self.calls = 0
+
+    async def __call__(self):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        if self.error is not None:
+            raise self.error
+
+
+@pytest.fixture()
+def engine(tmp_path):
+    bind = create_engine(f"sqlite:///{tmp_path / 'health.db'}", poolclass=QueuePool, pool_size=1, max_overflow=0,
+                         pool_timeout=5, connect_args={"check_same_thread": False})
+    yield bind
+    bind.dispose()
+
+
+@pytest.fixture(autouse=True)
+def timeouts(monkeypatch):
+    monkeypatch.setattr(settings, "readiness_timeout_ms", 100)
+    monkeypatch.setattr(settings, "readiness_cache_seconds", 60)
+
+
+def test_checks_run_concurrently_with_timeouts(tmp_path, monkeypatch):
+    monkeypatch.setattr(health.replica_router, "primary", create_engine(f"sqlite:///{tmp_path / 'health.db'}",
+                                                                        pool_logging_name="primary"))
+    checks = {"database": (Probe(0.05), None), "redis": (Probe(1), None), "smtp": (Probe(0.05), None)}
+    start = time.perf_counter()
+    report = asyncio.run(Readiness(checks).get())
+    assert time.perf_counter() - start < 0.5
+    assert report["status"] == "degraded"
+    assert report["checks"]["redis"] == {"ok": False, "error": "timeout", "latency_ms": pytest.approx(100, abs=50)}
+    assert report["checks"]["database"]["ok"]
+    assert report["checks"]["database"]["latency_ms"] >= 50
+    assert "primary" in report["pools"]
+
+
+def test_critical_dependency_makes_worker_not_ready():
+    checks = {"database": (Probe(error=ConnectionError("refused")), None), "redis": (Probe(), None)}
+    report = asyncio.run(Readiness(checks).get())
+    assert report["status"] == "not_ready"
+    assert report["checks"]["database"]["error"] == "refused"
+
+
+def test_probe_storm_runs_checks_once():
+    probe = Probe(0.05)
+    readiness = Readiness({"database": (probe, None)})
+
+    async def storm():
+        reports = await asyncio.gather(*(readiness.get() for _ in range(50)))
+        return reports + [await readiness.get()]
+
+    reports = asyncio.run(storm())
+    assert probe.calls == 1
+    assert {report["status"] for report in reports} == {"ready"}
+
+
+def test_stale_result_is_checked_again(monkeypatch):
+    probe = Probe()
+    readiness = Readiness({"database": (probe, None)})
+    asyncio.run(readiness.get())
+    monkeypatch.setattr(settings, "readiness_cache_seconds", 0)
+    asyncio.run(readiness.get())
+    assert probe.calls == 2
+
+
+def test_run_check_reports_circuit_state():
+    from src.services.resilience import redis_breaker
+
+    result = asyncio.run(run_check("redis", Probe(), redis_breaker))
+    assert result["ok"] and result["circuit"] == "closed"
+
+
+def test_saturated_pool_is_degraded_without_waiting(engine):
+    ping_database(engine)
+    held = engine.connect()
+    try:
+        assert pool_stats(engine)["saturation"] == 1
+        start = time.perf_counter()
+        with pytest.raises(Degraded):
+            ping_database(engine)
+        assert time.perf_counter() - start < 0.1
+        report = asyncio.run(Readiness({"database": (lambda: asyncio.to_thread(ping_database, engine), None)}).get())
+        assert report["status"] == "degraded"
+        assert report["checks"]["database"]["ok"] and report["checks"]["database"]["degraded"] == "pool saturated"
+    finally:
+        held.close()
+    assert pool_stats(engine) == {"checked_out": 0, "idle": 1, "capacity": 1, "waiting": 0, "saturation": 0}
+
+
+def test_tcp_check():
+    server = socket.socket()
+    server.bind(("127.0.0.1", 0))
+    server.listen(1)
+    port = server.getsockname()[1]
+    asyncio.run(check_tcp("127.0.0.1", port))
+    server.close()
+    with pytest.raises(OSError):
+        asyncio.run(check_tcp("127.0.0.1", port))
+
+
+def test_endpoints():
+    client = TestClient(app)
+    assert client.get("/api/health/live").json() == {"status": "alive"}
+    with patch.object(health.readiness, "checks", {"database": (Probe(error=OSError("down")), None)}):
+        health.readiness.reset()
+        response = client.get("/api/health/ready")
+        assert response.status_code == 503
+        assert response.json()["checks"]["database"]["ok"] is False
+        assert client.get("/api/healthchecker").status_code == 503
+    with patch.object(health.readiness, "checks", {"database": (Probe(), None), "redis": (Probe(1), None)}):
+        health.readiness.reset()
+        response = client.get("/api/health/ready")
+        assert response.status_code == 200
+        assert response.json()["status"] == "degraded"
+        assert client.get("/api/healthchecker").json() == {"message": "Welcome to FastAPI!"}
+    health.readiness.reset()
+
+
+def test_not_ready_while_warming_up():
+    warmup.state.start()
+    try:
+        assert asyncio.run(Readiness({"database": (Probe(), None)}).get()) == {"status": "not_ready",
+                                                                                 "warm_up": "running"}
+    finally:
+        warmup.state.finish()
@@ -0,0 +1,115 @@
+import time
+import unittest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from fastapi_limiter import FastAPILimiter
+
+from src.database.models import User, Role
+from src.services.limiter import HybridRateLimiter, CostRateLimiter, BatchCostRateLimiter
+
+
+class TestHybridRateLimiter(unittest.IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        HybridRateLimiter.reset()
+        self.redis = AsyncMock()
+        patcher = patch.object(FastAPILimiter, "redis", self.redis)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def test_lease_admits_locally(self):
+        self.redis.evalsha.return_value = [5, 10000, 15]
+        limiter = HybridRateLimiter(times=20, seconds=10, lease=5)
+        results = [await limiter.acquire("key") for _ in range(5)]
+        self.assertEqual(results, [0] * 5)
+        self.assertEqual(self.redis.evalsha.await_count, 1)
+
+    async def test_lease_when_bucket_is_empty(self):
+        self.redis.evalsha.return_value = [2, 10000, 18]
+        limiter = HybridRateLimiter(times=20, seconds=10, lease=2)
+        for _ in range(3):
+            await limiter.acquire("key")
+        self.assertEqual(self.redis.evalsha.await_count, 2)
+
+    async def test_rejection_is_cached(self):
+        self.redis.evalsha.return_value = [0, 4000, 0]
+        limiter = HybridRateLimiter(times=3, seconds=10)
+        self.assertEqual(await limiter.acquire("key"), 4000)
+        self.assertGreater(await limiter.acquire("key"), 0)
+        self.assertEqual(self.redis.evalsha.await_count, 1)
+
+    async def test_lease_is_bounded_by_times(self):
+        limiter = HybridRateLimiter(times=3, seconds=10, lease=10)
+        self.assertEqual(limiter.lease, 3)
+
+    async def test_expired_tokens_are_dropped(self):
+        self.redis.evalsha.return_value = [5, 10000, 15]
+        limiter = HybridRateLimiter(times=20, milliseconds=1, lease=5)
+        await limiter.acquire("key")
+        HybridRateLimiter.buckets["key"].expires_at = 0
+        await limiter.acquire("key")
+        self.assertEqual(self.redis.evalsha.await_count, 2)
+
+    async def test_bucket_expires_with_the_redis_window(self):
+        self.redis.evalsha.return_value = [5, 300, 0]
+        limiter = HybridRateLimiter(times=20, seconds=10, lease=5)
+        await limiter.acquire("key")
+        bucket = HybridRateLimiter.buckets["key"]
+        self.assertLessEqual(bucket.expires_at, time.monotonic() + 0.3)
+
+    async def test_small_limits_are_not_leased(self):
+        self.assertEqual(HybridRateLimiter(times=10, seconds=1).lease, 1)
+        self.assertEqual(HybridRateLimiter(times=200, seconds=1).lease, 50)
+
+    async def test_short_window_takes_nothing(self):
+        self.redis.evalsha.return_value = [0, 4000, 3]
+        limiter = HybridRateLimiter(times=20, seconds=10)
+        self.assertEqual(await limiter.acquire("key", cost=5), 4000)
+        self.assertEqual(self.redis.evalsha.await_args.args[-1], "5")
+        self.assertEqual(HybridRateLimiter.buckets["key"].tokens, 0)
+        self.redis.evalsha.return_value = [1, 4000, 2]
+        self.assertEqual(await limiter.acquire("key", cost=1), 0)
+
+
+class TestCostRateLimiter(unittest.IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        HybridRateLimiter.reset()
+        self.redis = AsyncMock()
+        self.redis.evalsha.return_value = [10, 60000, 50]
+        self.callback = AsyncMock()
+        for name, value in (("redis", self.redis), ("http_callback", self.callback), ("prefix", "test")):
+            patcher = patch.object(FastAPILimiter, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    async def test_key_by_user_and_role(self):
+        limiter = CostRateLimiter(cost=1)
+        await limiter(MagicMock(), MagicMock(), User(id=7, role=Role.moderator))
+        key = self.redis.evalsha.await_args.args[2]
+        self.assertIn(":user:7:moderator:", key)
+
+    async def test_budget_by_role(self):
+        limiter = CostRateLimiter(cost=1)
+        await limiter(MagicMock(), MagicMock(), User(id=7, role=Role.user))
+        times = self.redis.evalsha.await_args.args[3]
+        self.assertEqual(times, str(CostRateLimiter.budget("user")))
+
+    async def test_expensive_route_drains_budget(self):
+        self.redis.evalsha.side_effect = [[10, 60000, 50], [0, 5000, 0]]
+        cheap, expensive = CostRateLimiter(cost=1), CostRateLimiter(cost=5)
+        user = User(id=7, role=Role.user)
+        await expensive(MagicMock(), MagicMock(), user)
+        await expensive(MagicMock(), MagicMock(), user)
+        self.callback.assert_not_awaited()
+        await cheap(MagicMock(), MagicMock(), user)
+        self.assertEqual(self.callback.await_count, 1)
+
+    async def test_batch_is_charged_by_size(self):
+        limiter = BatchCostRateLimiter(cost=1, per_unit=10)
+        request = MagicMock()
+        request.query_params.getlist.return_value = list(range(25))
+        with patch.object(limiter, "acquire", AsyncMock(return_value=0)) as acquire:
+            await limiter(request, MagicMock(), User(id=7, role=Role.user))
+        self.assertEqual(acquire.await_args.args[1], 4)
+        request.query_params.getlist.assert_called_with("ids")
+        request.query_params.getlist.return_value = []
+        self.assertEqual(limiter.request_cost(request), 1)
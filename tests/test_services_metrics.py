@@ -0,0 +1,51 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from src.services import metrics
+
+
+def test_counter_render():
+    counter = metrics.Counter("test_events", "Test events", ("kind",))
+    counter.labels("a").inc()
+    counter.labels("a").inc(2)
+    assert 'test_events_total{kind="a"} 3.0' in metrics.render()
+
+
+def test_histogram_render():
+    histogram = metrics.Histogram("test_latency_seconds", "Test latency", buckets=(0.1, 1.0))
+    histogram.labels().observe(0.05)
+    histogram.labels().observe(0.5)
+    histogram.labels().observe(5)
+    text = metrics.render()
+    assert 'test_latency_seconds_bucket{le="0.1"} 1' in text
+    assert 'test_latency_seconds_bucket{le="1.0"} 2' in text
+    assert 'test_latency_seconds_bucket{le="+Inf"} 3' in text
+    assert "test_latency_seconds_count 3" in text
+
+
+def test_middleware_labels_route_template():
+    app = FastAPI()
+    app.add_middleware(metrics.MetricsMiddleware)
+
+    @app.get("/items/{item_id}")
+    async def read_item(item_id: int):
+        return {"id": item_id}
+
+    client = TestClient(app)
+    assert client.get("/items/1").status_code == 200
+    assert client.get("/items/x").status_code == 422
+    series = metrics.HTTP_REQUEST_DURATION.children
+    assert ("GET", "/items/{item_id}", "200") in series
+    assert ("GET", "/items/{item_id}", "422") in series
+
+
+def test_metrics_endpoint(client):
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert "# TYPE http_request_duration_seconds histogram" in response.text
+
+
+def test_metric_base_is_abstract():
+    with pytest.raises(TypeError):
+        metrics._Metric("abstract_metric", "Cannot be created")
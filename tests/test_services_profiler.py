@@ -0,0 +1,66 @@
+import json
+import time
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from src.conf.config import settings
+from src.database.models import User
+from src.services.auth import auth_service
+from src.services.profiler import SamplingProfiler, ProfilingMiddleware
+
+
+def busy_wait(seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+@pytest.fixture()
+def admin_token(client, user, session, monkeypatch):
+    monkeypatch.setattr("src.routes.auth.send_email", MagicMock())
+    client.post("/api/auth/signup", json=user)
+    current_user: User = session.query(User).filter(User.email == user.get('email')).first()
+    current_user.confirmed = True
+    current_user.role = "admin"
+    session.commit()
+    response = client.post("/api/auth/login", data={"username": user.get('email'), "password": user.get('password')})
+    return response.json()["access_token"]
+
+
+def test_sampling_profiler_captures_stack():
+    profiler = SamplingProfiler(0.001)
+    profiler.start()
+    busy_wait(0.05)
+    profiler.stop()
+    assert "busy_wait" in profiler.collapsed()
+    data = profiler.speedscope("test")
+    assert data["profiles"][0]["type"] == "sampled"
+    assert any(frame["name"] == "busy_wait" for frame in data["shared"]["frames"])
+
+
+def test_profile_flag_requires_bearer_token():
+    scope = {"headers": [(b"x-profile", b"speedscope")], "query_string": b""}
+    assert ProfilingMiddleware._requested(scope) == (None, None)
+    scope["headers"].append((b"authorization", b"Bearer abc"))
+    assert ProfilingMiddleware._requested(scope) == ("speedscope", "abc")
+
+
+def test_profiled_request_stores_profile(client, admin_token, tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "profile_dir", str(tmp_path))
+    with patch.object(auth_service, "r") as redis_mock:
+        redis_mock.get.return_value = None
+        response = client.get("/api/users/me/", headers={"Authorization": f"Bearer {admin_token}",
+                                                         "X-Profile": "speedscope"})
+    assert response.status_code == 200, response.text
+    profile = tmp_path / response.headers["X-Profile-File"]
+    assert json.loads(profile.read_text())["$schema"].startswith("https://www.speedscope.app")
+
+
+def test_request_without_flag_is_not_profiled(client, admin_token, tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "profile_dir", str(tmp_path))
+    with patch.object(auth_service, "r") as redis_mock:
+        redis_mock.get.return_value = None
+        response = client.get("/api/users/me/", headers={"Authorization": f"Bearer {admin_token}"})
+    assert "X-Profile-File" not in response.headers
+    assert list(tmp_path.iterdir()) == []
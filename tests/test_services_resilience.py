@@ -0,0 +1,201 @@
+import time
+import socket
+import asyncio
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+import redis
+import redis.asyncio as aioredis
+import cloudinary.exceptions
+from fastapi_limiter import FastAPILimiter
+from fastapi_mail import ConnectionConfig
+
+import main
+from src.conf.config import settings
+from src.services import email
+from src.services.auth import auth_service
+from src.services.limiter import HybridRateLimiter
+from src.services.resilience import (CircuitBreaker, CircuitOpenError, DependencyUnavailable, OPEN, HALF_OPEN, CLOSED,
+                                     redis_breaker, smtp_breaker, cloudinary_breaker)
+from src.services.upload_avatar import UploadService
+from src.scripts.birthday_greetings import SMTPStandIn
+
+
+@pytest.fixture()
+def closed_port():
+    """A local port nothing listens on: connections are refused, like a Redis that is down."""
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+@pytest.fixture()
+def black_hole():
+    """A local server that accepts connections and never answers, like a hung Redis or SMTP server."""
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    sock.listen(16)
+    yield sock.getsockname()[1]
+    sock.close()
+
+
+@pytest.fixture(autouse=True)
+def breakers():
+    for breaker in (redis_breaker, smtp_breaker, cloudinary_breaker):
+        breaker.reset()
+    HybridRateLimiter.reset()
+    yield
+    for breaker in (redis_breaker, smtp_breaker, cloudinary_breaker):
+        breaker.reset()
+
+
+def test_breaker_opens_and_recovers():
+    breaker = CircuitBreaker("test", failure_threshold=2, reset_timeout=0.05, exceptions=(OSError,))
+    failing = MagicMock(side_effect=OSError)
+    for _ in range(2):
+        with pytest.raises(OSError):
+            breaker.call(failing)
+    assert breaker.state == OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.call(failing)
+    assert failing.call_count == 2
+    time.sleep(0.06)
+    breaker.allow()
+    assert breaker.state == HALF_OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CLOSED
+
+
+def test_other_errors_do_not_open_breaker():
+    breaker = CircuitBreaker("test", failure_threshold=1, exceptions=(OSError,))
+    with pytest.raises(ValueError):
+        breaker.call(MagicMock(side_effect=ValueError))
+    assert breaker.state == CLOSED
+
+
+def test_cancelled_half_open_trial_is_released():
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=0.05, exceptions=(OSError,))
+    with pytest.raises(OSError):
+        breaker.call(MagicMock(side_effect=OSError))
+    time.sleep(0.06)
+
+    async def scenario():
+        trial = asyncio.create_task(breaker.call_async(asyncio.sleep, 10))
+        await asyncio.sleep(0.01)
+        assert breaker.state == HALF_OPEN
+        trial.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await trial
+        return await breaker.call_async(AsyncMock(return_value="ok"))
+
+    assert asyncio.run(scenario()) == "ok"
+    assert breaker.state == CLOSED
+
+
+def stand_in_redis(port: int) -> redis.Redis:
+    timeout = settings.redis_timeout_ms / 1000
+    return redis.Redis(host="127.0.0.1", port=port, socket_timeout=timeout, socket_connect_timeout=timeout)
+
+
+@pytest.mark.parametrize("server", ["closed_port", "black_hole"])
+def test_user_lookup_falls_back_to_db(server, request):
+    port = request.getfixturevalue(server)
+    token = asyncio.run(auth_service.create_access_token({"sub": "deadpool@example.com"}))
+    user = MagicMock(email="deadpool@example.com")
+    with patch.object(auth_service, "r", stand_in_redis(port)), \
+            patch("src.services.auth.repository_users.get_user_by_email", AsyncMock(return_value=user)) as lookup:
+        start = time.perf_counter()
+        assert asyncio.run(auth_service.get_current_user(token, MagicMock())) is user
+        assert time.perf_counter() - start < 1
+        for _ in range(settings.breaker_failure_threshold):
+            asyncio.run(auth_service.get_current_user(token, MagicMock()))
+    assert redis_breaker.state == OPEN
+    assert lookup.await_count == settings.breaker_failure_threshold + 1
+
+
+def test_rate_limiter_falls_back_to_local_window(black_hole):
+    timeout = settings.redis_timeout_ms / 1000
+    client = aioredis.Redis(host="127.0.0.1", port=black_hole, socket_timeout=timeout, socket_connect_timeout=timeout)
+    limiter = HybridRateLimiter(times=2, seconds=10, lease=1)
+
+    async def scenario():
+        with patch.object(FastAPILimiter, "redis", client):
+            return [await limiter.acquire("key") for _ in range(3)]
+
+    first, second, third = asyncio.run(scenario())
+    assert (first, second) == (0, 0)
+    assert third > 0
+    assert HybridRateLimiter.local_windows["key"][0] == 2
+
+
+def test_startup_survives_redis_outage(closed_port, monkeypatch):
+    monkeypatch.setattr(settings, "redis_port", closed_port)
+    async def run_lifespan():
+        async with main.lifespan(main.app):
+            pass
+
+    with patch.object(FastAPILimiter, "redis", None), patch.object(main, "create_engines", lambda: (MagicMock(), [])):
+        asyncio.run(run_lifespan())
+
+
+def test_email_fails_fast_on_hung_smtp(black_hole, monkeypatch):
+    conf = ConnectionConfig(MAIL_USERNAME="test", MAIL_PASSWORD="test", MAIL_FROM="test@example.com",
+                            MAIL_PORT=black_hole, MAIL_SERVER="127.0.0.1", MAIL_STARTTLS=False, MAIL_SSL_TLS=False,
+                            USE_CREDENTIALS=False, VALIDATE_CERTS=False, TEMPLATE_FOLDER=email.TEMPLATE_FOLDER)
+    monkeypatch.setattr(email, "mail_config", lambda: conf)
+    monkeypatch.setattr(settings, "smtp_timeout_seconds", 0.2)
+    asyncio.run(email.close_mail_client())
+    start = time.perf_counter()
+    try:
+        asyncio.run(email.send_email("user@example.com", "user", "http://test/"))
+    finally:
+        asyncio.run(email.close_mail_client())
+    assert time.perf_counter() - start < 2
+    assert smtp_breaker.failures == 1
+
+
+def test_emails_reuse_one_smtp_connection(monkeypatch):
+    async def scenario():
+        async with SMTPStandIn() as stand_in:
+            monkeypatch.setattr(email, "mail_config", stand_in.config)
+            try:
+                await email.send_email("first@example.com", "first", "http://test/")
+                await email.send_email_with_password("second@example.com", "second", "secret", "http://test/")
+                reused = stand_in.connections
+                # the server dropped the idle connection: the next send reconnects once
+                email.mail_client.connection.session.close()
+                await email.send_email("third@example.com", "third", "http://test/")
+            finally:
+                await email.close_mail_client()
+        return reused, stand_in
+
+    reused, stand_in = asyncio.run(scenario())
+    smtp_breaker.reset()
+    assert reused == 1
+    assert stand_in.connections == 2
+    assert [recipients for _, recipients, _ in stand_in.messages] == \
+           [["first@example.com"], ["second@example.com"], ["third@example.com"]]
+    assert b"secret" in stand_in.messages[1][2]
+
+
+def test_avatar_upload_fails_fast_when_cloudinary_is_down():
+    upload = MagicMock(side_effect=cloudinary.exceptions.Error("Socket error: ConnectionRefusedError()"))
+    with patch("cloudinary.uploader.upload", upload):
+        for _ in range(settings.breaker_failure_threshold):
+            with pytest.raises(DependencyUnavailable):
+                UploadService.upload(b"image", "hw_13/avatar")
+        with pytest.raises(CircuitOpenError):
+            UploadService.upload(b"image", "hw_13/avatar")
+    assert upload.call_count == settings.breaker_failure_threshold
+
+
+def test_avatar_client_errors_pass_through():
+    upload = MagicMock(side_effect=cloudinary.exceptions.BadRequest("Invalid image file"))
+    with patch("cloudinary.uploader.upload", upload):
+        with pytest.raises(cloudinary.exceptions.BadRequest):
+            UploadService.upload(b"image", "hw_13/avatar")
+    assert cloudinary_breaker.state == CLOSED
@@ -0,0 +1,166 @@
+import time
+import asyncio
+import threading
+
+import pytest
+from fastapi import FastAPI
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+
+from src.conf.config import settings
+from src.database.db import SessionLocal, guarded, instrument_engine, get_db
+from src.repository import clients as repository_clients
+from src.services.metrics import DB_STATEMENT_TIMEOUTS
+from src.services.timeouts import (StatementGuard, StatementTimeoutError, StatementTimeoutMiddleware, current_guard,
+                                   route_timeout)
+
+SLOW_QUERY = text("WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM c WHERE x < 100000000) "
+                  "SELECT count(*) FROM c")
+
+
+@pytest.fixture()
+def engine(tmp_path):
+    bind = instrument_engine(create_engine(f"sqlite:///{tmp_path / 'timeouts.db'}",
+                                           connect_args={"check_same_thread": False}))
+    yield bind
+    bind.dispose()
+
+
+@pytest.fixture()
+def guard():
+    guard = StatementGuard(timeout=0.05)
+    token = current_guard.set(guard)
+    yield guard
+    current_guard.reset(token)
+
+
+def test_route_timeout(monkeypatch):
+    monkeypatch.setattr(settings, "statement_timeouts_ms", {"/api/clients/search/": 1500})
+    monkeypatch.setattr(settings, "statement_timeout_ms", 4000)
+    assert route_timeout("/api/clients/search/") == 1.5
+    assert route_timeout("/api/clients/") == 4
+
+
+def test_sqlite_statement_timeout(engine, guard):
+    session = guarded(SessionLocal(bind=engine))
+    start = time.perf_counter()
+    with pytest.raises(OperationalError) as error:
+        session.execute(SLOW_QUERY)
+    assert time.perf_counter() - start < 2
+    assert guard.interrupted(error.value) == "timeout"
+    session.rollback()
+    assert session.execute(text("SELECT 1")).scalar() == 1
+    session.close()
+
+
+def test_cancel_interrupts_running_statement(engine):
+    guard = StatementGuard(timeout=60)
+    session = SessionLocal(bind=engine)
+    session.info["statement_guard"] = guard
+    threading.Timer(0.05, guard.cancel).start()
+    with pytest.raises(OperationalError) as error:
+        session.execute(SLOW_QUERY)
+    assert guard.interrupted(error.value) == "disconnect"
+    session.close()
+
+
+def test_cancel_without_running_statement_is_ignored(engine):
+    guard = StatementGuard(timeout=60)
+    guard.cancel()
+    assert guard.reason is None
+
+
+def test_get_db_raises_statement_timeout(engine, guard):
+    bound = SessionLocal.kw.get("bind")
+    SessionLocal.configure(bind=engine)
+    try:
+        sessions = get_db()
+        session = next(sessions)
+        with pytest.raises(OperationalError) as error:
+            session.execute(SLOW_QUERY)
+        with pytest.raises(StatementTimeoutError):
+            sessions.throw(error.value)
+    finally:
+        SessionLocal.configure(bind=bound)
+    assert DB_STATEMENT_TIMEOUTS.labels("-", "timeout").value >= 1
+
+
+def test_disconnect_cancels_statement_of_sync_endpoint(engine):
+    app = FastAPI()
+    app.add_middleware(StatementTimeoutMiddleware)
+    result = {}
+
+    @app.get("/slow")
+    def slow():
+        session = guarded(SessionLocal(bind=engine))
+        try:
+            session.execute(SLOW_QUERY)
+        except OperationalError as error:
+            result["reason"] = session.info["statement_guard"].interrupted(error)
+        finally:
+            session.close()
+        return {}
+
+    async def scenario():
+        messages = [{"type": "http.request", "body": b"", "more_body": False}]
+
+        async def receive():
+            if messages:
+                return messages.pop()
+            await asyncio.sleep(0.1)
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            pass
+
+        scope = {"type": "http", "method": "GET", "path": "/slow", "headers": [], "query_string": b"",
+                 "root_path": "", "scheme": "http", "server": ("test", 80), "http_version": "1.1"}
+        await asyncio.wait_for(app(scope, receive, send), 10)
+
+    asyncio.run(scenario())
+    assert result["reason"] == "disconnect"
+
+
+def test_disconnect_cancels_statement_of_repository_call(engine):
+    with engine.begin() as connection:
+        # a clients table too large to search before the client goes away
+        connection.exec_driver_sql(
+            "CREATE VIEW clients AS WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM c "
+            "WHERE x < 100000000) SELECT x AS id, 'Ivan' AS firstname, 'Ivanov' AS lastname, "
+            "'ivan' || x || '@example.com' AS email, x AS phone_number, NULL AS birthday, "
+            "NULL AS additional_data, NULL AS created_at, NULL AS updated_at FROM c")
+    app = FastAPI()
+    app.add_middleware(StatementTimeoutMiddleware)
+    result = {}
+
+    @app.get("/api/clients/search/")
+    async def search():
+        session = guarded(SessionLocal(bind=engine))
+        try:
+            await repository_clients.search_clients("nobody", session)
+        except OperationalError as error:
+            result["reason"] = session.info["statement_guard"].interrupted(error)
+        finally:
+            session.close()
+        return {}
+
+    async def scenario():
+        messages = [{"type": "http.request", "body": b"", "more_body": False}]
+
+        async def receive():
+            if messages:
+                return messages.pop()
+            await asyncio.sleep(0.1)
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            pass
+
+        scope = {"type": "http", "method": "GET", "path": "/api/clients/search/", "headers": [], "query_string": b"",
+                 "root_path": "", "scheme": "http", "server": ("test", 80), "http_version": "1.1"}
+        await asyncio.wait_for(app(scope, receive, send), 10)
+
+    start = time.perf_counter()
+    asyncio.run(scenario())
+    assert result["reason"] == "disconnect"
+    assert time.perf_counter() - start < 1
@@ -0,0 +1,107 @@
+import asyncio
+import pickle
+from unittest.mock import MagicMock, patch
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool
+
+import main
+from src.conf.config import settings
+from src.database.models import Base, User
+from src.services import warmup
+from src.services.auth import auth_service
+
+
+@pytest.fixture()
+def engine(tmp_path):
+    bind = create_engine(f"sqlite:///{tmp_path / 'warmup.db'}", poolclass=QueuePool, pool_size=3,
+                         connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=bind)
+    session = sessionmaker(bind=bind)()
+    for number in range(4):
+        session.add(User(username=f"user{number}", email=f"user{number}@example.com", password="secret",
+                         refresh_token="token" if number != 3 else None))
+    session.commit()
+    session.close()
+    yield bind
+    bind.dispose()
+
+
+@pytest.fixture()
+def cache():
+    r = MagicMock()
+    r.zrevrange.return_value = []
+    with patch.object(auth_service, "r", r):
+        yield r
+    warmup.state.finish()
+
+
+def test_open_connections_fills_pool(engine):
+    assert warmup.open_connections(engine, 5) == 3
+    assert engine.pool.checkedin() == 3
+
+
+def test_warm_up_reports_every_step(engine, cache, monkeypatch):
+    monkeypatch.setattr(warmup.replica_router, "primary", engine)
+    monkeypatch.setattr(warmup, "SessionLocal", sessionmaker(bind=engine))
+    monkeypatch.setattr(settings, "warmup_users", 2)
+    warmup.state.start()
+    asyncio.run(warmup.warm_up())
+    assert warmup.state.ready
+    report = warmup.state.report
+    assert report["connections"]["result"] == 3
+    assert report["passwords"]["result"] is True
+    assert report["tokens"]["result"] is True
+    assert report["users"]["result"] == 2
+    cached = [pickle.loads(call.args[1]).email for call in cache.set.call_args_list]
+    assert cached == ["user2@example.com", "user1@example.com"]
+
+
+def test_warm_up_loads_recent_logins_in_order(engine, cache, monkeypatch):
+    monkeypatch.setattr(warmup, "SessionLocal", sessionmaker(bind=engine))
+    cache.zrevrange.return_value = [b"user3@example.com", b"missing@example.com", b"user0@example.com"]
+    assert asyncio.run(warmup.load_active_users(10)) == 2
+    assert [call.args[0] for call in cache.set.call_args_list] == ["user:user3@example.com", "user:user0@example.com"]
+
+
+def test_failing_step_still_makes_worker_ready(cache, monkeypatch):
+    monkeypatch.setattr(warmup.replica_router, "primary", MagicMock())
+    monkeypatch.setattr(warmup, "open_connections", MagicMock(side_effect=OSError("connection refused")))
+    monkeypatch.setattr(warmup, "load_active_users", MagicMock(side_effect=OSError("connection refused")))
+    warmup.state.start()
+    asyncio.run(warmup.warm_up())
+    assert warmup.state.ready
+    assert warmup.state.report["connections"]["result"] is None
+    assert warmup.state.report["tokens"]["result"] is True
+
+
+def test_health_check_waits_for_warm_up(cache, monkeypatch):
+    monkeypatch.setattr(settings, "warmup_enabled", True)
+    released = asyncio.Event()
+
+    async def slow_warm_up():
+        await released.wait()
+        warmup.state.finish()
+
+    async def scenario():
+        async with main.lifespan(main.app):
+            assert not warmup.state.ready
+            assert TestClient(main.app).get("/api/healthchecker").status_code == 503
+            released.set()
+            await asyncio.sleep(0)
+            await asyncio.sleep(0)
+            assert warmup.state.ready
+
+    with patch.object(warmup, "warm_up", slow_warm_up), patch.object(main, "create_engines", lambda: (MagicMock(), [])):
+        asyncio.run(scenario())
+
+
+def test_remember_login_never_raises():
+    r = MagicMock()
+    r.zadd.side_effect = AttributeError("zadd")
+    with patch.object(auth_service, "r", r):
+        auth_service.remember_login("user0@example.com")
+    r.zadd.assert_called_once()
@@ -2,11 +2,11 @@ import unittest
 from unittest.mock import MagicMock
 
 1
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 
 from sqlalchemy.orm import Session
 
-from src.database.models import Client, User
+from src.database.models import Client, User, ClientTombstone
 from src.repository.clients import (
     get_clients,
     get_client,
@@ -16,6 +16,8 @@ from src.repository.clients import (
     update_client,
     remove_client,
     get_birthday,
+    get_changes,
+    purge_tombstones,
     search_clients
 
 )
@@ -33,6 +35,13 @@ class TestClients(unittest.IsolatedAsyncioTestCase):
         result = await get_clients(10, 0, self.session)
         self.assertEqual(result, clients)
 
+    async def test_get_clients_with_fields(self):
+        rows = [MagicMock()]
+        self.session.query(Client.id, Client.email).limit().offset().all.return_value = rows
+        result = await get_clients(10, 0, self.session, ("id", "email"))
+        self.assertEqual(result, rows)
+        self.session.query.assert_called_with(Client.id, Client.email)
+
     async def test_get_client(self):
         client = Client()
         self.session.query(Client).filter_by().first.return_value = client
@@ -142,10 +151,51 @@ class TestClients(unittest.IsolatedAsyncioTestCase):
             Client(id=3, birthday="2000-06-15"),
         ]
         self.session.query().all.return_value = clients
-        result = await get_birthday(7, self.session)
+        result = await get_birthday(7, self.session, today=date(2023, 6, 5))
         self.assertEqual(len(result), 2)
         self.assertIn(clients[0], result)
 
+    async def test_get_birthday_across_new_year(self):
+        clients = [
+            Client(id=1, birthday=date(1990, 12, 30)),
+            Client(id=2, birthday=date(1990, 1, 3)),
+            Client(id=3, birthday=date(1990, 12, 27)),
+        ]
+        self.session.query().all.return_value = clients
+        result = await get_birthday(7, self.session, today=date(2023, 12, 28))
+        self.assertEqual(result, clients[:2])
+
+    async def test_get_birthday_on_february_29(self):
+        clients = [Client(id=1, birthday=date(2000, 2, 29))]
+        self.session.query().all.return_value = clients
+        self.assertEqual(await get_birthday(3, self.session, today=date(2023, 2, 27)), clients)
+        self.assertEqual(await get_birthday(3, self.session, today=date(2024, 2, 27)), clients)
+        self.assertEqual(await get_birthday(3, self.session, today=date(2023, 3, 1)), [])
+
+    async def test_get_changes(self):
+        now = datetime(2023, 6, 5, 12, 0, 0)
+        self.session.scalar.return_value = now
+        updated = [Client(id=2, updated_at=now - timedelta(minutes=3)),
+                   Client(id=1, updated_at=now - timedelta(minutes=1))]
+        deleted = [ClientTombstone(client_id=3, deleted_at=now - timedelta(minutes=2))]
+        self.session.query().filter().filter().order_by().limit().all.side_effect = [updated, deleted]
+        changes, has_more = await get_changes((now - timedelta(hours=1), 5), 2, self.session)
+        self.assertEqual([(client_id, client) for _, client_id, client in changes], [(2, updated[0]), (3, None)])
+        self.assertTrue(has_more)
+
+    async def test_get_changes_rejects_cursor_older_than_retention(self):
+        now = datetime(2023, 6, 5, 12, 0, 0)
+        self.session.scalar.return_value = now
+        self.assertIsNone(await get_changes((now - timedelta(days=31), 5), 2, self.session))
+        self.session.query.assert_not_called()
+
+    async def test_purge_tombstones(self):
+        self.session.scalar.return_value = datetime(2023, 6, 5, 12, 0, 0)
+        self.session.query().filter().delete.return_value = 3
+        self.assertEqual(await purge_tombstones(self.session), 3)
+        self.session.query().filter().delete.assert_called_once_with(synchronize_session=False)
+        self.session.commit.assert_called_once()
+
     async def test_search_clients(self):
         clients = [
             Client(id=1, firstname="Pavlo"),